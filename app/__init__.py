@@ -2,12 +2,29 @@ from datetime import date
 
 from flask import Flask
 
-from .extensions import db, login_manager, csrf
-from .models import User, Band, Album, Event
+from .extensions import db, login_manager, csrf, tasks, cache
+from .archive import init_archive
+from .availability import init_availability
+from .catalog import init_catalog_events
+from .comments import ingestor
+from .compression import init_compression
+from .facets import init_facets
+from .lookups import init_lookups
+from .migrations import upgrade
+from .overload import init_overload
+from .playlists import init_playlists
+from .pubsub import pubsub
+from .search_index import init_search_index
+from .sessions import init_sessions
+from .syndication import init_syndication
+from .snapshot import init_snapshot
+from .trending import init_trending
+from .models import User, Band, Album, Country, Event, Genre
 from .routes.public import public_bp
 from .routes.auth import auth_bp
 from .routes.user import user_bp
 from .routes.admin import admin_bp
+from .routes.api import api_bp
 from config import Config
 
 
@@ -23,6 +40,15 @@ def create_app(config_class=Config):
     db.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
+    init_sessions(app)
+    init_compression(app)
+    init_overload(app)
+    tasks.init_app(app)
+    cache.init_app(app)
+    ingestor.init_app(app)
+    init_playlists(app)
+    init_facets()
+    init_archive(app)
 
     login_manager.login_view = "auth.login"
     login_manager.login_message_category = "warning"
@@ -31,10 +57,22 @@ def create_app(config_class=Config):
     app.register_blueprint(auth_bp, url_prefix="/auth")
     app.register_blueprint(user_bp)
     app.register_blueprint(admin_bp, url_prefix="/admin")
+    app.register_blueprint(api_bp, url_prefix="/api")
 
     with app.app_context():
         db.create_all()
+        upgrade()
         seed_data(app)
+    init_trending(app)
+    init_availability(app)
+
+    pubsub.init_app(app)
+    init_catalog_events()
+    init_lookups()
+    init_syndication()
+    with app.app_context():
+        init_search_index()
+        init_snapshot(app)
 
     return app
 
@@ -51,66 +89,84 @@ def seed_data(app):
     admin.set_password(app.config["ADMIN_PASSWORD"])
     db.session.add(admin)
 
+    countries = {name: Country(name=name) for name in ("United Kingdom", "United States")}
+    genres = {
+        name: Genre(name=name)
+        for name in (
+            "Classic Rock",
+            "Grunge",
+            "Alternative Rock",
+            "Hard Rock",
+            "Pop Punk",
+            "Indie Rock",
+            "Nu Metal",
+            "Soft Rock",
+            "Pop Rock",
+        )
+    }
+    db.session.add_all([*countries.values(), *genres.values()])
+    db.session.flush()
+
     bands = [
         Band(
             name="The Rolling Stones",
-            country="United Kingdom",
+            country_id=countries["United Kingdom"].id,
             formed_year=1962,
             description="Iconic rock innovators known for blues-infused swagger and legendary tours.",
             image_url="https://images.unsplash.com/photo-1459749411175-04bf5292ceea",
         ),
         Band(
             name="Nirvana",
-            country="United States",
+            country_id=countries["United States"].id,
             formed_year=1987,
             description="Grunge pioneers who redefined rock with raw emotion and explosive energy.",
             image_url="https://images.unsplash.com/photo-1485579149621-3123dd979885",
         ),
         Band(
             name="Queen",
-            country="United Kingdom",
+            country_id=countries["United Kingdom"].id,
             formed_year=1970,
             description="Theatrical rock legends blending operatic ambition with stadium anthems.",
             image_url="https://images.unsplash.com/photo-1507878866276-a947ef722fee",
         ),
         Band(
             name="Foo Fighters",
-            country="United States",
+            country_id=countries["United States"].id,
             formed_year=1994,
             description="Arena-ready rock with melodic hooks and massive drum-driven energy.",
             image_url="https://images.unsplash.com/photo-1500530855697-b586d89ba3ee",
         ),
         Band(
             name="Led Zeppelin",
-            country="United Kingdom",
+            country_id=countries["United Kingdom"].id,
             formed_year=1968,
             description="Hard rock pioneers blending blues, folk, and mythic storytelling.",
             image_url="https://images.unsplash.com/photo-1511379938547-c1f69419868d",
         ),
         Band(
             name="Paramore",
-            country="United States",
+            country_id=countries["United States"].id,
             formed_year=2004,
             description="Pop-punk to alt-rock shapeshifters with soaring vocals and bold lyrics.",
             image_url="https://images.unsplash.com/photo-1487180144351-b8472da7d491",
         ),
         Band(
             name="Arctic Monkeys",
-            country="United Kingdom",
+            country_id=countries["United Kingdom"].id,
             formed_year=2002,
             description="Indie rock storytellers with sharp riffs and moody crooning.",
             image_url="https://images.unsplash.com/photo-1470229722913-7c0e2dbbafd3",
         ),
         Band(
             name="Linkin Park",
-            country="United States",
+            country_id=countries["United States"].id,
             formed_year=1996,
             description="Genre-blending rock titans merging hip-hop, metal, and emotional catharsis.",
             image_url="https://images.unsplash.com/photo-1506157786151-b8491531f063",
         ),
         Band(
             name="Fleetwood Mac",
-            country="United Kingdom",
+            country_id=countries["United Kingdom"].id,
             formed_year=1967,
             description="Classic rock storytellers known for harmonies and legendary studio drama.",
             image_url="https://images.unsplash.com/photo-1506157786151-b8491531f063",
@@ -124,7 +180,7 @@ def seed_data(app):
             band_id=bands[0].id,
             title="Let It Bleed",
             release_year=1969,
-            genre="Classic Rock",
+            genre_id=genres["Classic Rock"].id,
             cover_url="https://images.unsplash.com/photo-1493225457124-a3eb161ffa5f",
             description="A landmark album filled with swaggering riffs and bluesy grit.",
         ),
@@ -132,7 +188,7 @@ def seed_data(app):
             band_id=bands[0].id,
             title="Sticky Fingers",
             release_year=1971,
-            genre="Classic Rock",
+            genre_id=genres["Classic Rock"].id,
             cover_url="https://images.unsplash.com/photo-1485579149621-3123dd979885",
             description="Soulful grooves and anthemic rock that defined the Stones' peak.",
         ),
@@ -140,7 +196,7 @@ def seed_data(app):
             band_id=bands[1].id,
             title="Nevermind",
             release_year=1991,
-            genre="Grunge",
+            genre_id=genres["Grunge"].id,
             cover_url="https://images.unsplash.com/photo-1459749411175-04bf5292ceea",
             description="The record that brought grunge to the mainstream with raw power.",
         ),
@@ -148,7 +204,7 @@ def seed_data(app):
             band_id=bands[1].id,
             title="In Utero",
             release_year=1993,
-            genre="Grunge",
+            genre_id=genres["Grunge"].id,
             cover_url="https://images.unsplash.com/photo-1470229722913-7c0e2dbbafd3",
             description="A darker, more abrasive follow-up filled with emotional intensity.",
         ),
@@ -156,7 +212,7 @@ def seed_data(app):
             band_id=bands[2].id,
             title="A Night at the Opera",
             release_year=1975,
-            genre="Classic Rock",
+            genre_id=genres["Classic Rock"].id,
             cover_url="https://images.unsplash.com/photo-1511379938547-c1f69419868d",
             description="Operatic ambition and intricate songwriting defined by 'Bohemian Rhapsody'.",
         ),
@@ -164,7 +220,7 @@ def seed_data(app):
             band_id=bands[2].id,
             title="News of the World",
             release_year=1977,
-            genre="Classic Rock",
+            genre_id=genres["Classic Rock"].id,
             cover_url="https://images.unsplash.com/photo-1487180144351-b8472da7d491",
             description="Stadium anthems and heavier riffs fuel Queen's global domination.",
         ),
@@ -172,7 +228,7 @@ def seed_data(app):
             band_id=bands[3].id,
             title="The Colour and the Shape",
             release_year=1997,
-            genre="Alternative Rock",
+            genre_id=genres["Alternative Rock"].id,
             cover_url="https://images.unsplash.com/photo-1500530855697-b586d89ba3ee",
             description="Melodic grit and powerful hooks that propelled Foo Fighters forward.",
         ),
@@ -180,7 +236,7 @@ def seed_data(app):
             band_id=bands[3].id,
             title="Wasting Light",
             release_year=2011,
-            genre="Alternative Rock",
+            genre_id=genres["Alternative Rock"].id,
             cover_url="https://images.unsplash.com/photo-1507878866276-a947ef722fee",
             description="A raw, analog-recorded blast of arena-ready rock.",
         ),
@@ -188,7 +244,7 @@ def seed_data(app):
             band_id=bands[4].id,
             title="Led Zeppelin IV",
             release_year=1971,
-            genre="Hard Rock",
+            genre_id=genres["Hard Rock"].id,
             cover_url="https://images.unsplash.com/photo-1506157786151-b8491531f063",
             description="Epic compositions and the immortal 'Stairway to Heaven'.",
         ),
@@ -196,7 +252,7 @@ def seed_data(app):
             band_id=bands[4].id,
             title="Physical Graffiti",
             release_year=1975,
-            genre="Hard Rock",
+            genre_id=genres["Hard Rock"].id,
             cover_url="https://images.unsplash.com/photo-1493225457124-a3eb161ffa5f",
             description="A sprawling double album showcasing Zeppelin's stylistic range.",
         ),
@@ -204,7 +260,7 @@ def seed_data(app):
             band_id=bands[5].id,
             title="Riot!",
             release_year=2007,
-            genre="Pop Punk",
+            genre_id=genres["Pop Punk"].id,
             cover_url="https://images.unsplash.com/photo-1485579149621-3123dd979885",
             description="Explosive hooks and youthful energy made Paramore a global force.",
         ),
@@ -212,7 +268,7 @@ def seed_data(app):
             band_id=bands[5].id,
             title="After Laughter",
             release_year=2017,
-            genre="Alternative Rock",
+            genre_id=genres["Alternative Rock"].id,
             cover_url="https://images.unsplash.com/photo-1511379938547-c1f69419868d",
             description="Bright synth textures contrast with introspective lyricism.",
         ),
@@ -220,7 +276,7 @@ def seed_data(app):
             band_id=bands[6].id,
             title="AM",
             release_year=2013,
-            genre="Indie Rock",
+            genre_id=genres["Indie Rock"].id,
             cover_url="https://images.unsplash.com/photo-1470229722913-7c0e2dbbafd3",
             description="Dark grooves and confident swagger define Arctic Monkeys' evolution.",
         ),
@@ -228,7 +284,7 @@ def seed_data(app):
             band_id=bands[6].id,
             title="Whatever People Say I Am, That's What I'm Not",
             release_year=2006,
-            genre="Indie Rock",
+            genre_id=genres["Indie Rock"].id,
             cover_url="https://images.unsplash.com/photo-1500530855697-b586d89ba3ee",
             description="A sharp, witty debut packed with storytelling and kinetic riffs.",
         ),
@@ -236,7 +292,7 @@ def seed_data(app):
             band_id=bands[7].id,
             title="Hybrid Theory",
             release_year=2000,
-            genre="Nu Metal",
+            genre_id=genres["Nu Metal"].id,
             cover_url="https://images.unsplash.com/photo-1507878866276-a947ef722fee",
             description="An era-defining blend of rap, rock, and emotional catharsis.",
         ),
@@ -244,7 +300,7 @@ def seed_data(app):
             band_id=bands[7].id,
             title="Meteora",
             release_year=2003,
-            genre="Nu Metal",
+            genre_id=genres["Nu Metal"].id,
             cover_url="https://images.unsplash.com/photo-1487180144351-b8472da7d491",
             description="Polished intensity and melodic hooks that cemented their legacy.",
         ),
@@ -252,7 +308,7 @@ def seed_data(app):
             band_id=bands[8].id,
             title="Rumours",
             release_year=1977,
-            genre="Soft Rock",
+            genre_id=genres["Soft Rock"].id,
             cover_url="https://images.unsplash.com/photo-1493225457124-a3eb161ffa5f",
             description="Timeless harmonies and emotional storytelling in rock history's classics.",
         ),
@@ -260,7 +316,7 @@ def seed_data(app):
             band_id=bands[8].id,
             title="Tango in the Night",
             release_year=1987,
-            genre="Pop Rock",
+            genre_id=genres["Pop Rock"].id,
             cover_url="https://images.unsplash.com/photo-1459749411175-04bf5292ceea",
             description="Glossy production and melodic pop-rock hooks.",
         ),
@@ -275,6 +331,8 @@ def seed_data(app):
             event_date=date(2025, 3, 22),
             description="A multi-band tribute celebrating the legends of classic rock.",
             link_url="https://example.com/rock-revival",
+            latitude=40.7128,
+            longitude=-74.006,
         ),
         Event(
             title="Festival of Sound",
@@ -283,6 +341,8 @@ def seed_data(app):
             event_date=date(2025, 5, 14),
             description="An outdoor festival featuring modern rock and indie headliners.",
             link_url="https://example.com/festival-sound",
+            latitude=34.0522,
+            longitude=-118.2437,
         ),
         Event(
             title="Arena Rock Legends",
@@ -291,6 +351,8 @@ def seed_data(app):
             event_date=date(2025, 6, 18),
             description="Celebrate the era of guitar heroes and massive choruses.",
             link_url="https://example.com/arena-rock",
+            latitude=41.8781,
+            longitude=-87.6298,
         ),
         Event(
             title="Grunge & Grit",
@@ -299,6 +361,8 @@ def seed_data(app):
             event_date=date(2025, 4, 2),
             description="A night dedicated to the raw energy of 90s Seattle bands.",
             link_url="https://example.com/grunge-grit",
+            latitude=47.6062,
+            longitude=-122.3321,
         ),
         Event(
             title="Vinyl Listening Lounge",
@@ -307,6 +371,8 @@ def seed_data(app):
             event_date=date(2025, 2, 15),
             description="Community listening party featuring deep cuts and rare pressings.",
             link_url="https://example.com/vinyl-night",
+            latitude=30.2672,
+            longitude=-97.7431,
         ),
         Event(
             title="Women in Rock Showcase",
@@ -315,6 +381,8 @@ def seed_data(app):
             event_date=date(2025, 7, 9),
             description="Spotlighting trailblazing rock performers across generations.",
             link_url="https://example.com/women-in-rock",
+            latitude=39.7392,
+            longitude=-104.9903,
         ),
         Event(
             title="Indie Rock Discovery",
@@ -323,6 +391,8 @@ def seed_data(app):
             event_date=date(2025, 8, 12),
             description="Emerging indie acts, album debuts, and collaborative sets.",
             link_url="https://example.com/indie-discovery",
+            latitude=38.9072,
+            longitude=-77.0369,
         ),
         Event(
             title="Stadium Singalong",
@@ -331,6 +401,8 @@ def seed_data(app):
             event_date=date(2025, 9, 5),
             description="A massive singalong celebrating iconic rock anthems.",
             link_url="https://example.com/stadium-singalong",
+            latitude=51.5074,
+            longitude=-0.1278,
         ),
     ]
     db.session.add_all(events)
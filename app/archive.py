@@ -0,0 +1,200 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, delete, exists, insert, or_, select
+
+from . import profiles
+from .extensions import db, tasks
+from .models import Album, Band, Comment, CommentArchive, Event, User
+
+
+TARGETS = {"band": Band, "album": Album, "event": Event}
+
+
+def init_archive(app):
+    tasks.every(app.config["COMMENT_ARCHIVE_INTERVAL"], archive_comments)
+    app.cli.add_command(archive_command)
+
+
+def archive_comments(batch_size=None, max_batches=None):
+    config = current_app.config
+    batch_size = batch_size or config["COMMENT_ARCHIVE_BATCH_SIZE"]
+    max_batches = max_batches or config["COMMENT_ARCHIVE_MAX_BATCHES"]
+    horizon = datetime.utcnow() - timedelta(days=config["COMMENT_RETENTION_DAYS"])
+    report = {"comments": 0, "batches": 0, "raw_bytes": 0, "stored_bytes": 0, "reasons": {}}
+    for reason, condition in (
+        ("hidden", Comment.is_hidden.is_(True)),
+        ("orphaned", _orphaned()),
+        ("expired", Comment.created_at < horizon),
+    ):
+        # Each batch is its own transaction, so a long backlog never holds a
+        # write lock for long and an interrupted run keeps what it finished.
+        while report["batches"] < max_batches:
+            archived = _archive_batch(reason, condition, batch_size)
+            if archived is None:
+                break
+            report["batches"] += 1
+            report["comments"] += archived.comment_count
+            report["raw_bytes"] += archived.raw_bytes
+            report["stored_bytes"] += archived.stored_bytes
+            report["reasons"][reason] = report["reasons"].get(reason, 0) + archived.comment_count
+            if archived.comment_count < batch_size:
+                break
+    if report["comments"]:
+        current_app.logger.info(
+            "Archived %d comments in %d batches; %d bytes of comment data stored as %d",
+            report["comments"],
+            report["batches"],
+            report["raw_bytes"],
+            report["stored_bytes"],
+        )
+    return report
+
+
+def restore(archive):
+    records = load(archive)
+    users = set(
+        db.session.scalars(
+            select(User.id).where(User.id.in_({row["user_id"] for row in records}))
+        )
+    )
+    rows = [row for row in records if row["user_id"] in users]
+    skipped = [row for row in records if row["user_id"] not in users]
+    # Restored comments remember the reason they were archived for, so the
+    # job does not archive them again for that same reason.
+    if rows:
+        db.session.execute(
+            insert(Comment),
+            [
+                {
+                    "user_id": row["user_id"],
+                    "target_type": row["target_type"],
+                    "target_id": row["target_id"],
+                    "body": row["body"],
+                    "created_at": _parse_datetime(row["created_at"]),
+                    "is_hidden": row["is_hidden"],
+                    "restored_from": archive.reason,
+                }
+                for row in rows
+            ],
+            # An undated comment stays undated rather than taking the default.
+            execution_options={"render_nulls": True},
+        )
+    if skipped:
+        # Comments whose author has since been deleted cannot go back; they
+        # stay in the archive instead of being lost.
+        for name, value in _pack(skipped).items():
+            setattr(archive, name, value)
+    else:
+        db.session.delete(archive)
+    db.session.commit()
+    profiles.invalidate_summary(*users)
+    return len(rows), len(skipped)
+
+
+def load(archive):
+    return json.loads(zlib.decompress(archive.payload))
+
+
+def _orphaned():
+    return or_(
+        *(
+            and_(Comment.target_type == kind, ~exists().where(model.id == Comment.target_id))
+            for kind, model in TARGETS.items()
+        )
+    )
+
+
+def _archive_batch(reason, condition, batch_size):
+    ids = db.session.scalars(
+        select(Comment.id)
+        .where(condition)
+        .where(or_(Comment.restored_from.is_(None), Comment.restored_from != reason))
+        .order_by(Comment.id)
+        .limit(batch_size)
+    ).all()
+    if not ids:
+        return None
+    # Only rows this transaction actually deleted are archived, so workers
+    # that run the job at the same time never archive a comment twice.
+    deleted = db.session.execute(
+        delete(Comment)
+        .where(Comment.id.in_(ids))
+        .returning(
+            Comment.id,
+            Comment.user_id,
+            Comment.target_type,
+            Comment.target_id,
+            Comment.body,
+            Comment.created_at,
+            Comment.is_hidden,
+        ),
+        execution_options={"synchronize_session": False},
+    ).all()
+    if not deleted:
+        db.session.rollback()
+        return None
+    usernames = dict(
+        db.session.execute(
+            select(User.id, User.username).where(User.id.in_({row.user_id for row in deleted}))
+        ).all()
+    )
+    records = [
+        {
+            "id": row.id,
+            "user_id": row.user_id,
+            "username": usernames.get(row.user_id),
+            "target_type": row.target_type,
+            "target_id": row.target_id,
+            "body": row.body,
+            "created_at": row.created_at.isoformat() if row.created_at else None,
+            "is_hidden": bool(row.is_hidden),
+        }
+        for row in sorted(deleted, key=lambda row: row.id)
+    ]
+    archived = CommentArchive(reason=reason, **_pack(records))
+    db.session.add(archived)
+    db.session.commit()
+    profiles.invalidate_summary(*usernames)
+    return archived
+
+
+def _pack(records):
+    raw = json.dumps(records, separators=(",", ":")).encode()
+    payload = zlib.compress(raw, 9)
+    # created_at is nullable, and older rows were backfilled without one.
+    created = [_parse_datetime(row["created_at"]) for row in records if row["created_at"]]
+    return {
+        "comment_count": len(records),
+        "first_created_at": min(created, default=None),
+        "last_created_at": max(created, default=None),
+        "raw_bytes": len(raw),
+        "stored_bytes": len(payload),
+        "payload": payload,
+    }
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+@click.command(
+    "archive-comments", help="Move hidden, orphaned and expired comments into the archive."
+)
+@click.option("--batch-size", type=int, help="Comments per archive batch.")
+@click.option("--max-batches", type=int, help="Stop after this many batches.")
+@with_appcontext
+def archive_command(batch_size, max_batches):
+    report = archive_comments(batch_size, max_batches)
+    reasons = ", ".join(f"{reason}: {n}" for reason, n in report["reasons"].items())
+    click.echo(
+        f"Archived {report['comments']} comments in {report['batches']} batches"
+        f" ({reasons or 'nothing to do'})."
+    )
+    click.echo(
+        f"{report['raw_bytes']} bytes of comment data stored as {report['stored_bytes']} bytes."
+    )
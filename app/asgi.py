@@ -0,0 +1,404 @@
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from importlib.util import find_spec
+
+from flask import current_app, render_template, request
+from flask_login.config import COOKIE_NAME as REMEMBER_COOKIE_NAME
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import joinedload, selectinload
+from werkzeug.exceptions import HTTPException
+
+from . import event_queries, facets, snapshot, trending
+from .forms import AlbumSearchForm, BandSearchForm, EventSearchForm
+from .models import Album, Band, Comment, Country, Event, Genre
+from .pubsub import TooManySubscribers, pubsub
+from .routes.api import STREAM_CHANNELS, STREAM_HEADERS, event_message, stream_refused
+
+try:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+except ImportError:
+    async_sessionmaker = create_async_engine = None
+
+
+# Async drivers per database backend, and the packages they need.
+ASYNC_DRIVERS = {
+    "sqlite": ("sqlite+aiosqlite", "aiosqlite"),
+    "postgresql": ("postgresql+asyncpg", "asyncpg"),
+}
+
+
+class AsyncApp:
+    # Anonymous GETs of the public listing and detail pages are answered on
+    # the event loop with an async engine, so waiting on the database does
+    # not hold a thread, and so are the live update streams, which would
+    # otherwise pin a pool thread each. Everything else runs the Flask app on
+    # a thread pool.
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.url = _async_url(flask_app.config["SQLALCHEMY_DATABASE_URI"])
+        self.executor = ThreadPoolExecutor(
+            flask_app.config["ASGI_WSGI_THREADS"], thread_name_prefix="wsgi"
+        )
+        self.engine = None
+        self.sessions = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            if await self._stream(scope, receive, send):
+                return
+            if not await self._handle(scope, send):
+                await self._run_wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.engine is not None:
+                    await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _handle(self, scope, send):
+        if scope["method"] != "GET" or snapshot.current() is not None:
+            return False
+        environ = _environ(scope, b"")
+        with self.flask_app.request_context(environ):
+            view = ASYNC_VIEWS.get(request.endpoint)
+            config = current_app.config
+            cookies = (
+                config["SESSION_COOKIE_NAME"],
+                config.get("REMEMBER_COOKIE_NAME", REMEMBER_COOKIE_NAME),
+            )
+            # Signed-in visitors need the session and their user row, both
+            # loaded synchronously, so they take the thread pool path.
+            if view is None or any(name in request.cookies for name in cookies):
+                return False
+            response = self.flask_app.preprocess_request()
+            if response is None:
+                if self.engine is None:
+                    self.engine = create_async_engine(self.url)
+                    self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+                async with self.sessions() as session:
+                    page = await view(session, **request.view_args)
+                if page is None:
+                    return False
+                template, context = page
+                response = render_template(template, **context)
+            response = self.flask_app.finalize_request(response)
+            await _start_response(send, response.status_code, response.headers.to_wsgi_list())
+            await send({"type": "http.response.body", "body": response.get_data()})
+            return True
+
+    async def _stream(self, scope, receive, send):
+        if scope["method"] != "GET":
+            return False
+        with self.flask_app.request_context(_environ(scope, b"")):
+            channels = STREAM_CHANNELS.get(request.endpoint)
+            if channels is None:
+                return False
+            try:
+                channels = channels(**request.view_args)
+            except HTTPException:
+                return False
+            config = current_app.config
+            response = self.flask_app.preprocess_request()
+            if response is None:
+                try:
+                    subscription = pubsub.subscribe(
+                        channels, request.remote_addr, loop=asyncio.get_running_loop()
+                    )
+                except TooManySubscribers:
+                    response = stream_refused()
+            if response is not None:
+                response = self.flask_app.finalize_request(response)
+                await _start_response(send, response.status_code, response.headers.to_wsgi_list())
+                await send({"type": "http.response.body", "body": response.get_data()})
+                return True
+            heartbeat = config["SSE_HEARTBEAT_INTERVAL"]
+            deadline = time.monotonic() + config["SSE_MAX_DURATION"]
+        headers = [("Content-Type", "text/event-stream; charset=utf-8"), *STREAM_HEADERS.items()]
+        disconnected = asyncio.ensure_future(_disconnect(receive))
+        try:
+            await _start_response(send, 200, headers)
+            await _send_text(send, f"retry: {heartbeat * 1000}\n\n")
+            while not disconnected.done() and time.monotonic() < deadline:
+                message = asyncio.ensure_future(subscription.queue.get())
+                await asyncio.wait(
+                    {message, disconnected}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnected.done():
+                    message.cancel()
+                elif message.done():
+                    await _send_text(send, event_message(*message.result()))
+                else:
+                    message.cancel()
+                    await _send_text(send, ": heartbeat\n\n")
+            if not disconnected.done():
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            disconnected.cancel()
+            subscription.close()
+        return True
+
+    async def _run_wsgi(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            body.extend(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        loop = asyncio.get_running_loop()
+        environ = _environ(scope, bytes(body))
+
+        def call(coroutine):
+            return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+        def run():
+            # The whole response, streamed templates included, is produced on
+            # one pool thread so Flask's context stays put between chunks;
+            # each chunk is handed to the loop and sent before the next.
+            def start_response(status, headers, exc_info=None):
+                call(_start_response(send, int(status.split(" ", 1)[0]), headers))
+
+            iterable = self.flask_app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if chunk:
+                        call(send({"type": "http.response.body", "body": chunk, "more_body": True}))
+                call(send({"type": "http.response.body", "body": b""}))
+            finally:
+                close = getattr(iterable, "close", None)
+                if close is not None:
+                    close()
+
+        await loop.run_in_executor(self.executor, run)
+
+
+def create_asgi_app(flask_app=None):
+    if flask_app is None:
+        from . import create_app
+
+        flask_app = create_app()
+    return AsyncApp(flask_app)
+
+
+async def home(session):
+    trending_bands = (await session.scalars(trending.top_query(Band, 4))).all()
+    trending_albums = (
+        await session.scalars(trending.top_query(Album, 6).options(selectinload(Album.band)))
+    ).all()
+    featured_bands = trending_bands or (
+        await session.scalars(
+            select(Band).order_by(Band.created_at.desc(), Band.id.desc()).limit(4)
+        )
+    ).all()
+    featured_albums = trending_albums or (
+        await session.scalars(
+            select(Album)
+            .options(selectinload(Album.band))
+            .order_by(Album.release_year.desc(), Album.id.desc())
+            .limit(6)
+        )
+    ).all()
+    events = await session.scalars(
+        select(Event)
+        .where(Event.event_date >= date.today())
+        .order_by(Event.event_date.asc(), Event.id.asc())
+        .limit(3)
+    )
+    return "pages/home.html", {
+        "featured_bands": featured_bands,
+        "featured_albums": featured_albums,
+        "bands_trending": bool(trending_bands),
+        "albums_trending": bool(trending_albums),
+        "events": events.all(),
+    }
+
+
+async def bands(session):
+    form = BandSearchForm(request.args, meta={"csrf": False})
+    query = select(Band)
+    if form.validate():
+        if form.query.data:
+            query = query.filter(Band.name.ilike(f"%{form.query.data}%"))
+        query = facets.apply(query, country=form.country.data, formed=form.formed.data)
+    results = await session.scalars(query.order_by(Band.name.asc()))
+    return "pages/bands.html", {
+        "bands": results.all(),
+        "form": form,
+        "facet_counts": await _facet_counts(session, "country", "formed"),
+    }
+
+
+async def albums(session):
+    form = AlbumSearchForm(request.args, meta={"csrf": False})
+    query = select(Album)
+    if form.validate():
+        if form.query.data:
+            query = query.filter(Album.title.ilike(f"%{form.query.data}%"))
+        query = facets.apply(query, genre=form.genre.data, decade=form.decade.data)
+    results = await session.scalars(
+        query.options(selectinload(Album.band)).order_by(Album.release_year.desc())
+    )
+    return "pages/albums.html", {
+        "albums": results.all(),
+        "form": form,
+        "facet_counts": await _facet_counts(session, "genre", "decade"),
+    }
+
+
+async def events(session):
+    form = EventSearchForm(request.args, meta={"csrf": False})
+    if not form.validate() or form.near.data:
+        return None
+    page_size = current_app.config["EVENTS_PAGE_SIZE"]
+    query = event_queries.search(
+        city=form.city.data,
+        start=form.after_date.data,
+        end=form.before_date.data,
+        include_past=form.include_past.data,
+        cursor=event_queries.decode_cursor(request.args.get("cursor")),
+    )
+    events_list = (await session.scalars(query.limit(page_size + 1).statement)).all()
+    next_cursor = None
+    if len(events_list) > page_size:
+        events_list = events_list[:page_size]
+        next_cursor = event_queries.encode_cursor(events_list[-1])
+    return "pages/events.html", {"events": events_list, "form": form, "next_cursor": next_cursor}
+
+
+async def band_detail(session, band_id):
+    band = await session.get(Band, band_id, options=[selectinload(Band.albums)])
+    if band is None:
+        return None
+    return "pages/band_detail.html", {
+        "band": band,
+        "comments": await _comments_for(session, "band", band.id),
+        "form": None,
+        "is_favorite": False,
+    }
+
+
+async def album_detail(session, album_id):
+    album = await session.get(Album, album_id, options=[selectinload(Album.band)])
+    if album is None:
+        return None
+    return "pages/album_detail.html", {
+        "album": album,
+        "comments": await _comments_for(session, "album", album.id),
+        "form": None,
+        "playlist_form": None,
+        "is_favorite": False,
+    }
+
+
+async def event_detail(session, event_id):
+    event = await session.get(Event, event_id)
+    if event is None:
+        return None
+    return "pages/event_detail.html", {
+        "event": event,
+        "comments": await _comments_for(session, "event", event.id),
+        "form": None,
+    }
+
+
+ASYNC_VIEWS = {
+    "public.home": home,
+    "public.bands": bands,
+    "public.albums": albums,
+    "public.events": events,
+    "public.band_detail": band_detail,
+    "public.album_detail": album_detail,
+    "public.event_detail": event_detail,
+}
+
+
+async def _facet_counts(session, *names):
+    rows = (await session.execute(facets.count_query(*names))).all()
+    labels = {}
+    for model in (Country, Genre):
+        labels[model] = dict((await session.execute(select(model.id, model.name))).all())
+    return facets.label_counts(names, rows, labels.__getitem__)
+
+
+async def _comments_for(session, target_type, target_id):
+    comments = await session.scalars(
+        select(Comment)
+        .options(joinedload(Comment.user))
+        .filter_by(target_type=target_type, target_id=target_id, is_hidden=False)
+        .order_by(Comment.created_at.desc())
+    )
+    return comments.all()
+
+
+def _async_url(uri):
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"ASGI mode does not support {backend} databases")
+    driver, package = ASYNC_DRIVERS[backend]
+    missing = [name for name in (package, "greenlet") if find_spec(name) is None]
+    if create_async_engine is None or missing:
+        raise RuntimeError(f"ASGI mode needs: pip install {' '.join(missing or ['sqlalchemy'])}")
+    return url.set(drivername=driver)
+
+
+def _environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        key = name if name in ("CONTENT_TYPE", "CONTENT_LENGTH") else f"HTTP_{name}"
+        value = value.decode("latin-1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_text(send, text):
+    await send({"type": "http.response.body", "body": text.encode(), "more_body": True})
+
+
+async def _start_response(send, status, headers):
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ],
+        }
+    )
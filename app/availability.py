@@ -0,0 +1,109 @@
+import hashlib
+import math
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from .comments import TokenBucket
+from .extensions import db, tasks
+from .models import User
+from .pubsub import pubsub
+
+
+FIELDS = {"username": User.username, "email": User.email}
+
+_lock = threading.Lock()
+_filters = {}
+_buckets = {}
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+
+def init_availability(app):
+    with app.app_context():
+        rebuild()
+    pubsub.listen("users", _on_registered)
+    # Bloom filters cannot forget, so names freed by a rename keep going to
+    # the database until the next rebuild.
+    tasks.every(app.config["USER_FILTER_REBUILD_INTERVAL"], rebuild)
+
+
+def rebuild():
+    config = current_app.config
+    total = db.session.scalar(select(func.count(User.id)))
+    capacity = max(config["USER_FILTER_CAPACITY"], total * 2)
+    filters = {}
+    for field, column in FIELDS.items():
+        bloom = BloomFilter(capacity, config["USER_FILTER_ERROR_RATE"])
+        for value in db.session.scalars(
+            select(func.lower(column)).execution_options(yield_per=1000)
+        ):
+            bloom.add(value)
+        filters[field] = bloom
+    with _lock:
+        _filters.clear()
+        _filters.update(filters)
+
+
+def allow(client):
+    # Each client gets a small budget of lookups, so the endpoint cannot be
+    # used to walk a list of emails and find out who has an account.
+    capacity, per_minute = current_app.config["AVAILABILITY_RATE"]
+    now = time.monotonic()
+    with _lock:
+        if len(_buckets) >= current_app.config["AVAILABILITY_MAX_CLIENTS"]:
+            for client_key in [key for key, bucket in _buckets.items() if bucket.is_full(now)]:
+                del _buckets[client_key]
+        bucket = _buckets.get(client)
+        if bucket is None:
+            bucket = _buckets[client] = TokenBucket(capacity, per_minute / 60)
+        return bucket.take(now)
+
+
+def is_available(field, value):
+    # A miss in the filter means nobody has the name; a hit may be a false
+    # positive, so only then is the database asked.
+    value = value.strip().lower()
+    bloom = _filters.get(field)
+    if bloom is not None and value not in bloom:
+        return True
+    return not taken(field, value)
+
+
+def taken(field, value):
+    query = select(User.id).where(func.lower(FIELDS[field]) == value.lower())
+    return db.session.scalar(query) is not None
+
+
+def registered(**values):
+    pubsub.publish("users", **values)
+
+
+def _on_registered(message):
+    with _lock:
+        for field, value in message.items():
+            if field in _filters:
+                _filters[field].add(value.lower())
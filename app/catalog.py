@@ -0,0 +1,62 @@
+import time
+
+from sqlalchemy import event
+
+from .extensions import db
+from .models import Album, Band, Event
+from .pubsub import pubsub
+
+
+CATALOG_MODELS = {Band: "band", Album: "album", Event: "event"}
+
+_state = {"changed_at": 0.0}
+
+
+def init_catalog_events():
+    for name, listener in (
+        ("after_flush", _collect_changes),
+        ("after_commit", _publish_changes),
+        ("after_rollback", _discard_changes),
+    ):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
+    pubsub.listen("catalog", _on_catalog_change)
+
+
+def last_change():
+    return _state["changed_at"]
+
+
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault("catalog_changes", {})
+    for action, objects in (
+        ("created", session.new),
+        ("updated", session.dirty),
+        ("deleted", session.deleted),
+    ):
+        for obj in objects:
+            kind = CATALOG_MODELS.get(type(obj))
+            if kind is None or (action == "updated" and not session.is_modified(obj)):
+                continue
+            key = (kind, obj.id)
+            # A row created and then edited in the same transaction is
+            # still reported as created.
+            if changes.get(key) != "created" or action == "deleted":
+                changes[key] = action
+
+
+def _publish_changes(session):
+    changes = session.info.pop("catalog_changes", None)
+    # The commit time travels with the message so every worker reports the
+    # same last change to polling pages.
+    changed_at = time.time()
+    for (kind, entity_id), action in (changes or {}).items():
+        pubsub.publish("catalog", kind=kind, id=entity_id, action=action, at=changed_at)
+
+
+def _on_catalog_change(message):
+    _state["changed_at"] = max(_state["changed_at"], message.get("at", 0))
+
+
+def _discard_changes(session):
+    session.info.pop("catalog_changes", None)
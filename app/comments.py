@@ -0,0 +1,214 @@
+import atexit
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from . import profiles, trending
+from .extensions import db, tasks
+from .models import Comment
+from .pubsub import pubsub
+
+
+Author = namedtuple("Author", "id username")
+
+
+class CommentRejected(Exception):
+    pass
+
+
+class PendingComment:
+    def __init__(self, user, target_type, target_id, body):
+        self.user = user
+        self.user_id = user.id
+        self.target_type = target_type
+        self.target_id = target_id
+        self.body = body
+        self.created_at = datetime.utcnow()
+        self.is_hidden = False
+        self.attempts = 0
+
+    @property
+    def key(self):
+        return f"{self.user_id}:{self.created_at.isoformat()}"
+
+    def as_row(self):
+        return {
+            "user_id": self.user_id,
+            "target_type": self.target_type,
+            "target_id": self.target_id,
+            "body": self.body,
+            "created_at": self.created_at,
+            "is_hidden": False,
+        }
+
+
+class TokenBucket:
+    def __init__(self, capacity, per_second):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_second)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def is_full(self, now):
+        return self.tokens + (now - self.updated) * self.per_second >= self.capacity
+
+
+class CommentIngestor:
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._buckets = {}
+        self._recent = OrderedDict()
+        self._pending = []
+        self._inflight = []
+
+    def init_app(self, app):
+        # The ingestor outlives each app, so one exit hook flushes for the latest.
+        if self.app is None:
+            atexit.register(self._flush_on_exit)
+        self.app = app
+        app.extensions["comments"] = self
+        tasks.every(app.config["COMMENT_FLUSH_INTERVAL"], self.flush)
+
+    def submit(self, user, target_type, target_id, body):
+        config = self.app.config
+        now = time.monotonic()
+        digest = hashlib.blake2b(
+            f"{user.id}:{' '.join(body.lower().split())}".encode(), digest_size=16
+        ).digest()
+        comment = PendingComment(Author(user.id, user.username), target_type, target_id, body)
+        with self._lock:
+            while self._recent and next(iter(self._recent.values())) < now:
+                self._recent.popitem(last=False)
+            if digest in self._recent:
+                raise CommentRejected("You already posted that comment.")
+            user_bucket = self._bucket(("user", user.id), config["COMMENT_USER_RATE"])
+            target_bucket = self._bucket(
+                ("target", user.id, target_type, target_id), config["COMMENT_TARGET_RATE"]
+            )
+            if not (user_bucket.take(now) and target_bucket.take(now)):
+                raise CommentRejected("You're commenting too quickly. Please wait a moment.")
+            self._recent[digest] = now + config["COMMENT_DUPLICATE_WINDOW"]
+            self._pending.append(comment)
+        if not tasks.enabled:
+            self.flush()
+        return comment
+
+    def pending_for(self, user_id, target_type, target_id):
+        with self._lock:
+            return [
+                comment
+                for comment in self._inflight + self._pending
+                if comment.user_id == user_id
+                and comment.target_type == target_type
+                and comment.target_id == target_id
+            ]
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._inflight = batch
+                now = time.monotonic()
+                for key in [key for key, bucket in self._buckets.items() if bucket.is_full(now)]:
+                    del self._buckets[key]
+            if not batch:
+                return
+            try:
+                stored = list(zip(self._store(batch), batch))
+                retry = []
+            except Exception:
+                db.session.rollback()
+                stored, retry = self._store_each(batch)
+            with self._lock:
+                self._pending[:0] = retry
+                self._inflight = []
+            if not stored:
+                return
+            profiles.invalidate_summary(*{comment.user_id for _, comment in stored})
+            for comment_id, comment in stored:
+                pubsub.publish(
+                    f"comments:{comment.target_type}:{comment.target_id}",
+                    id=comment_id,
+                    key=comment.key,
+                    username=comment.user.username,
+                    body=comment.body,
+                    created_at=comment.created_at.strftime("%b %d, %Y"),
+                )
+
+    def _store(self, comments):
+        ids = db.session.scalars(
+            insert(Comment).returning(Comment.id, sort_by_parameter_order=True),
+            [comment.as_row() for comment in comments],
+        ).all()
+        trending.record(
+            *(
+                (comment.target_type, comment.target_id, "comment")
+                for comment in comments
+                if comment.target_type in ("band", "album")
+            )
+        )
+        db.session.commit()
+        return ids
+
+    def _store_each(self, batch):
+        # One bad row must not hold back every comment queued behind it, so
+        # a failed batch is retried row by row. Rows the database rejects
+        # are dropped; others are retried a bounded number of times.
+        stored, retry = [], []
+        limit = self.app.config["COMMENT_FLUSH_MAX_ATTEMPTS"]
+        for comment in batch:
+            try:
+                stored.extend(zip(self._store([comment]), [comment]))
+            except (DataError, IntegrityError):
+                db.session.rollback()
+                self.app.logger.exception(
+                    "Dropping comment %s rejected by the database", comment.key
+                )
+            except Exception:
+                db.session.rollback()
+                comment.attempts += 1
+                if comment.attempts >= limit:
+                    self.app.logger.exception(
+                        "Dropping comment %s after %d failed attempts", comment.key, limit
+                    )
+                else:
+                    retry.append(comment)
+        return stored, retry
+
+    def _bucket(self, key, rate):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            capacity, per_minute = rate
+            bucket = self._buckets[key] = TokenBucket(capacity, per_minute / 60)
+        return bucket
+
+    def _flush_on_exit(self):
+        if self._pending:
+            with self.app.app_context():
+                self.flush()
+
+
+def merge_pending(comments, pending):
+    # A flush can commit between reading the buffer and querying the table;
+    # drop buffered comments that already came back from the database.
+    stored = {(c.user_id, c.created_at, c.body) for c in comments}
+    fresh = [c for c in pending if (c.user_id, c.created_at, c.body) not in stored]
+    return sorted(fresh, key=lambda c: c.created_at, reverse=True) + list(comments)
+
+
+ingestor = CommentIngestor()
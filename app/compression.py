@@ -0,0 +1,92 @@
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = {
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/xml",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/rss+xml",
+    "application/atom+xml",
+}
+
+
+def init_compression(app):
+    app.after_request(compress_response)
+
+
+def negotiate_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"] and accepted["br"] >= accepted["gzip"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_response(response):
+    if (
+        response.direct_passthrough
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config["COMPRESS_MIN_SIZE"]:
+            return response
+        process, _, finish = _compressor(encoding)
+        response.set_data(process(data) + finish())
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def _compressor(encoding):
+    config = current_app.config
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=config["COMPRESS_BR_QUALITY"])
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(config["COMPRESS_LEVEL"], zlib.DEFLATED, 31)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def _compress_stream(response, encoding):
+    original = response.response
+    chunks = response.iter_encoded()
+    process, flush, finish = _compressor(encoding)
+
+    def generate():
+        try:
+            for chunk in chunks:
+                # Sync-flush every chunk so the client can start parsing the
+                # head and nav while the rest of the page is still rendering.
+                data = process(chunk) + flush()
+                if data:
+                    yield data
+            yield finish()
+        finally:
+            if hasattr(original, "close"):
+                original.close()
+
+    return generate()
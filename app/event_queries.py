@@ -0,0 +1,175 @@
+import math
+from datetime import date, timedelta
+from functools import lru_cache
+
+from sqlalchemy import func, select, text
+
+from .extensions import db
+from .models import Event
+
+
+EARTH_RADIUS_KM = 6371.0
+NEAREST_START_KM = 25
+
+
+def upcoming(limit, today=None):
+    return (
+        Event.query.filter(Event.event_date >= (today or date.today()))
+        .order_by(Event.event_date.asc(), Event.id.asc())
+        .limit(limit)
+        .all()
+    )
+
+
+def search(city=None, start=None, end=None, include_past=False, cursor=None):
+    query = Event.query
+    if not include_past:
+        start = max(start or date.min, date.today())
+    if start:
+        query = query.filter(Event.event_date >= start)
+    if end:
+        query = query.filter(Event.event_date <= end)
+    if city:
+        query = query.filter(func.lower(Event.city) == city.strip().lower())
+    if cursor:
+        cursor_date, cursor_id = cursor
+        query = query.filter(
+            (Event.event_date > cursor_date)
+            | ((Event.event_date == cursor_date) & (Event.id > cursor_id))
+        )
+    return query.order_by(Event.event_date.asc(), Event.id.asc())
+
+
+def encode_cursor(event):
+    return f"{event.event_date.isoformat()}:{event.id}"
+
+
+def decode_cursor(value):
+    try:
+        day, event_id = value.split(":")
+        return date.fromisoformat(day), int(event_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def day_counts(start, end):
+    rows = db.session.execute(
+        select(Event.event_date, func.count())
+        .where(Event.event_date >= start, Event.event_date <= end)
+        .group_by(Event.event_date)
+    ).all()
+    return {day: count for day, count in rows}
+
+
+def month_weeks(year, month):
+    first = date(year, month, 1)
+    start = first - timedelta(days=first.weekday())
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    end = last + timedelta(days=6 - last.weekday())
+    return _weeks(start, end)
+
+
+def week_days(day):
+    start = day - timedelta(days=day.weekday())
+    return _weeks(start, start + timedelta(days=6))
+
+
+def _weeks(start, end):
+    counts = day_counts(start, end)
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    cells = [(day, counts.get(day, 0)) for day in days]
+    return [cells[index : index + 7] for index in range(0, len(cells), 7)]
+
+
+def city_coordinates(city):
+    row = db.session.execute(
+        select(func.avg(Event.latitude), func.avg(Event.longitude)).where(
+            func.lower(Event.city) == city.strip().lower(), Event.latitude.isnot(None)
+        )
+    ).one()
+    return None if row[0] is None else (row[0], row[1])
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def nearest(latitude, longitude, radius_km, limit, include_past=False):
+    # The search starts close by and widens until `limit` events lie within
+    # the searched radius (nothing further out can then beat them) or the
+    # full radius is reached, so a busy region never reads every event in
+    # it. Only coordinates are read for candidates; the winners are loaded
+    # in full.
+    searched = min(radius_km, NEAREST_START_KM)
+    while True:
+        found = []
+        for event_id, event_date, event_latitude, event_longitude in db.session.execute(
+            _candidates(latitude, longitude, searched, include_past)
+        ):
+            distance = distance_km(latitude, longitude, event_latitude, event_longitude)
+            if distance <= searched:
+                found.append((distance, event_date, event_id))
+        if len(found) >= limit or searched >= radius_km:
+            break
+        searched = min(searched * 4, radius_km)
+    found = sorted(found)[:limit]
+    events = {event.id: event for event in Event.query.filter(Event.id.in_([f[2] for f in found]))}
+    return [(distance, events[event_id]) for distance, _, event_id in found]
+
+
+def _candidates(latitude, longitude, radius_km, include_past):
+    # Candidates come from a bounding-box lookup (the R*Tree on SQLite, the
+    # coordinate index elsewhere); only those are ranked by true distance.
+    dlat = radius_km / 111.0
+    dlon = radius_km / (111.0 * max(math.cos(math.radians(latitude)), 0.01))
+    box = (latitude - dlat, latitude + dlat, longitude - dlon, longitude + dlon)
+    query = select(Event.id, Event.event_date, Event.latitude, Event.longitude)
+    if not include_past:
+        query = query.where(Event.event_date >= date.today())
+    if has_rtree():
+        candidates = select(text("id")).select_from(text("event_geo")).where(
+            text(
+                "max_lat >= :south AND min_lat <= :north AND max_lon >= :west AND min_lon <= :east"
+            ).bindparams(south=box[0], north=box[1], west=box[2], east=box[3])
+        )
+        return query.where(Event.id.in_(candidates))
+    return query.where(
+        Event.latitude.between(box[0], box[1]), Event.longitude.between(box[2], box[3])
+    )
+
+
+def has_rtree():
+    return _has_rtree(db.engine)
+
+
+@lru_cache(maxsize=None)
+def _has_rtree(engine):
+    if engine.dialect.name != "sqlite":
+        return False
+    with engine.connect() as connection:
+        return bool(
+            connection.scalar(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event_geo'")
+            )
+        )
+
+
+RTREE_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS event_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+    """CREATE TRIGGER IF NOT EXISTS event_geo_insert AFTER INSERT ON event
+    WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+        INSERT INTO event_geo VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS event_geo_update AFTER UPDATE OF latitude, longitude ON event BEGIN
+        DELETE FROM event_geo WHERE id = old.id;
+        INSERT INTO event_geo SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS event_geo_delete AFTER DELETE ON event BEGIN
+        DELETE FROM event_geo WHERE id = old.id;
+    END""",
+]
@@ -2,7 +2,12 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_wtf import CSRFProtect
 
+from .cache import Cache
+from .tasks import TaskRunner
+
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 csrf = CSRFProtect()
+tasks = TaskRunner()
+cache = Cache()
@@ -0,0 +1,144 @@
+from collections import Counter
+
+from sqlalchemy import delete, event, inspect, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import lookups
+from .extensions import db
+from .models import Album, Band, Country, FacetCount, Genre
+
+
+# facet name -> (model, attribute, bucket width, lookup model); a width
+# turns a year into its decade bucket, otherwise the value is a lookup id.
+FACETS = {
+    "genre": (Album, "genre_id", None, Genre),
+    "decade": (Album, "release_year", 10, None),
+    "country": (Band, "country_id", None, Country),
+    "formed": (Band, "formed_year", 10, None),
+}
+
+
+def init_facets():
+    for name, listener in (
+        ("before_flush", _collect_changes),
+        ("after_flush", _apply_deltas),
+    ):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
+
+
+def bucket(facet, value):
+    width = FACETS[facet][2]
+    return str(value) if width is None else str(value // width * width)
+
+
+def counts(*facets):
+    # One primary key range scan; its cost depends on the number of distinct
+    # values, not on the size of the catalog. Returns (value, label, count).
+    return label_counts(facets, db.session.execute(count_query(*facets)), lookups.names)
+
+
+def count_query(*facets):
+    return (
+        select(FacetCount.facet, FacetCount.value, FacetCount.count)
+        .where(FacetCount.facet.in_(facets))
+        .order_by(FacetCount.facet, FacetCount.value)
+    )
+
+
+def label_counts(facets, rows, names):
+    result = {facet: [] for facet in facets}
+    labels = {facet: names(FACETS[facet][3]) for facet in facets if FACETS[facet][3] is not None}
+    for facet, value, count in rows:
+        value = int(value)
+        if facet not in labels:
+            label = f"{value}s"
+        else:
+            label = labels[facet].get(value)
+            if label is None:
+                continue
+        result[facet].append((value, label, count))
+    for facet in facets:
+        if FACETS[facet][3] is not None:
+            result[facet].sort(key=lambda entry: entry[1].casefold())
+    return result
+
+
+def condition(facet, values):
+    model, attribute, width, _ = FACETS[facet]
+    column = getattr(model, attribute)
+    if width is None:
+        return column.in_(values)
+    return or_(*(column.between(value, value + width - 1) for value in values))
+
+
+def apply(query, **selections):
+    for facet, values in selections.items():
+        if values:
+            query = query.filter(condition(facet, values))
+    return query
+
+
+def rebuild():
+    totals = Counter()
+    for facet, (model, attribute, _, _) in FACETS.items():
+        for value in db.session.scalars(select(getattr(model, attribute))):
+            totals[(facet, bucket(facet, value))] += 1
+    db.session.execute(delete(FacetCount))
+    if totals:
+        db.session.execute(
+            FacetCount.__table__.insert(),
+            [{"facet": facet, "value": value, "count": n} for (facet, value), n in totals.items()],
+        )
+
+
+def _facets_for(obj):
+    return [
+        (facet, attribute)
+        for facet, (model, attribute, _, _) in FACETS.items()
+        if isinstance(obj, model)
+    ]
+
+
+def _collect_changes(session, flush_context, instances):
+    # Deleted and edited rows are read before the flush, while their old
+    # values can still be loaded; new rows are counted after it, once
+    # foreign keys to freshly created genres and countries are populated.
+    deltas = Counter()
+    for obj in session.deleted:
+        for facet, attribute in _facets_for(obj):
+            history = inspect(obj).attrs[attribute].history
+            value = history.deleted[0] if history.deleted else getattr(obj, attribute)
+            deltas[(facet, bucket(facet, value))] -= 1
+    for obj in session.dirty:
+        if obj in session.deleted:
+            continue
+        for facet, attribute in _facets_for(obj):
+            history = inspect(obj).attrs[attribute].history
+            if history.added and history.deleted:
+                deltas[(facet, bucket(facet, history.deleted[0]))] -= 1
+                deltas[(facet, bucket(facet, history.added[0]))] += 1
+    session.info["facet_deltas"] = deltas
+
+
+def _apply_deltas(session, flush_context):
+    deltas = session.info.pop("facet_deltas", None) or Counter()
+    for obj in session.new:
+        for facet, attribute in _facets_for(obj):
+            deltas[(facet, bucket(facet, getattr(obj, attribute)))] += 1
+    rows = [
+        {"facet": facet, "value": value, "count": n}
+        for (facet, value), n in deltas.items()
+        if n
+    ]
+    if not rows:
+        return
+    dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(FacetCount)
+    statement = statement.on_conflict_do_update(
+        index_elements=[FacetCount.facet, FacetCount.value],
+        set_={"count": FacetCount.count + statement.excluded["count"]},
+    )
+    connection = session.connection()
+    connection.execute(statement, rows)
+    connection.execute(delete(FacetCount).where(FacetCount.count <= 0))
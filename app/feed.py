@@ -0,0 +1,159 @@
+import heapq
+from collections import namedtuple
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from .extensions import cache, db
+from .models import Album, Band, Comment, Event, FavoriteAlbum, FavoriteBand, User
+
+
+FeedItem = namedtuple("FeedItem", "at kind id subject_id subject body author")
+
+
+def sort_key(item):
+    return (item.at, item.kind, item.id)
+
+
+def page(user_id, cursor=None):
+    items = cache.get_or_set(
+        ("feed", user_id), lambda: build(user_id), current_app.config["FEED_CACHE_TTL"]
+    )
+    if cursor is not None:
+        items = [item for item in items if sort_key(item) < cursor]
+    size = current_app.config["FEED_PAGE_SIZE"]
+    next_cursor = encode_cursor(items[size - 1]) if len(items) > size else None
+    return items[:size], next_cursor
+
+
+def invalidate(*user_ids):
+    cache.delete(*(("feed", user_id) for user_id in user_ids))
+
+
+def build(user_id):
+    # Fan-out on read: every band, album and the event calendar keeps its own
+    # short newest-first stream, shared by all users and cached on its own;
+    # a user's feed is a lazy merge of the streams they follow.
+    band_ids = db.session.scalars(
+        select(FavoriteBand.band_id).where(FavoriteBand.user_id == user_id)
+    ).all()
+    album_ids = db.session.scalars(
+        select(FavoriteAlbum.album_id).where(FavoriteAlbum.user_id == user_id)
+    ).all()
+    streams = [
+        *_streams("band", band_ids, _load_band_albums),
+        *_streams("album", album_ids, _load_album_comments),
+        cache.get_or_set(("feed-stream", "events"), _load_events, _stream_ttl()),
+    ]
+    merged = heapq.merge(*streams, key=sort_key, reverse=True)
+    return [item for item, _ in zip(merged, range(current_app.config["FEED_MAX_ITEMS"]))]
+
+
+def encode_cursor(item):
+    return f"{item.at.isoformat()}~{item.kind}~{item.id}"
+
+
+def decode_cursor(value):
+    try:
+        at, kind, item_id = value.split("~")
+        return datetime.fromisoformat(at), kind, int(item_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _stream_ttl():
+    return current_app.config["FEED_CACHE_TTL"]
+
+
+def _streams(kind, entity_ids, loader):
+    streams = {}
+    missing = []
+    for entity_id in entity_ids:
+        stream = cache.get(("feed-stream", kind, entity_id))
+        if stream is None:
+            missing.append(entity_id)
+        else:
+            streams[entity_id] = stream
+    if missing:
+        loaded = loader(missing)
+        for entity_id in missing:
+            streams[entity_id] = loaded.get(entity_id, [])
+            cache.set(("feed-stream", kind, entity_id), streams[entity_id], _stream_ttl())
+    return [stream for stream in streams.values() if stream]
+
+
+def _newest(model, partition, where, depth):
+    # created_at is nullable (older rows were backfilled from nullable
+    # columns) and an undated row cannot be placed in a time-ordered feed.
+    numbered = (
+        select(
+            model.id,
+            func.row_number()
+            .over(partition_by=partition, order_by=(model.created_at.desc(), model.id.desc()))
+            .label("number"),
+        )
+        .where(*where, model.created_at.isnot(None))
+        .subquery()
+    )
+    return select(numbered.c.id).where(numbered.c.number <= depth)
+
+
+def _load_band_albums(band_ids):
+    depth = current_app.config["FEED_STREAM_DEPTH"]
+    rows = db.session.execute(
+        select(Album.id, Album.band_id, Album.title, Album.created_at, Band.name)
+        .join(Band, Band.id == Album.band_id)
+        .where(
+            Album.id.in_(_newest(Album, Album.band_id, [Album.band_id.in_(band_ids)], depth))
+        )
+        .order_by(Album.created_at.desc(), Album.id.desc())
+    )
+    streams = {}
+    for album_id, band_id, title, created_at, band_name in rows:
+        streams.setdefault(band_id, []).append(
+            FeedItem(created_at, "album", album_id, band_id, band_name, title, None)
+        )
+    return streams
+
+
+def _load_album_comments(album_ids):
+    depth = current_app.config["FEED_STREAM_DEPTH"]
+    visible = [
+        Comment.target_type == "album",
+        Comment.target_id.in_(album_ids),
+        Comment.is_hidden.is_(False),
+    ]
+    rows = db.session.execute(
+        select(
+            Comment.id,
+            Comment.target_id,
+            Comment.body,
+            Comment.created_at,
+            Album.title,
+            User.username,
+        )
+        .join(Album, Album.id == Comment.target_id)
+        .join(User, User.id == Comment.user_id)
+        .where(Comment.id.in_(_newest(Comment, Comment.target_id, visible, depth)))
+        .order_by(Comment.created_at.desc(), Comment.id.desc())
+    )
+    streams = {}
+    for comment_id, album_id, body, created_at, album_title, username in rows:
+        streams.setdefault(album_id, []).append(
+            FeedItem(created_at, "comment", comment_id, album_id, album_title, body, username)
+        )
+    return streams
+
+
+def _load_events():
+    rows = db.session.execute(
+        select(Event.id, Event.title, Event.city, Event.created_at)
+        .where(Event.event_date >= date.today(), Event.created_at.isnot(None))
+        .order_by(Event.created_at.desc(), Event.id.desc())
+        .limit(current_app.config["FEED_STREAM_DEPTH"])
+    )
+    return [
+        FeedItem(created_at, "event", event_id, event_id, city, title, None)
+        for event_id, title, city, created_at in rows
+    ]
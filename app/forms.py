@@ -9,6 +9,9 @@ from wtforms import (
     IntegerField,
     DateField,
     SelectField,
+    SelectMultipleField,
+    FloatField,
+    BooleanField,
 )
 from wtforms.validators import (
     DataRequired,
@@ -47,7 +50,8 @@ class LoginForm(FlaskForm):
 
 class BandForm(FlaskForm):
     name = StringField("Band Name", validators=[DataRequired(), Length(max=120)])
-    country = StringField("Country", validators=[DataRequired(), Length(max=80)])
+    country_id = SelectField("Country", coerce=int)
+    new_country = StringField("Or add a new country", validators=[Optional(), Length(max=80)])
     formed_year = IntegerField(
         "Formed Year", validators=[DataRequired(), NumberRange(min=1950, max=2100)]
     )
@@ -55,6 +59,10 @@ class BandForm(FlaskForm):
     description = TextAreaField("Description", validators=[DataRequired(), Length(min=20, max=2000)])
     submit = SubmitField("Save Band")
 
+    def validate_country_id(self, field):
+        if not field.data and not (self.new_country.data or "").strip():
+            raise ValidationError("Choose a country or add a new one.")
+
 
 class AlbumForm(FlaskForm):
     band_id = SelectField("Band", coerce=int, validators=[DataRequired()])
@@ -62,11 +70,16 @@ class AlbumForm(FlaskForm):
     release_year = IntegerField(
         "Release Year", validators=[DataRequired(), NumberRange(min=1950, max=2100)]
     )
-    genre = StringField("Genre", validators=[DataRequired(), Length(max=80)])
+    genre_id = SelectField("Genre", coerce=int)
+    new_genre = StringField("Or add a new genre", validators=[Optional(), Length(max=80)])
     cover_url = StringField("Cover URL", validators=[Optional(), URL(), Length(max=255)])
     description = TextAreaField("Description", validators=[DataRequired(), Length(min=20, max=2000)])
     submit = SubmitField("Save Album")
 
+    def validate_genre_id(self, field):
+        if not field.data and not (self.new_genre.data or "").strip():
+            raise ValidationError("Choose a genre or add a new one.")
+
 
 class CommentForm(FlaskForm):
     body = TextAreaField("Leave a comment", validators=[DataRequired(), Length(min=5, max=500)])
@@ -91,19 +104,25 @@ class ProfileForm(FlaskForm):
 
 class BandSearchForm(FlaskForm):
     query = StringField("Search", validators=[Optional(), Length(max=120)])
-    country = StringField("Country", validators=[Optional(), Length(max=80)])
+    country = SelectMultipleField("Country", coerce=int, validate_choice=False)
+    formed = SelectMultipleField("Formed", coerce=int, validate_choice=False)
     submit = SubmitField("Filter")
 
 
 class AlbumSearchForm(FlaskForm):
     query = StringField("Search", validators=[Optional(), Length(max=150)])
-    genre = StringField("Genre", validators=[Optional(), Length(max=80)])
+    genre = SelectMultipleField("Genre", coerce=int, validate_choice=False)
+    decade = SelectMultipleField("Decade", coerce=int, validate_choice=False)
     submit = SubmitField("Filter")
 
 
 class EventSearchForm(FlaskForm):
     city = StringField("City", validators=[Optional(), Length(max=100)])
-    after_date = DateField("After", validators=[Optional()])
+    after_date = DateField("From", validators=[Optional()])
+    before_date = DateField("Until", validators=[Optional()])
+    near = StringField("Near city", validators=[Optional(), Length(max=100)])
+    radius = IntegerField("Radius (km)", validators=[Optional(), NumberRange(min=1, max=5000)])
+    include_past = BooleanField("Include past events")
     submit = SubmitField("Filter")
 
 
@@ -118,5 +137,7 @@ class EventForm(FlaskForm):
     city = StringField("City", validators=[DataRequired(), Length(max=100)])
     event_date = DateField("Event Date", validators=[DataRequired(), validate_event_date])
     link_url = StringField("Event Link", validators=[Optional(), URL(), Length(max=255)])
+    latitude = FloatField("Latitude", validators=[Optional(), NumberRange(min=-90, max=90)])
+    longitude = FloatField("Longitude", validators=[Optional(), NumberRange(min=-180, max=180)])
     description = TextAreaField("Description", validators=[DataRequired(), Length(min=20, max=2000)])
     submit = SubmitField("Save Event")
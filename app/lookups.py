@@ -0,0 +1,53 @@
+from sqlalchemy import func, select
+
+from .extensions import cache, db
+from .models import Country, Genre
+from .pubsub import pubsub
+
+
+def clean(name):
+    return " ".join(name.split())
+
+
+def choices(model):
+    def load():
+        rows = db.session.execute(select(model.id, model.name).order_by(model.name))
+        return [tuple(row) for row in rows]
+
+    return cache.get_or_set(("lookup-choices", model.__tablename__), load)
+
+
+def names(model):
+    return dict(choices(model))
+
+
+def get_or_create(model, name):
+    name = clean(name)
+    row = db.session.scalar(select(model).where(func.lower(model.name) == name.lower()))
+    if row is None:
+        row = model(name=name)
+        db.session.add(row)
+        db.session.flush()
+        invalidate(model)
+    return row
+
+
+def resolve(model, selected_id, new_name):
+    if new_name and clean(new_name):
+        return get_or_create(model, new_name).id
+    return selected_id
+
+
+def invalidate(*models):
+    cache.delete(*(("lookup-choices", model.__tablename__) for model in models))
+
+
+def _on_catalog_change(message):
+    # New genres and countries are only ever created alongside an album or
+    # band write, so those messages are enough to drop other workers' lists.
+    if message["kind"] in ("album", "band"):
+        invalidate(Genre, Country)
+
+
+def init_lookups():
+    pubsub.listen("catalog", _on_catalog_change)
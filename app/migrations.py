@@ -0,0 +1,216 @@
+from collections import Counter
+from itertools import groupby
+
+from flask import current_app
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
+from . import facets
+from .event_queries import RTREE_SCHEMA
+from .extensions import db
+from .lookups import clean
+from .models import (
+    Album,
+    Band,
+    Comment,
+    Country,
+    Event,
+    FacetCount,
+    Genre,
+    PlaylistItem,
+    User,
+)
+from .playlists import spaced_keys
+
+
+SEED_CITY_COORDINATES = {
+    "New York": (40.7128, -74.006),
+    "Los Angeles": (34.0522, -118.2437),
+    "Chicago": (41.8781, -87.6298),
+    "Seattle": (47.6062, -122.3321),
+    "Austin": (30.2672, -97.7431),
+    "Denver": (39.7392, -104.9903),
+    "Washington, DC": (38.9072, -77.0369),
+    "London": (51.5074, -0.1278),
+}
+
+
+def upgrade():
+    # db.create_all() only creates missing tables; these steps bring tables
+    # created by older versions up to date and are safe to run repeatedly.
+    for step in STEPS:
+        step(inspect(db.engine))
+        db.session.commit()
+
+
+def _columns(inspector, table):
+    return {column["name"] for column in inspector.get_columns(table)}
+
+
+def _create_indexes(model, *names):
+    for index in model.__table__.indexes:
+        if not names or index.name in names:
+            db.session.execute(CreateIndex(index, if_not_exists=True))
+
+
+def add_playlist_item_rank(inspector):
+    if "rank" not in _columns(inspector, "playlist_item"):
+        db.session.execute(text("ALTER TABLE playlist_item ADD COLUMN rank VARCHAR(64)"))
+        rows = db.session.execute(
+            text("SELECT id, playlist_id FROM playlist_item ORDER BY playlist_id, position, id")
+        ).all()
+        updates = []
+        for _, items in groupby(rows, key=lambda row: row.playlist_id):
+            items = list(items)
+            updates.extend(
+                {"item_id": item.id, "rank": rank}
+                for item, rank in zip(items, spaced_keys(len(items)))
+            )
+        if updates:
+            db.session.execute(
+                text("UPDATE playlist_item SET rank = :rank WHERE id = :item_id"), updates
+            )
+    _create_indexes(PlaylistItem)
+
+
+def add_event_coordinates(inspector):
+    if "latitude" not in _columns(inspector, "event"):
+        db.session.execute(text("ALTER TABLE event ADD COLUMN latitude FLOAT"))
+        db.session.execute(text("ALTER TABLE event ADD COLUMN longitude FLOAT"))
+        db.session.execute(
+            text("UPDATE event SET latitude = :lat, longitude = :lon WHERE city = :city"),
+            [
+                {"city": city, "lat": lat, "lon": lon}
+                for city, (lat, lon) in SEED_CITY_COORDINATES.items()
+            ],
+        )
+    _create_indexes(Event)
+    if db.engine.dialect.name == "sqlite" and not inspector.has_table("event_geo"):
+        for statement in RTREE_SCHEMA:
+            db.session.execute(text(statement))
+        db.session.execute(
+            text(
+                "INSERT INTO event_geo SELECT id, latitude, latitude, longitude, longitude"
+                " FROM event WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+            )
+        )
+
+
+def add_catalog_created_at(inspector):
+    if "created_at" not in _columns(inspector, "album"):
+        db.session.execute(text("ALTER TABLE album ADD COLUMN created_at DATETIME"))
+        db.session.execute(
+            text(
+                "UPDATE album SET created_at ="
+                " (SELECT band.created_at FROM band WHERE band.id = album.band_id)"
+            )
+        )
+    if "created_at" not in _columns(inspector, "event"):
+        db.session.execute(text("ALTER TABLE event ADD COLUMN created_at DATETIME"))
+        db.session.execute(text("UPDATE event SET created_at = CURRENT_TIMESTAMP"))
+    # Runs before the steps that index every album column, so only the new
+    # index is created here.
+    _create_indexes(Album, "ix_album_band_created")
+    _create_indexes(Comment)
+
+
+def add_lookup_dimensions(inspector):
+    converted = False
+    for table, column, lookup in (("album", "genre", Genre), ("band", "country", Country)):
+        if column not in _columns(inspector, table):
+            continue
+        rows = db.session.execute(text(f"SELECT id, {column} FROM {table}")).all()
+        # Spellings that differ only in case or spacing collapse into one
+        # row named after the most common spelling.
+        spellings = {}
+        for _, value in rows:
+            spellings.setdefault(clean(value).casefold(), Counter())[clean(value)] += 1
+        ids = {}
+        for key, counter in spellings.items():
+            row = lookup(name=counter.most_common(1)[0][0])
+            db.session.add(row)
+            db.session.flush()
+            ids[key] = row.id
+        db.session.execute(
+            text(
+                f"ALTER TABLE {table} ADD COLUMN {column}_id INTEGER"
+                f" REFERENCES {lookup.__tablename__}(id)"
+            )
+        )
+        if rows:
+            db.session.execute(
+                text(f"UPDATE {table} SET {column}_id = :lookup_id WHERE id = :row_id"),
+                [
+                    {"row_id": row_id, "lookup_id": ids[clean(value).casefold()]}
+                    for row_id, value in rows
+                ],
+            )
+        db.session.execute(text(f"DROP INDEX IF EXISTS ix_{table}_{column}"))
+        db.session.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        converted = True
+    _create_indexes(Genre)
+    _create_indexes(Country)
+    if converted:
+        _create_indexes(Album)
+        _create_indexes(Band)
+        facets.rebuild()
+
+
+def add_facet_counts(inspector):
+    _create_indexes(Album)
+    _create_indexes(Band)
+    if db.session.scalar(select(FacetCount.facet).limit(1)) is None:
+        facets.rebuild()
+
+
+def add_user_lower_indexes(inspector):
+    # Expression indexes are not reflected on SQLite, so look for the
+    # duplicates that would stop them being built instead.
+    if _case_duplicates(User.username):
+        # Usernames that differ only in case were allowed before; every one
+        # but the oldest gets its id appended, shortened to fit the column
+        # and numbered further should that name be taken too.
+        rows = db.session.execute(select(User.id, User.username).order_by(User.id)).all()
+        used = {username.lower() for _, username in rows}
+        seen = set()
+        for user_id, username in rows:
+            if username.lower() in seen:
+                renamed, attempt = username, 0
+                while renamed.lower() in used:
+                    suffix = f"_{user_id}" + (f"_{attempt}" if attempt else "")
+                    renamed = username[: User.username.type.length - len(suffix)] + suffix
+                    attempt += 1
+                used.add(renamed.lower())
+                db.session.execute(
+                    User.__table__.update().where(User.id == user_id).values(username=renamed)
+                )
+            seen.add(username.lower())
+    _create_indexes(User, "ix_user_username_lower")
+    if _case_duplicates(User.email):
+        current_app.logger.warning(
+            "Not indexing user emails: some differ only in case and need merging by hand"
+        )
+    else:
+        _create_indexes(User, "ix_user_email_lower")
+
+
+def add_comment_restored_from(inspector):
+    if "restored_from" not in _columns(inspector, "comment"):
+        db.session.execute(text("ALTER TABLE comment ADD COLUMN restored_from VARCHAR(20)"))
+
+
+def _case_duplicates(column):
+    return db.session.scalar(
+        select(func.lower(column)).group_by(func.lower(column)).having(func.count() > 1).limit(1)
+    )
+
+
+STEPS = [
+    add_playlist_item_rank,
+    add_event_coordinates,
+    add_catalog_created_at,
+    add_lookup_dimensions,
+    add_facet_counts,
+    add_user_lower_indexes,
+    add_comment_restored_from,
+]
@@ -29,16 +29,45 @@ class User(UserMixin, db.Model):
     def check_password(self, password: str) -> bool:
         return check_password_hash(self.password_hash, password)
 
+    __table_args__ = (
+        db.Index("ix_user_username_lower", db.func.lower(username), unique=True),
+        db.Index("ix_user_email_lower", db.func.lower(email), unique=True),
+    )
+
+
+class Country(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+
+    __table_args__ = (db.Index("ix_country_name", db.func.lower(name), unique=True),)
+
+
+class Genre(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+
+    __table_args__ = (db.Index("ix_genre_name", db.func.lower(name), unique=True),)
+
 
 class Band(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
-    country = db.Column(db.String(80), nullable=False)
-    formed_year = db.Column(db.Integer, nullable=False)
+    # Facet columns load their old value on change so facet counts can be
+    # moved from the old bucket to the new one.
+    country_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey("country.id"), nullable=False), active_history=True
+    )
+    formed_year = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)
     description = db.Column(db.Text, nullable=False)
     image_url = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_band_country_id", "country_id"),
+        db.Index("ix_band_formed_year", "formed_year"),
+    )
+
+    country = db.relationship("Country", lazy="joined")
     albums = db.relationship("Album", backref="band", lazy=True, cascade="all, delete-orphan")
     favorites = db.relationship(
         "FavoriteBand", backref="band", lazy=True, cascade="all, delete-orphan"
@@ -49,11 +78,21 @@ class Album(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     band_id = db.Column(db.Integer, db.ForeignKey("band.id"), nullable=False)
     title = db.Column(db.String(150), nullable=False)
-    release_year = db.Column(db.Integer, nullable=False)
-    genre = db.Column(db.String(80), nullable=False)
+    release_year = db.column_property(db.Column(db.Integer, nullable=False), active_history=True)
+    genre_id = db.column_property(
+        db.Column(db.Integer, db.ForeignKey("genre.id"), nullable=False), active_history=True
+    )
     cover_url = db.Column(db.String(255))
     description = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index("ix_album_genre_id", "genre_id"),
+        db.Index("ix_album_release_year", "release_year"),
+        db.Index("ix_album_band_created", "band_id", "created_at"),
+    )
+
+    genre = db.relationship("Genre", lazy="joined")
     playlist_items = db.relationship(
         "PlaylistItem", backref="album", lazy=True, cascade="all, delete-orphan"
     )
@@ -70,6 +109,15 @@ class Event(db.Model):
     event_date = db.Column(db.Date, nullable=False)
     description = db.Column(db.Text, nullable=False)
     link_url = db.Column(db.String(255))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_event_date", "event_date", "id"),
+        db.Index("ix_event_city_lower", db.func.lower(city)),
+        db.Index("ix_event_coordinates", "latitude", "longitude"),
+    )
 
 
 class Playlist(db.Model):
@@ -78,7 +126,13 @@ class Playlist(db.Model):
     name = db.Column(db.String(120), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    items = db.relationship("PlaylistItem", backref="playlist", lazy=True, cascade="all, delete-orphan")
+    items = db.relationship(
+        "PlaylistItem",
+        backref="playlist",
+        lazy=True,
+        cascade="all, delete-orphan",
+        order_by="(PlaylistItem.rank, PlaylistItem.id)",
+    )
 
 
 class PlaylistItem(db.Model):
@@ -86,7 +140,9 @@ class PlaylistItem(db.Model):
     playlist_id = db.Column(db.Integer, db.ForeignKey("playlist.id"), nullable=False)
     album_id = db.Column(db.Integer, db.ForeignKey("album.id"))
     track_name = db.Column(db.String(150))
-    position = db.Column(db.Integer, default=1)
+    rank = db.Column(db.String(64), nullable=False)
+
+    __table_args__ = (db.Index("ix_playlist_item_rank", "playlist_id", "rank"),)
 
 
 class FavoriteBand(db.Model):
@@ -105,6 +161,32 @@ class FavoriteAlbum(db.Model):
     __table_args__ = (db.UniqueConstraint("user_id", "album_id", name="unique_user_album"),)
 
 
+class FacetCount(db.Model):
+    facet = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(80), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TrendingScore(db.Model):
+    kind = db.Column(db.String(20), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
+    score = db.Column(db.Float, nullable=False, default=0)
+
+    __table_args__ = (db.Index("ix_trending_score_kind_score", "kind", "score"),)
+
+
+class TrendingEpoch(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.Float, nullable=False)
+
+
+class ChangeLog(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(80), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
@@ -113,3 +195,22 @@ class Comment(db.Model):
     body = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_hidden = db.Column(db.Boolean, default=False)
+    restored_from = db.Column(db.String(20))
+
+    __table_args__ = (db.Index("ix_comment_target", "target_type", "target_id", "created_at"),)
+
+    @property
+    def key(self):
+        return f"{self.user_id}:{self.created_at.isoformat()}"
+
+
+class CommentArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    reason = db.Column(db.String(20), nullable=False)
+    comment_count = db.Column(db.Integer, nullable=False)
+    first_created_at = db.Column(db.DateTime)
+    last_created_at = db.Column(db.DateTime)
+    raw_bytes = db.Column(db.Integer, nullable=False)
+    stored_bytes = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
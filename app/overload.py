@@ -0,0 +1,273 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, has_app_context, has_request_context, jsonify, request, session
+from flask_login.config import COOKIE_NAME as REMEMBER_COOKIE_NAME
+from sqlalchemy import event
+
+from .extensions import db
+
+
+# Pages that run many or heavy queries. They are the first to go when the
+# database slows down, so the cheap pages keep answering.
+EXPENSIVE = {
+    "admin.dashboard",
+    "admin.comment_archive",
+    "admin.archive_detail",
+    "public.bands",
+    "public.albums",
+    "public.events",
+    "public.events_calendar",
+    "user.profile",
+}
+# Long-lived streams have their own connection limits.
+EXEMPT = {"static", "api.comment_stream", "api.catalog_stream"}
+# Query arguments that change what a public page shows. A page requested
+# with anything else is neither kept nor served stale, so made-up arguments
+# cannot push real pages out of the store.
+STALE_ARGS = {
+    "public.bands": {"query", "country", "formed"},
+    "public.albums": {"query", "genre", "decade"},
+    "public.events": {
+        "city", "after_date", "before_date", "near", "radius", "include_past", "cursor"
+    },
+    "public.events_calendar": {"week", "month"},
+}
+IGNORED_ARGS = {"submit"}
+
+_lock = threading.Lock()
+_state = {"slots": {}, "latency": {}, "revalidating": set()}
+
+
+class StalePages:
+    # Last good copies of public pages, dropped least recently used first
+    # once their bodies add up to more than max_bytes.
+    def __init__(self):
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.max_bytes = 16 * 1024 * 1024
+        self.ttl = 3600
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                return None
+            if page[2] + self.ttl < time.time():
+                self._drop(key)
+                return None
+            self._pages.move_to_end(key)
+            return page
+
+    def set(self, key, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._pages:
+                self._drop(key)
+            self._pages[key] = (body, mimetype, time.time())
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._pages)))
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self.size = 0
+
+    def _drop(self, key):
+        self.size -= len(self._pages.pop(key)[0])
+
+
+stale_pages = StalePages()
+
+
+def init_overload(app):
+    config = app.config
+    if not config["OVERLOAD_ENABLED"]:
+        return
+    _state["slots"] = {
+        route_class: threading.BoundedSemaphore(limit)
+        for route_class, limit in config["OVERLOAD_LIMITS"].items()
+    }
+    stale_pages.max_bytes = config["OVERLOAD_STALE_BYTES"]
+    stale_pages.ttl = config["OVERLOAD_STALE_TTL"]
+    with app.app_context():
+        for name, listener in (
+            ("before_cursor_execute", _before_query),
+            ("after_cursor_execute", _after_query),
+        ):
+            if not event.contains(db.engine, name, listener):
+                event.listen(db.engine, name, listener)
+    app.before_request(_admit)
+    app.after_request(_remember)
+    app.teardown_request(_release)
+
+
+def route_class(endpoint, method):
+    if endpoint is None or endpoint in EXEMPT:
+        return None
+    if method not in ("GET", "HEAD") or endpoint.startswith("auth."):
+        return "critical"
+    return "expensive" if endpoint in EXPENSIVE else "standard"
+
+
+def latency(route_class, now=None):
+    # Readings decay while nothing is sampled, so a class that is being shed
+    # is let through again once the half-life has passed and re-measured.
+    now = time.monotonic() if now is None else now
+    value, sampled = _state["latency"].get(route_class, (0.0, now))
+    return value * 0.5 ** ((now - sampled) / current_app.config["OVERLOAD_HALF_LIFE"])
+
+
+def _admit():
+    config = current_app.config
+    route = route_class(request.endpoint, request.method)
+    if route is None:
+        return None
+    key = _stale_key()
+    if latency(route) > config["OVERLOAD_DB_LATENCY"]:
+        # Stale-while-revalidate: one request at a time renders the page
+        # afresh while everyone else gets the last good copy.
+        stale = stale_pages.get(key) if key is not None else None
+        if stale is not None and not _claim_revalidation(key):
+            return _stale_response(stale)
+        if stale is None and route == "expensive":
+            return _shed(None)
+    slots = _state["slots"].get(route)
+    if slots is not None:
+        try:
+            # Requests answered on the ASGI event loop must never block it,
+            # so they skip the queue.
+            asyncio.get_running_loop()
+            timeout = 0
+        except RuntimeError:
+            timeout = config["OVERLOAD_QUEUE_TIMEOUT"].get(route, 0)
+        if not slots.acquire(timeout=timeout):
+            return _shed(key)
+        g.overload_slot = route
+    g.overload_class = route
+    return None
+
+
+def _claim_revalidation(key):
+    with _lock:
+        if key in _state["revalidating"]:
+            return False
+        _state["revalidating"].add(key)
+    g.overload_revalidating = key
+    return True
+
+
+def _release(exc):
+    route = g.pop("overload_slot", None)
+    if route is not None:
+        _state["slots"][route].release()
+    key = g.pop("overload_revalidating", None)
+    if key is not None:
+        with _lock:
+            _state["revalidating"].discard(key)
+
+
+def _shed(key):
+    if key is not None:
+        stale = stale_pages.get(key)
+        if stale is not None:
+            return _stale_response(stale)
+    retry_after = str(current_app.config["OVERLOAD_RETRY_AFTER"])
+    if request.blueprint == "api":
+        response = jsonify(error="The site is busy, try again shortly.")
+    else:
+        response = current_app.response_class(
+            "The site is busy right now. Please try again in a few seconds.",
+            mimetype="text/plain",
+        )
+    response.status_code = 503
+    response.headers["Retry-After"] = retry_after
+    return response
+
+
+def _stale_key():
+    # Only pages every anonymous visitor sees alike are kept: public GETs
+    # from requests carrying neither a session nor a remember-me cookie.
+    if request.method != "GET" or request.blueprint != "public":
+        return None
+    config = current_app.config
+    cookies = (
+        config["SESSION_COOKIE_NAME"],
+        config.get("REMEMBER_COOKIE_NAME", REMEMBER_COOKIE_NAME),
+    )
+    if any(name in request.cookies for name in cookies):
+        return None
+    allowed = STALE_ARGS.get(request.endpoint, set())
+    if not set(request.args) <= allowed | IGNORED_ARGS:
+        return None
+    args = tuple(
+        (name, tuple(request.args.getlist(name))) for name in sorted(allowed & set(request.args))
+    )
+    return request.endpoint, tuple(sorted(request.view_args.items())), args
+
+
+def _stale_response(stale):
+    body, mimetype, stored = stale
+    g.overload_stale = True
+    response = current_app.response_class(body, mimetype=mimetype)
+    response.headers["Age"] = str(int(time.time() - stored))
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _remember(response):
+    key = _stale_key()
+    if (
+        key is None
+        or g.get("overload_stale")
+        or response.status_code != 200
+        or response.direct_passthrough
+        or session.modified
+    ):
+        return response
+    mimetype = response.mimetype
+    if not response.is_streamed:
+        stale_pages.set(key, response.get_data(), mimetype)
+        return response
+    chunks = response.response
+
+    def capture():
+        body = []
+        try:
+            for chunk in chunks:
+                body.append(chunk.encode() if isinstance(chunk, str) else chunk)
+                yield chunk
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+        # Only a page that streamed to the end is worth keeping.
+        stale_pages.set(key, b"".join(body), mimetype)
+
+    response.response = capture()
+    return response
+
+
+def _before_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info["overload_started"] = time.perf_counter()
+    # DB_FAULT_DELAY slows every query down to try all of this out locally.
+    if has_app_context() and current_app.config["DB_FAULT_DELAY"]:
+        time.sleep(current_app.config["DB_FAULT_DELAY"])
+
+
+def _after_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("overload_started", None)
+    route = g.get("overload_class") if has_request_context() else None
+    if route is None or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    now = time.monotonic()
+    weight = current_app.config["OVERLOAD_LATENCY_WEIGHT"]
+    with _lock:
+        value = latency(route, now) if route in _state["latency"] else elapsed
+        _state["latency"][route] = (value + weight * (elapsed - value), now)
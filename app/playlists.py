@@ -0,0 +1,173 @@
+from flask import current_app
+from sqlalchemy import bindparam, event, func, select, update
+
+from . import trending
+from .extensions import db, tasks
+from .models import Album, Band, PlaylistItem
+
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+
+
+def init_playlists(app):
+    tasks.every(app.config["PLAYLIST_REBALANCE_INTERVAL"], rebalance_long_playlists)
+    for name, listener in (
+        ("after_commit", _submit_rebalances),
+        ("after_rollback", _discard_rebalances),
+    ):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
+
+
+def key_between(lower, upper):
+    # Ranks are base-36 fractions without the leading "0.", so any two keys
+    # always have a key strictly between them. `lower` may be "" (start of
+    # the list) and `upper` may be None (end of the list).
+    if upper is not None and lower >= upper:
+        raise ValueError(f"No rank between {lower!r} and {upper!r}.")
+    key = []
+    index = 0
+    while True:
+        low = DIGITS.index(lower[index]) if index < len(lower) else 0
+        high = BASE
+        if upper is not None:
+            high = DIGITS.index(upper[index]) if index < len(upper) else 0
+        if high - low > 1:
+            key.append(DIGITS[(low + high) // 2])
+            return "".join(key)
+        key.append(DIGITS[low])
+        if high - low == 1:
+            upper = None
+        index += 1
+
+
+def spaced_keys(count):
+    width = 1
+    while BASE**width <= count:
+        width += 1
+    step = BASE**width // (count + 1)
+    keys = []
+    for index in range(1, count + 1):
+        value = index * step
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        keys.append("".join(reversed(digits)).rstrip("0"))
+    return keys
+
+
+def rank_for_position(playlist_id, position=None):
+    ranks = select(PlaylistItem.rank).where(PlaylistItem.playlist_id == playlist_id)
+    if position is None:
+        last = db.session.scalar(ranks.order_by(PlaylistItem.rank.desc()).limit(1))
+        return key_between(last or "", None)
+    neighbours = db.session.scalars(
+        ranks.order_by(PlaylistItem.rank).offset(max(position - 2, 0)).limit(2)
+    ).all()
+    if len(neighbours) == 2 and neighbours[0] == neighbours[1]:
+        rebalance(playlist_id)
+        return rank_for_position(playlist_id, position)
+    if position <= 1:
+        return key_between("", neighbours[0] if neighbours else None)
+    lower = neighbours[0] if neighbours else None
+    if lower is None:
+        return rank_for_position(playlist_id)
+    return key_between(lower, neighbours[1] if len(neighbours) > 1 else None)
+
+
+def add_item(playlist_id, album_id, position=None):
+    rank = rank_for_position(playlist_id, position)
+    item = PlaylistItem(playlist_id=playlist_id, album_id=album_id, rank=rank)
+    db.session.add(item)
+    trending.record(("album", album_id, "playlist"))
+    _check_length(playlist_id, rank)
+    return item
+
+
+def move_item(item, after_id=None):
+    siblings = select(PlaylistItem.rank).where(
+        PlaylistItem.playlist_id == item.playlist_id, PlaylistItem.id != item.id
+    )
+    lower = ""
+    if after_id is not None:
+        lower = db.session.scalar(siblings.where(PlaylistItem.id == after_id))
+        if lower is None:
+            return False
+        siblings = siblings.where(PlaylistItem.id != after_id)
+    upper = db.session.scalar(
+        siblings.where(PlaylistItem.rank >= lower)
+        .order_by(PlaylistItem.rank, PlaylistItem.id)
+        .limit(1)
+    )
+    if lower == upper:
+        # Concurrent inserts can leave two items sharing a rank; there is
+        # no room between them until the playlist is rebalanced.
+        rebalance(item.playlist_id)
+        return move_item(item, after_id)
+    item.rank = key_between(lower, upper)
+    _check_length(item.playlist_id, item.rank)
+    return True
+
+
+def ordered_items(playlist_id):
+    return db.session.execute(
+        select(PlaylistItem, Album, Band)
+        .outerjoin(Album, PlaylistItem.album_id == Album.id)
+        .outerjoin(Band, Album.band_id == Band.id)
+        .where(PlaylistItem.playlist_id == playlist_id)
+        .order_by(PlaylistItem.rank, PlaylistItem.id)
+    ).all()
+
+
+def rebalance(playlist_id, connection=None):
+    connection = connection or db.session
+    item_ids = connection.scalars(
+        select(PlaylistItem.id)
+        .where(PlaylistItem.playlist_id == playlist_id)
+        .order_by(PlaylistItem.rank, PlaylistItem.id)
+    ).all()
+    keys = spaced_keys(len(item_ids))
+    rows = [{"item_id": item_id, "new_rank": rank} for item_id, rank in zip(item_ids, keys)]
+    if rows:
+        connection.execute(
+            update(PlaylistItem.__table__)
+            .where(PlaylistItem.id == bindparam("item_id"))
+            .values(rank=bindparam("new_rank")),
+            rows,
+        )
+
+
+def rebalance_playlist(playlist_id):
+    # Also runs from the after_commit hook, where the session cannot be
+    # used, so it works through a connection of its own.
+    with db.engine.begin() as connection:
+        rebalance(playlist_id, connection)
+
+
+def rebalance_long_playlists():
+    max_length = current_app.config["PLAYLIST_RANK_MAX_LENGTH"]
+    playlist_ids = db.session.scalars(
+        select(PlaylistItem.playlist_id)
+        .group_by(PlaylistItem.playlist_id)
+        .having(func.max(func.length(PlaylistItem.rank)) > max_length)
+    ).all()
+    for playlist_id in playlist_ids:
+        rebalance_playlist(playlist_id)
+
+
+def _check_length(playlist_id, rank):
+    # The rebalance waits for the caller's commit: it must neither commit
+    # half of the caller's work nor miss the rank that was just written.
+    if len(rank) > current_app.config["PLAYLIST_RANK_MAX_LENGTH"]:
+        db.session.info.setdefault("rebalance_playlists", set()).add(playlist_id)
+
+
+def _submit_rebalances(session):
+    for playlist_id in session.info.pop("rebalance_playlists", ()):
+        tasks.submit(rebalance_playlist, playlist_id, key=("rebalance", playlist_id))
+
+
+def _discard_rebalances(session):
+    session.info.pop("rebalance_playlists", None)
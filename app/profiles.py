@@ -0,0 +1,125 @@
+from collections import defaultdict
+from math import ceil
+
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.orm import contains_eager
+
+from .extensions import cache, db
+from .models import Album, Band, Comment, FavoriteAlbum, FavoriteBand, Playlist, PlaylistItem
+
+
+class Section:
+    def __init__(self, items, page, pages, total):
+        self.items = items
+        self.page = page
+        self.pages = pages
+        self.total = total
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+
+def user_summary(user_id):
+    return cache.get_or_set(("profile-summary", user_id), lambda: _load_summary(user_id))
+
+
+def invalidate_summary(*user_ids):
+    cache.delete(*(("profile-summary", user_id) for user_id in user_ids))
+
+
+def _load_summary(user_id):
+    def count(model):
+        return (
+            select(func.count())
+            .select_from(model)
+            .where(model.user_id == user_id)
+            .scalar_subquery()
+        )
+
+    row = db.session.execute(
+        select(
+            count(FavoriteBand).label("favorite_bands"),
+            count(FavoriteAlbum).label("favorite_albums"),
+            count(Playlist).label("playlists"),
+            count(Comment).label("comments"),
+        )
+    ).one()
+    return row._asdict()
+
+
+def _page(query, page, total):
+    per_page = current_app.config["PROFILE_PAGE_SIZE"]
+    pages = max(ceil(total / per_page), 1)
+    page = min(max(page, 1), pages)
+    items = db.session.scalars(query.limit(per_page).offset((page - 1) * per_page)).all()
+    return Section(items, page, pages, total)
+
+
+def favorite_bands(user_id, page, total):
+    query = (
+        select(Band)
+        .join(FavoriteBand, FavoriteBand.band_id == Band.id)
+        .where(FavoriteBand.user_id == user_id)
+        .order_by(FavoriteBand.id.desc())
+    )
+    return _page(query, page, total)
+
+
+def favorite_albums(user_id, page, total):
+    query = (
+        select(Album)
+        .join(FavoriteAlbum, FavoriteAlbum.album_id == Album.id)
+        .where(FavoriteAlbum.user_id == user_id)
+        .order_by(FavoriteAlbum.id.desc())
+    )
+    return _page(query, page, total)
+
+
+def playlists(user_id, page, total):
+    query = select(Playlist).where(Playlist.user_id == user_id).order_by(Playlist.created_at.desc())
+    return _page(query, page, total)
+
+
+def playlist_previews(playlist_ids):
+    # One windowed query for every playlist on the page, capped per playlist,
+    # instead of loading each playlist's full item collection.
+    if not playlist_ids:
+        return {}
+    numbered = (
+        select(
+            PlaylistItem.id,
+            func.row_number()
+            .over(
+                partition_by=PlaylistItem.playlist_id,
+                order_by=(PlaylistItem.rank, PlaylistItem.id),
+            )
+            .label("number"),
+            func.count().over(partition_by=PlaylistItem.playlist_id).label("total"),
+        )
+        .where(PlaylistItem.playlist_id.in_(playlist_ids))
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(PlaylistItem, numbered.c.total)
+        .join(numbered, numbered.c.id == PlaylistItem.id)
+        .outerjoin(PlaylistItem.album)
+        .options(contains_eager(PlaylistItem.album))
+        .where(numbered.c.number <= current_app.config["PROFILE_PLAYLIST_ITEMS"])
+        .order_by(PlaylistItem.playlist_id, PlaylistItem.rank, PlaylistItem.id)
+    ).all()
+    previews = defaultdict(lambda: {"items": [], "total": 0})
+    for item, total in rows:
+        previews[item.playlist_id]["items"].append(item)
+        previews[item.playlist_id]["total"] = total
+    return previews
+
+
+def comments(user_id, page, total):
+    query = select(Comment).where(Comment.user_id == user_id).order_by(Comment.created_at.desc())
+    return _page(query, page, total)
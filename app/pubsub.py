@@ -0,0 +1,176 @@
+import asyncio
+import json
+import queue
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+from .extensions import db, tasks
+from .models import ChangeLog
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscription:
+    def __init__(self, broker, channels, client):
+        self.broker = broker
+        self.channels = channels
+        self.client = client
+        self.queue = queue.Queue(maxsize=broker.app.config["PUBSUB_QUEUE_SIZE"])
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # Slow consumers miss messages rather than block publishers.
+            pass
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+
+class LoopSubscription(Subscription):
+    # For streams served on an event loop: messages are handed to the loop
+    # and awaited from an asyncio queue instead of blocking a thread.
+    def __init__(self, broker, channels, client, loop):
+        super().__init__(broker, channels, client)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=broker.app.config["PUBSUB_QUEUE_SIZE"])
+
+    def put(self, message):
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+
+class LocalBackend:
+    def start(self, broker):
+        self.broker = broker
+
+    def publish(self, channel, data):
+        self.broker.dispatch(channel, data)
+
+
+class ChangeLogBackend:
+    # Every worker appends to the change_log table and polls it for rows
+    # written since its last poll, so messages reach subscribers attached
+    # to any worker sharing the database.
+    def start(self, broker):
+        self.broker = broker
+        with db.engine.connect() as connection:
+            self.last_id = connection.scalar(select(func.max(ChangeLog.id))) or 0
+        config = broker.app.config
+        tasks.every(config["PUBSUB_POLL_INTERVAL"], self.poll)
+        tasks.every(config["PUBSUB_RETENTION"], self.prune)
+
+    def publish(self, channel, data):
+        with db.engine.begin() as connection:
+            connection.execute(
+                insert(ChangeLog).values(channel=channel, payload=json.dumps(data))
+            )
+        if not tasks.enabled:
+            self.poll()
+
+    def poll(self):
+        # Publishing happens from after_commit hooks, where the ORM session
+        # cannot run queries, so read through a connection of our own.
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                select(ChangeLog.id, ChangeLog.channel, ChangeLog.payload)
+                .where(ChangeLog.id > self.last_id)
+                .order_by(ChangeLog.id)
+            ).all()
+        for row in rows:
+            self.last_id = row.id
+            self.broker.dispatch(row.channel, json.loads(row.payload))
+
+    def prune(self):
+        horizon = datetime.utcnow() - timedelta(seconds=self.broker.app.config["PUBSUB_RETENTION"])
+        db.session.execute(delete(ChangeLog).where(ChangeLog.created_at < horizon))
+        db.session.commit()
+
+
+BACKENDS = {"local": LocalBackend, "changelog": ChangeLogBackend}
+
+
+class PubSub:
+    def __init__(self):
+        self.app = None
+        self.backend = None
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self._clients = Counter()
+        self._listeners = defaultdict(list)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["pubsub"] = self
+        self.backend = BACKENDS[app.config["PUBSUB_BACKEND"]]()
+        with app.app_context():
+            self.backend.start(self)
+
+    @property
+    def connections(self):
+        return sum(self._clients.values())
+
+    def publish(self, channel, **data):
+        self.backend.publish(channel, data)
+
+    def listen(self, channel, callback):
+        if callback not in self._listeners[channel]:
+            self._listeners[channel].append(callback)
+
+    def subscribe(self, channels, client, loop=None):
+        config = self.app.config
+        with self._lock:
+            if (
+                self.connections >= config["SSE_MAX_CONNECTIONS"]
+                or self._clients[client] >= config["SSE_MAX_CONNECTIONS_PER_CLIENT"]
+            ):
+                raise TooManySubscribers()
+            if loop is None:
+                subscription = Subscription(self, channels, client)
+            else:
+                subscription = LoopSubscription(self, channels, client, loop)
+            self._clients[client] += 1
+            for channel in channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def dispatch(self, channel, data):
+        for callback in self._listeners.get(channel, ()):
+            try:
+                callback(data)
+            except Exception:
+                self.app.logger.exception("Listener for %s failed", channel)
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put((channel, data))
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].discard(subscription)
+                if not self._subscriptions[channel]:
+                    del self._subscriptions[channel]
+            self._clients[subscription.client] -= 1
+            if self._clients[subscription.client] <= 0:
+                del self._clients[subscription.client]
+
+
+pubsub = PubSub()
@@ -0,0 +1,32 @@
+from flask import current_app, get_flashed_messages, stream_template
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+
+
+def stream_page(template_name, **context):
+    # The session is saved before the body is streamed, so anything the
+    # template would read from it has to be pulled out up front.
+    get_flashed_messages(with_categories=True)
+    if current_user.is_authenticated:
+        generate_csrf()
+    chunks = stream_template(template_name, **context)
+    return current_app.response_class(
+        _coalesce(chunks, current_app.config["STREAM_BUFFER_SIZE"]), mimetype="text/html"
+    )
+
+
+def _coalesce(chunks, size):
+    buffer = []
+    buffered = 0
+    try:
+        for chunk in chunks:
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= size:
+                yield "".join(buffer)
+                buffer = []
+                buffered = 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        chunks.close()
@@ -2,10 +2,15 @@ from functools import wraps
 
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
+from sqlalchemy import func, select
+from sqlalchemy.orm import defer, joinedload
 
+from .. import archive, lookups
 from ..extensions import db
 from ..forms import BandForm, AlbumForm, EventForm
-from ..models import Band, Album, Event, Comment, User
+from ..models import Band, Album, Country, Event, Comment, CommentArchive, Genre, User
+from ..rendering import stream_page
+from ..search_index import index as search_index
 
 
 admin_bp = Blueprint("admin", __name__)
@@ -23,16 +28,21 @@ def admin_required(func):
     return wrapper
 
 
+def lookup_choices(model, placeholder):
+    return [(0, placeholder)] + lookups.choices(model)
+
+
 @admin_bp.route("/")
 @admin_required
 def dashboard():
-    return render_template(
+    return stream_page(
         "admin/dashboard.html",
-        bands=Band.query.order_by(Band.name.asc()).all(),
-        albums=Album.query.order_by(Album.title.asc()).all(),
-        events=Event.query.order_by(Event.event_date.asc()).all(),
-        comments=Comment.query.order_by(Comment.created_at.desc()).all(),
-        users=User.query.order_by(User.created_at.desc()).all(),
+        bands=Band.query.order_by(Band.name.asc()),
+        albums=Album.query.order_by(Album.title.asc()),
+        events=Event.query.order_by(Event.event_date.asc()),
+        comments=Comment.query.options(joinedload(Comment.user)).order_by(Comment.created_at.desc()),
+        users=User.query.order_by(User.created_at.desc()),
+        search_stats=search_index.stats(),
     )
 
 
@@ -40,10 +50,11 @@ def dashboard():
 @admin_required
 def create_band():
     form = BandForm()
+    form.country_id.choices = lookup_choices(Country, "Choose a country")
     if form.validate_on_submit():
         band = Band(
             name=form.name.data,
-            country=form.country.data,
+            country_id=lookups.resolve(Country, form.country_id.data, form.new_country.data),
             formed_year=form.formed_year.data,
             description=form.description.data,
             image_url=form.image_url.data or None,
@@ -60,8 +71,12 @@ def create_band():
 def edit_band(band_id):
     band = Band.query.get_or_404(band_id)
     form = BandForm(obj=band)
+    form.country_id.choices = lookup_choices(Country, "Choose a country")
     if form.validate_on_submit():
-        form.populate_obj(band)
+        band.name = form.name.data
+        band.country_id = lookups.resolve(Country, form.country_id.data, form.new_country.data)
+        band.formed_year = form.formed_year.data
+        band.description = form.description.data
         band.image_url = form.image_url.data or None
         db.session.commit()
         flash("Band updated.", "success")
@@ -84,12 +99,13 @@ def delete_band(band_id):
 def create_album():
     form = AlbumForm()
     form.band_id.choices = [(band.id, band.name) for band in Band.query.order_by(Band.name.asc())]
+    form.genre_id.choices = lookup_choices(Genre, "Choose a genre")
     if form.validate_on_submit():
         album = Album(
             band_id=form.band_id.data,
             title=form.title.data,
             release_year=form.release_year.data,
-            genre=form.genre.data,
+            genre_id=lookups.resolve(Genre, form.genre_id.data, form.new_genre.data),
             cover_url=form.cover_url.data or None,
             description=form.description.data,
         )
@@ -106,11 +122,12 @@ def edit_album(album_id):
     album = Album.query.get_or_404(album_id)
     form = AlbumForm(obj=album)
     form.band_id.choices = [(band.id, band.name) for band in Band.query.order_by(Band.name.asc())]
+    form.genre_id.choices = lookup_choices(Genre, "Choose a genre")
     if form.validate_on_submit():
         album.band_id = form.band_id.data
         album.title = form.title.data
         album.release_year = form.release_year.data
-        album.genre = form.genre.data
+        album.genre_id = lookups.resolve(Genre, form.genre_id.data, form.new_genre.data)
         album.cover_url = form.cover_url.data or None
         album.description = form.description.data
         db.session.commit()
@@ -141,6 +158,8 @@ def create_event():
             event_date=form.event_date.data,
             description=form.description.data,
             link_url=form.link_url.data or None,
+            latitude=form.latitude.data,
+            longitude=form.longitude.data,
         )
         db.session.add(event)
         db.session.commit()
@@ -178,11 +197,71 @@ def delete_event(event_id):
 def toggle_comment(comment_id):
     comment = Comment.query.get_or_404(comment_id)
     comment.is_hidden = not comment.is_hidden
+    if comment.is_hidden:
+        # Hiding a restored comment again makes it due for archiving again.
+        comment.restored_from = None
     db.session.commit()
     flash("Comment visibility updated.", "success")
     return redirect(url_for("admin.dashboard"))
 
 
+@admin_bp.route("/archive")
+@admin_required
+def comment_archive():
+    totals = db.session.execute(
+        select(
+            func.count(CommentArchive.id),
+            func.coalesce(func.sum(CommentArchive.comment_count), 0),
+            func.coalesce(func.sum(CommentArchive.raw_bytes), 0),
+            func.coalesce(func.sum(CommentArchive.stored_bytes), 0),
+        )
+    ).one()
+    batches = (
+        CommentArchive.query.options(defer(CommentArchive.payload))
+        .order_by(CommentArchive.archived_at.desc(), CommentArchive.id.desc())
+        .limit(100)
+    )
+    return render_template("admin/archive.html", batches=batches, totals=totals)
+
+
+@admin_bp.route("/archive/run", methods=["POST"])
+@admin_required
+def run_archive():
+    report = archive.archive_comments()
+    if report["comments"]:
+        flash(
+            f"Archived {report['comments']} comments; "
+            f"{report['raw_bytes']} bytes stored as {report['stored_bytes']}.",
+            "success",
+        )
+    else:
+        flash("No comments were due for archival.", "info")
+    return redirect(url_for("admin.comment_archive"))
+
+
+@admin_bp.route("/archive/<int:archive_id>")
+@admin_required
+def archive_detail(archive_id):
+    batch = CommentArchive.query.get_or_404(archive_id)
+    return render_template("admin/archive_detail.html", batch=batch, comments=archive.load(batch))
+
+
+@admin_bp.route("/archive/<int:archive_id>/restore", methods=["POST"])
+@admin_required
+def restore_archive(archive_id):
+    batch = CommentArchive.query.get_or_404(archive_id)
+    restored, skipped = archive.restore(batch)
+    if skipped:
+        flash(
+            f"Restored {restored} comments. {skipped} comments by deleted users could not be "
+            "restored and were kept in this archive batch.",
+            "warning",
+        )
+    else:
+        flash(f"Restored {restored} comments.", "success")
+    return redirect(url_for("admin.comment_archive"))
+
+
 @admin_bp.route("/users/<int:user_id>/toggle-admin", methods=["POST"])
 @admin_required
 def toggle_admin(user_id):
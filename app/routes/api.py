@@ -0,0 +1,427 @@
+import json
+import time
+from functools import wraps
+
+from flask import Blueprint, abort, current_app, jsonify, request, url_for
+from flask_login import current_user
+from sqlalchemy import delete, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .. import availability, catalog, feed, profiles, trending
+from ..extensions import db
+from ..models import (
+    Album,
+    Band,
+    Comment,
+    FavoriteAlbum,
+    FavoriteBand,
+    Playlist,
+    PlaylistItem,
+    User,
+)
+from ..playlists import add_item, key_between, move_item, ordered_items
+from ..pubsub import TooManySubscribers, pubsub
+from ..search_index import KINDS, index as search_index
+
+
+api_bp = Blueprint("api", __name__)
+
+FAVORITE_MODELS = {
+    "band": (FavoriteBand, FavoriteBand.band_id, Band),
+    "album": (FavoriteAlbum, FavoriteAlbum.album_id, Album),
+}
+FAVORITE_ACTIONS = {"add", "remove", "toggle"}
+COMMENT_TARGETS = {"band", "album", "event"}
+MAX_BATCH_SIZE = 200
+MAX_AUTOCOMPLETE_RESULTS = 20
+MAX_POLLED_COMMENTS = 50
+
+
+def api_login_required(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return jsonify(error="Authentication required."), 401
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def insert_ignore(model):
+    dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+@api_bp.route("/me/batch", methods=["POST"])
+@api_login_required
+def batch():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify(error="Expected a JSON object."), 400
+    try:
+        favorites = _parse_favorites(payload.get("favorites", []))
+        additions = _parse_items(payload.get("playlist_items", []), ("playlist_id", "album_id"))
+        reorders = _parse_items(payload.get("reorders", []), ("item_id",))
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+
+    for kind, actions in favorites.items():
+        _apply_favorites(kind, actions)
+    touched = _add_playlist_items(additions) | _reorder_playlist_items(reorders)
+    db.session.commit()
+    profiles.invalidate_summary(current_user.id)
+    if favorites:
+        feed.invalidate(current_user.id)
+    return jsonify(_state(touched))
+
+
+def _parse_favorites(entries):
+    if not isinstance(entries, list) or len(entries) > MAX_BATCH_SIZE:
+        raise ValueError(f"'favorites' must be a list of at most {MAX_BATCH_SIZE} entries.")
+    requested = {}
+    for entry in entries:
+        if (
+            not isinstance(entry, dict)
+            or entry.get("type") not in FAVORITE_MODELS
+            or entry.get("action", "toggle") not in FAVORITE_ACTIONS
+            or not isinstance(entry.get("id"), int)
+        ):
+            raise ValueError("Each favorite needs a 'type', an integer 'id' and a valid 'action'.")
+        key, action = (entry["type"], entry["id"]), entry.get("action", "toggle")
+        previous, count = requested.get(key, (action, 0))
+        if previous != action:
+            raise ValueError(f"Conflicting actions for {entry['type']} {entry['id']}.")
+        requested[key] = (action, count + 1)
+    favorites = {kind: {action: set() for action in FAVORITE_ACTIONS} for kind in FAVORITE_MODELS}
+    for (kind, entity_id), (action, count) in requested.items():
+        # A double-click batched together toggles twice and changes nothing.
+        if action != "toggle" or count % 2:
+            favorites[kind][action].add(entity_id)
+    return favorites
+
+
+def _parse_items(entries, fields):
+    if not isinstance(entries, list) or len(entries) > MAX_BATCH_SIZE:
+        raise ValueError(f"Batches are limited to {MAX_BATCH_SIZE} entries per list.")
+    parsed = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not all(isinstance(entry.get(f), int) for f in fields):
+            raise ValueError(f"Each entry needs integer {', '.join(fields)}.")
+        for optional in ("position", "after_id"):
+            if entry.get(optional) is not None and not isinstance(entry[optional], int):
+                raise ValueError(f"'{optional}' must be an integer or null.")
+        parsed.append(entry)
+    return parsed
+
+
+def _apply_favorites(kind, actions):
+    model, column, target = FAVORITE_MODELS[kind]
+    owned = model.user_id == current_user.id
+    if actions["toggle"]:
+        result = db.session.execute(
+            delete(model).where(owned, column.in_(actions["toggle"])).returning(column)
+        )
+        toggled_off = set(result.scalars())
+        added = actions["add"] | (actions["toggle"] - toggled_off)
+    else:
+        added = actions["add"]
+    if actions["remove"]:
+        db.session.execute(delete(model).where(owned, column.in_(actions["remove"])))
+    if added:
+        rows = select(literal(current_user.id), target.id).where(target.id.in_(added))
+        inserted = db.session.scalars(
+            insert_ignore(model)
+            .from_select(["user_id", column.key], rows)
+            .on_conflict_do_nothing(index_elements=["user_id", column.key])
+            .returning(column)
+        )
+        trending.record(*((kind, entity_id, "favorite") for entity_id in inserted))
+
+
+def _owned_playlist_ids(playlist_ids):
+    if not playlist_ids:
+        return set()
+    return set(
+        db.session.scalars(
+            select(Playlist.id).where(
+                Playlist.user_id == current_user.id, Playlist.id.in_(playlist_ids)
+            )
+        )
+    )
+
+
+def _add_playlist_items(additions):
+    playlist_ids = _owned_playlist_ids({entry["playlist_id"] for entry in additions})
+    album_ids = {entry["album_id"] for entry in additions}
+    if album_ids:
+        album_ids = set(db.session.scalars(select(Album.id).where(Album.id.in_(album_ids))))
+    additions = [
+        entry
+        for entry in additions
+        if entry["playlist_id"] in playlist_ids and entry["album_id"] in album_ids
+    ]
+    last_ranks = dict(
+        db.session.execute(
+            select(PlaylistItem.playlist_id, db.func.max(PlaylistItem.rank))
+            .where(PlaylistItem.playlist_id.in_(playlist_ids))
+            .group_by(PlaylistItem.playlist_id)
+        ).all()
+    )
+    rows = []
+    for entry in additions:
+        playlist_id = entry["playlist_id"]
+        if entry.get("position") is not None:
+            # Appends queued so far go in first, so the positioned item is
+            # ranked against them and the batch keeps its request order. The
+            # last rank is read again since placing it may rebalance.
+            _insert_playlist_rows(rows)
+            rows = []
+            add_item(playlist_id, entry["album_id"], entry["position"])
+            last_ranks[playlist_id] = db.session.scalar(
+                select(db.func.max(PlaylistItem.rank)).where(
+                    PlaylistItem.playlist_id == playlist_id
+                )
+            )
+            continue
+        rank = key_between(last_ranks.get(playlist_id) or "", None)
+        last_ranks[playlist_id] = rank
+        rows.append({"playlist_id": playlist_id, "album_id": entry["album_id"], "rank": rank})
+    _insert_playlist_rows(rows)
+    return {entry["playlist_id"] for entry in additions}
+
+
+def _insert_playlist_rows(rows):
+    if rows:
+        db.session.execute(PlaylistItem.__table__.insert(), rows)
+        trending.record(*(("album", row["album_id"], "playlist") for row in rows))
+
+
+def _reorder_playlist_items(reorders):
+    if not reorders:
+        return set()
+    owned = {
+        item.id: item
+        for item in db.session.scalars(
+            select(PlaylistItem)
+            .join(Playlist)
+            .where(
+                Playlist.user_id == current_user.id,
+                PlaylistItem.id.in_({entry["item_id"] for entry in reorders}),
+            )
+        )
+    }
+    touched = set()
+    for entry in reorders:
+        item = owned.get(entry["item_id"])
+        if item is not None and move_item(item, entry.get("after_id")):
+            touched.add(item.playlist_id)
+    return touched
+
+
+def _state(playlist_ids):
+    state = {
+        "favorite_bands": sorted(
+            db.session.scalars(
+                select(FavoriteBand.band_id).where(FavoriteBand.user_id == current_user.id)
+            )
+        ),
+        "favorite_albums": sorted(
+            db.session.scalars(
+                select(FavoriteAlbum.album_id).where(FavoriteAlbum.user_id == current_user.id)
+            )
+        ),
+        "playlists": {},
+    }
+    if playlist_ids:
+        items = db.session.scalars(
+            select(PlaylistItem)
+            .where(PlaylistItem.playlist_id.in_(playlist_ids))
+            .order_by(PlaylistItem.playlist_id, PlaylistItem.rank, PlaylistItem.id)
+        )
+        for item in items:
+            state["playlists"].setdefault(str(item.playlist_id), []).append(
+                {"id": item.id, "album_id": item.album_id, "rank": item.rank}
+            )
+    return state
+
+
+@api_bp.route("/playlists/<int:playlist_id>")
+@api_login_required
+def playlist_items(playlist_id):
+    playlist = Playlist.query.filter_by(id=playlist_id, user_id=current_user.id).first_or_404()
+    items = []
+    for item, album, band in ordered_items(playlist.id):
+        items.append(
+            {
+                "id": item.id,
+                "rank": item.rank,
+                "track_name": item.track_name,
+                "album": album
+                and {
+                    "id": album.id,
+                    "title": album.title,
+                    "release_year": album.release_year,
+                    "cover_url": album.cover_url,
+                    "band": band.name,
+                },
+            }
+        )
+    return jsonify(id=playlist.id, name=playlist.name, items=items)
+
+
+@api_bp.route("/playlists/<int:playlist_id>/items/<int:item_id>/move", methods=["POST"])
+@api_login_required
+def move_playlist_item(playlist_id, item_id):
+    item = (
+        PlaylistItem.query.join(Playlist)
+        .filter(
+            PlaylistItem.id == item_id,
+            Playlist.id == playlist_id,
+            Playlist.user_id == current_user.id,
+        )
+        .first_or_404()
+    )
+    payload = request.get_json(silent=True) or {}
+    after_id = payload.get("after_id")
+    if after_id is not None and not isinstance(after_id, int):
+        return jsonify(error="'after_id' must be an integer or null."), 400
+    if not move_item(item, after_id):
+        return jsonify(error="'after_id' is not in this playlist."), 400
+    db.session.commit()
+    return jsonify(id=item.id, rank=item.rank)
+
+
+@api_bp.route("/autocomplete")
+def autocomplete():
+    kind = request.args.get("kind") or None
+    if kind is not None and kind not in KINDS:
+        return jsonify(error=f"Unknown kind: {kind}."), 400
+    limit = min(request.args.get("limit", 10, type=int), MAX_AUTOCOMPLETE_RESULTS)
+    results = search_index.search(request.args.get("q", ""), kind=kind, limit=max(limit, 1))
+    for result in results:
+        if result["kind"] == "band":
+            result["url"] = url_for("public.band_detail", band_id=result["id"])
+        elif result["kind"] == "album":
+            result["url"] = url_for("public.album_detail", album_id=result["id"])
+    return jsonify(results=results)
+
+
+@api_bp.route("/availability")
+def check_availability():
+    values = {
+        field: request.args[field].strip()
+        for field in availability.FIELDS
+        if request.args.get(field, "").strip()
+    }
+    if not values:
+        return jsonify(error="Pass a username or email to check."), 400
+    if not availability.allow(request.remote_addr):
+        response = jsonify(error="Too many checks, try again in a minute.")
+        response.status_code = 429
+        response.headers["Retry-After"] = "60"
+        return response
+    return jsonify(
+        {field: availability.is_available(field, value) for field, value in values.items()}
+    )
+
+
+@api_bp.route("/comments/<target_type>/<int:target_id>")
+def comment_poll(target_type, target_id):
+    # The polling fallback for pages that cannot hold a stream open.
+    if target_type not in COMMENT_TARGETS:
+        abort(404)
+    rows = db.session.execute(
+        select(Comment, User.username)
+        .join(User, User.id == Comment.user_id)
+        .where(Comment.target_type == target_type, Comment.target_id == target_id)
+        .where(Comment.is_hidden.is_(False), Comment.id > request.args.get("after", 0, type=int))
+        .order_by(Comment.id)
+        .limit(MAX_POLLED_COMMENTS)
+    ).all()
+    return jsonify(
+        comments=[
+            {
+                "id": comment.id,
+                "key": comment.key,
+                "username": username,
+                "body": comment.body,
+                "created_at": comment.created_at.strftime("%b %d, %Y"),
+            }
+            for comment, username in rows
+        ]
+    )
+
+
+@api_bp.route("/catalog/changes")
+def catalog_changes():
+    return jsonify(changed_at=catalog.last_change())
+
+
+@api_bp.route("/stream/comments/<target_type>/<int:target_id>")
+def comment_stream(target_type, target_id):
+    return _event_stream(comment_channels(target_type, target_id))
+
+
+@api_bp.route("/stream/catalog")
+def catalog_stream():
+    return _event_stream(catalog_channels())
+
+
+def comment_channels(target_type, target_id):
+    if target_type not in COMMENT_TARGETS:
+        abort(404)
+    return [f"comments:{target_type}:{target_id}"]
+
+
+def catalog_channels():
+    return ["catalog"]
+
+
+# Used by the ASGI entry point too, which serves these streams on its loop.
+STREAM_CHANNELS = {"api.comment_stream": comment_channels, "api.catalog_stream": catalog_channels}
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def event_message(channel, data):
+    return f"event: {channel.split(':')[0]}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_refused():
+    response = jsonify(error="Too many live connections, try again shortly.")
+    response.status_code = 503
+    response.headers["Retry-After"] = str(current_app.config["SSE_HEARTBEAT_INTERVAL"])
+    return response
+
+
+def _event_stream(channels):
+    config = current_app.config
+    try:
+        # A single-threaded worker would be tied up for the whole stream,
+        # so streams are refused there and pages fall back to polling.
+        if not request.environ.get("wsgi.multithread"):
+            raise TooManySubscribers()
+        subscription = pubsub.subscribe(channels, request.remote_addr)
+    except TooManySubscribers:
+        return stream_refused()
+    heartbeat = config["SSE_HEARTBEAT_INTERVAL"]
+    deadline = time.monotonic() + config["SSE_MAX_DURATION"]
+
+    def generate():
+        try:
+            yield f"retry: {heartbeat * 1000}\n\n"
+            # Connections are recycled so a worker thread is never pinned
+            # forever; EventSource reconnects on its own.
+            while time.monotonic() < deadline:
+                message = subscription.get(timeout=heartbeat)
+                if message is None:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield event_message(*message)
+        finally:
+            subscription.close()
+
+    return current_app.response_class(
+        generate(),
+        mimetype="text/event-stream",
+        headers=STREAM_HEADERS,
+    )
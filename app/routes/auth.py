@@ -1,9 +1,12 @@
 from flask import Blueprint, render_template, redirect, url_for, flash
 from flask_login import login_user, logout_user, current_user
+from sqlalchemy.exc import IntegrityError
 
+from .. import availability
 from ..extensions import db
 from ..forms import RegisterForm, LoginForm
 from ..models import User
+from ..sessions import regenerate_session
 
 
 auth_bp = Blueprint("auth", __name__)
@@ -15,12 +18,6 @@ def register():
         return redirect(url_for("public.home"))
     form = RegisterForm()
     if form.validate_on_submit():
-        if User.query.filter_by(email=form.email.data.lower()).first():
-            flash("Email already registered.", "warning")
-            return redirect(url_for("auth.register"))
-        if User.query.filter_by(username=form.username.data).first():
-            flash("Username already taken.", "warning")
-            return redirect(url_for("auth.register"))
         user = User(
             username=form.username.data,
             email=form.email.data.lower(),
@@ -28,7 +25,18 @@ def register():
         )
         user.set_password(form.password.data)
         db.session.add(user)
-        db.session.commit()
+        # The unique indexes decide; checking first would still race with
+        # a concurrent registration of the same name.
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            if availability.taken("email", user.email):
+                flash("Email already registered.", "warning")
+            else:
+                flash("Username already taken.", "warning")
+            return redirect(url_for("auth.register"))
+        availability.registered(username=user.username, email=user.email)
         flash("Account created. Please log in.", "success")
         return redirect(url_for("auth.login"))
     return render_template("auth/register.html", form=form)
@@ -42,6 +50,7 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data.lower()).first()
         if user and user.check_password(form.password.data):
+            regenerate_session()
             login_user(user)
             flash("Welcome back!", "success")
             return redirect(url_for("public.home"))
@@ -52,5 +61,6 @@ def login():
 @auth_bp.route("/logout")
 def logout():
     logout_user()
+    regenerate_session()
     flash("You have been logged out.", "info")
     return redirect(url_for("public.home"))
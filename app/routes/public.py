@@ -1,9 +1,23 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from datetime import date, timedelta
+
+from flask import (
+    Blueprint,
+    abort,
+    current_app,
+    render_template,
+    request,
+    redirect,
+    url_for,
+    flash,
+)
 from flask_login import current_user
+from sqlalchemy.orm import joinedload
 
-from ..extensions import db
+from .. import event_queries, facets, snapshot, syndication, trending
+from ..comments import CommentRejected, ingestor, merge_pending
 from ..models import Band, Album, Event, Comment, FavoriteBand, FavoriteAlbum
 from ..forms import BandSearchForm, AlbumSearchForm, EventSearchForm, CommentForm, AddToPlaylistForm
+from ..rendering import stream_page
 
 
 public_bp = Blueprint("public", __name__)
@@ -11,13 +25,31 @@ public_bp = Blueprint("public", __name__)
 
 @public_bp.route("/")
 def home():
-    featured_bands = Band.query.order_by(Band.created_at.desc()).limit(4).all()
-    featured_albums = Album.query.order_by(Album.release_year.desc()).limit(6).all()
-    events = Event.query.order_by(Event.event_date.asc()).limit(3).all()
+    catalog = snapshot.current()
+    if catalog is not None:
+        trending_bands = _snapshot_rows(catalog.band, trending.top_ids("band", 4))
+        trending_albums = _snapshot_rows(catalog.album, trending.top_ids("album", 6))
+        featured_bands = trending_bands or list(catalog.bands("newest", 4))
+        featured_albums = trending_albums or list(catalog.albums("by_year", 6))
+        events = catalog.upcoming_events(3)
+    else:
+        trending_bands = trending.top(Band, 4)
+        trending_albums = trending.top(Album, 6)
+        featured_bands = (
+            trending_bands
+            or Band.query.order_by(Band.created_at.desc(), Band.id.desc()).limit(4).all()
+        )
+        featured_albums = (
+            trending_albums
+            or Album.query.order_by(Album.release_year.desc(), Album.id.desc()).limit(6).all()
+        )
+        events = event_queries.upcoming(3)
     return render_template(
         "pages/home.html",
         featured_bands=featured_bands,
         featured_albums=featured_albums,
+        bands_trending=bool(trending_bands),
+        albums_trending=bool(trending_albums),
         events=events,
     )
 
@@ -25,39 +57,33 @@ def home():
 @public_bp.route("/bands")
 def bands():
     form = BandSearchForm(request.args, meta={"csrf": False})
+    catalog = _unfiltered_snapshot()
+    if catalog is not None:
+        return stream_page(
+            "pages/bands.html",
+            bands=catalog.bands("by_name"),
+            form=form,
+            facet_counts=catalog.facet_counts("country", "formed"),
+        )
     query = Band.query
     if form.validate():
         if form.query.data:
             query = query.filter(Band.name.ilike(f"%{form.query.data}%"))
-        if form.country.data:
-            query = query.filter(Band.country.ilike(f"%{form.country.data}%"))
-    bands_list = query.order_by(Band.name.asc()).all()
-    return render_template("pages/bands.html", bands=bands_list, form=form)
+        query = facets.apply(query, country=form.country.data, formed=form.formed.data)
+    return stream_page(
+        "pages/bands.html",
+        bands=query.order_by(Band.name.asc()),
+        form=form,
+        facet_counts=facets.counts("country", "formed"),
+    )
 
 
 @public_bp.route("/bands/<int:band_id>", methods=["GET", "POST"])
 def band_detail(band_id):
-    band = Band.query.get_or_404(band_id)
-    comments = (
-        Comment.query.filter_by(target_type="band", target_id=band.id, is_hidden=False)
-        .order_by(Comment.created_at.desc())
-        .all()
-    )
-    form = CommentForm()
-    if form.validate_on_submit():
-        if not current_user.is_authenticated:
-            flash("Please log in to comment.", "warning")
-            return redirect(url_for("auth.login"))
-        comment = Comment(
-            user_id=current_user.id,
-            target_type="band",
-            target_id=band.id,
-            body=form.body.data,
-        )
-        db.session.add(comment)
-        db.session.commit()
-        flash("Comment posted.", "success")
-        return redirect(url_for("public.band_detail", band_id=band.id))
+    band = _get_or_404(Band, "band", band_id)
+    form = _comment_form()
+    if _wants_comment(form):
+        return _post_comment(form, "band", band.id, url_for("public.band_detail", band_id=band.id))
     is_favorite = False
     if current_user.is_authenticated:
         is_favorite = (
@@ -67,7 +93,7 @@ def band_detail(band_id):
     return render_template(
         "pages/band_detail.html",
         band=band,
-        comments=comments,
+        comments=_comments_for("band", band.id),
         form=form,
         is_favorite=is_favorite,
     )
@@ -76,44 +102,42 @@ def band_detail(band_id):
 @public_bp.route("/albums")
 def albums():
     form = AlbumSearchForm(request.args, meta={"csrf": False})
+    catalog = _unfiltered_snapshot()
+    if catalog is not None:
+        return stream_page(
+            "pages/albums.html",
+            albums=catalog.albums("by_year"),
+            form=form,
+            facet_counts=catalog.facet_counts("genre", "decade"),
+        )
     query = Album.query
     if form.validate():
         if form.query.data:
             query = query.filter(Album.title.ilike(f"%{form.query.data}%"))
-        if form.genre.data:
-            query = query.filter(Album.genre.ilike(f"%{form.genre.data}%"))
-    albums_list = query.order_by(Album.release_year.desc()).all()
-    return render_template("pages/albums.html", albums=albums_list, form=form)
+        query = facets.apply(query, genre=form.genre.data, decade=form.decade.data)
+    albums_list = query.options(joinedload(Album.band)).order_by(Album.release_year.desc())
+    return stream_page(
+        "pages/albums.html",
+        albums=albums_list,
+        form=form,
+        facet_counts=facets.counts("genre", "decade"),
+    )
 
 
 @public_bp.route("/albums/<int:album_id>", methods=["GET", "POST"])
 def album_detail(album_id):
-    album = Album.query.get_or_404(album_id)
-    comments = (
-        Comment.query.filter_by(target_type="album", target_id=album.id, is_hidden=False)
-        .order_by(Comment.created_at.desc())
-        .all()
-    )
-    form = CommentForm()
-    playlist_form = AddToPlaylistForm()
+    album = _get_or_404(Album, "album", album_id)
+    form = _comment_form()
+    playlist_form = None
     if current_user.is_authenticated:
+        playlist_form = AddToPlaylistForm()
         playlist_form.playlist_id.choices = [
             (playlist.id, playlist.name) for playlist in current_user.playlists
         ]
-    if form.validate_on_submit():
-        if not current_user.is_authenticated:
-            flash("Please log in to comment.", "warning")
-            return redirect(url_for("auth.login"))
-        comment = Comment(
-            user_id=current_user.id,
-            target_type="album",
-            target_id=album.id,
-            body=form.body.data,
+    if _wants_comment(form):
+        return _post_comment(
+            form, "album", album.id, url_for("public.album_detail", album_id=album.id)
         )
-        db.session.add(comment)
-        db.session.commit()
-        flash("Comment posted.", "success")
-        return redirect(url_for("public.album_detail", album_id=album.id))
     is_favorite = False
     if current_user.is_authenticated:
         is_favorite = (
@@ -123,7 +147,7 @@ def album_detail(album_id):
     return render_template(
         "pages/album_detail.html",
         album=album,
-        comments=comments,
+        comments=_comments_for("album", album.id),
         form=form,
         playlist_form=playlist_form,
         is_favorite=is_favorite,
@@ -133,37 +157,190 @@ def album_detail(album_id):
 @public_bp.route("/events", methods=["GET"])
 def events():
     form = EventSearchForm(request.args, meta={"csrf": False})
-    query = Event.query
-    if form.validate():
-        if form.city.data:
-            query = query.filter(Event.city.ilike(f"%{form.city.data}%"))
-        if form.after_date.data:
-            query = query.filter(Event.event_date >= form.after_date.data)
-    events_list = query.order_by(Event.event_date.asc()).all()
-    return render_template("pages/events.html", events=events_list, form=form)
+    page_size = current_app.config["EVENTS_PAGE_SIZE"]
+    if not form.validate():
+        return stream_page("pages/events.html", events=[], form=form, next_cursor=None)
+    catalog = _unfiltered_snapshot()
+    if catalog is not None:
+        events_list = catalog.upcoming_events(page_size + 1)
+        next_cursor = None
+        if len(events_list) > page_size:
+            events_list = events_list[:page_size]
+            next_cursor = event_queries.encode_cursor(events_list[-1])
+        return stream_page(
+            "pages/events.html", events=events_list, form=form, next_cursor=next_cursor
+        )
+    if form.near.data:
+        center = event_queries.city_coordinates(form.near.data)
+        if center is None:
+            flash(f"We don't know where {form.near.data} is yet.", "warning")
+            results = []
+        else:
+            results = event_queries.nearest(
+                *center,
+                radius_km=form.radius.data or current_app.config["EVENTS_DEFAULT_RADIUS_KM"],
+                limit=page_size,
+                include_past=form.include_past.data,
+            )
+        return stream_page(
+            "pages/events.html",
+            events=[event for _, event in results],
+            distances={event.id: distance for distance, event in results},
+            form=form,
+            next_cursor=None,
+        )
+    events_list = event_queries.search(
+        city=form.city.data,
+        start=form.after_date.data,
+        end=form.before_date.data,
+        include_past=form.include_past.data,
+        cursor=event_queries.decode_cursor(request.args.get("cursor")),
+    ).limit(page_size + 1).all()
+    next_cursor = None
+    if len(events_list) > page_size:
+        events_list = events_list[:page_size]
+        next_cursor = event_queries.encode_cursor(events_list[-1])
+    return stream_page(
+        "pages/events.html", events=events_list, form=form, next_cursor=next_cursor
+    )
+
+
+@public_bp.route("/events/calendar")
+def events_calendar():
+    today = date.today()
+    try:
+        if "week" in request.args:
+            anchor = date.fromisoformat(request.args["week"])
+            weeks = event_queries.week_days(anchor)
+            previous = {"week": (anchor - timedelta(days=7)).isoformat()}
+            following = {"week": (anchor + timedelta(days=7)).isoformat()}
+        else:
+            anchor = date.fromisoformat(request.args.get("month", today.strftime("%Y-%m")) + "-01")
+            weeks = event_queries.month_weeks(anchor.year, anchor.month)
+            previous = {"month": (anchor - timedelta(days=1)).strftime("%Y-%m")}
+            following = {"month": (anchor + timedelta(days=32)).strftime("%Y-%m")}
+    except (ValueError, OverflowError):
+        # Malformed dates, and the first and last weeks representable, whose
+        # neighbours are not.
+        return redirect(url_for("public.events_calendar"))
+    return render_template(
+        "pages/events_calendar.html",
+        weeks=weeks,
+        anchor=anchor,
+        view="week" if "week" in request.args else "month",
+        previous=previous,
+        following=following,
+        today=today,
+    )
 
 
 @public_bp.route("/events/<int:event_id>", methods=["GET", "POST"])
 def event_detail(event_id):
-    event = Event.query.get_or_404(event_id)
+    event = _get_or_404(Event, "event", event_id)
+    form = _comment_form()
+    if _wants_comment(form):
+        return _post_comment(
+            form, "event", event.id, url_for("public.event_detail", event_id=event.id)
+        )
+    return render_template(
+        "pages/event_detail.html", event=event, comments=_comments_for("event", event.id), form=form
+    )
+
+
+@public_bp.route("/robots.txt")
+def robots():
+    sitemap = url_for("public.sitemap_index", _external=True)
+    return current_app.response_class(
+        f"User-agent: *\nAllow: /\nSitemap: {sitemap}\n", mimetype="text/plain"
+    )
+
+
+@public_bp.route("/sitemap.xml")
+def sitemap_index():
+    return syndication.sitemap_index()
+
+
+@public_bp.route("/sitemaps/<kind>-<int:shard>.xml")
+def sitemap(kind, shard):
+    if kind not in syndication.SITEMAP_KINDS:
+        abort(404)
+    return syndication.sitemap(kind, shard)
+
+
+@public_bp.route("/feeds/albums.<fmt>")
+def albums_feed(fmt):
+    if fmt not in syndication.FEED_FORMATS:
+        abort(404)
+    return syndication.albums_feed(fmt)
+
+
+@public_bp.route("/feeds/events.<fmt>")
+def events_feed(fmt):
+    if fmt not in syndication.FEED_FORMATS:
+        abort(404)
+    return syndication.events_feed(fmt)
+
+
+@public_bp.route("/bands/<int:band_id>/comments.<fmt>")
+def band_comments_feed(band_id, fmt):
+    if fmt not in syndication.FEED_FORMATS:
+        abort(404)
+    return syndication.band_comments_feed(_get_or_404(Band, "band", band_id), fmt)
+
+
+def _unfiltered_snapshot():
+    # Only the plain listings come from the snapshot; searches, filters and
+    # later pages still query the database.
+    return None if request.args else snapshot.current()
+
+
+def _snapshot_rows(lookup, entity_ids):
+    return [row for row in map(lookup, entity_ids) if row is not None]
+
+
+def _get_or_404(model, kind, entity_id):
+    catalog = snapshot.current()
+    if catalog is None:
+        return model.query.get_or_404(entity_id)
+    entity = getattr(catalog, kind)(entity_id)
+    if entity is None:
+        abort(404)
+    return entity
+
+
+def _comment_form():
+    # Anonymous visitors get a login prompt instead of a form, so their GETs
+    # build no forms and never start a session to hold a CSRF token.
+    return CommentForm() if current_user.is_authenticated else None
+
+
+def _wants_comment(form):
+    if form is None:
+        return request.method == "POST"
+    return form.validate_on_submit()
+
+
+def _comments_for(target_type, target_id):
+    pending = []
+    if current_user.is_authenticated:
+        pending = ingestor.pending_for(current_user.id, target_type, target_id)
     comments = (
-        Comment.query.filter_by(target_type="event", target_id=event.id, is_hidden=False)
+        Comment.query.options(joinedload(Comment.user))
+        .filter_by(target_type=target_type, target_id=target_id, is_hidden=False)
         .order_by(Comment.created_at.desc())
         .all()
     )
-    form = CommentForm()
-    if form.validate_on_submit():
-        if not current_user.is_authenticated:
-            flash("Please log in to comment.", "warning")
-            return redirect(url_for("auth.login"))
-        comment = Comment(
-            user_id=current_user.id,
-            target_type="event",
-            target_id=event.id,
-            body=form.body.data,
-        )
-        db.session.add(comment)
-        db.session.commit()
+    return merge_pending(comments, pending) if pending else comments
+
+
+def _post_comment(form, target_type, target_id, next_url):
+    if not current_user.is_authenticated:
+        flash("Please log in to comment.", "warning")
+        return redirect(url_for("auth.login"))
+    try:
+        ingestor.submit(current_user, target_type, target_id, form.body.data)
+    except CommentRejected as exc:
+        flash(str(exc), "warning")
+    else:
         flash("Comment posted.", "success")
-        return redirect(url_for("public.event_detail", event_id=event.id))
-    return render_template("pages/event_detail.html", event=event, comments=comments, form=form)
+    return redirect(next_url)
@@ -1,9 +1,12 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
 
+from .. import availability, feed, profiles, trending
 from ..extensions import db
-from ..models import FavoriteBand, FavoriteAlbum, Playlist, PlaylistItem, Album, Comment
+from ..models import FavoriteBand, FavoriteAlbum, Playlist, Album, Comment
 from ..forms import PlaylistForm, ProfileForm, AddToPlaylistForm
+from ..playlists import add_item
 
 
 user_bp = Blueprint("user", __name__)
@@ -17,7 +20,13 @@ def profile():
 
     if "update_submit" in request.form and profile_form.validate_on_submit():
         current_user.username = profile_form.username.data
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash("Username already taken.", "warning")
+            return redirect(url_for("user.profile"))
+        availability.registered(username=current_user.username)
         flash("Profile updated.", "success")
         return redirect(url_for("user.profile"))
 
@@ -25,22 +34,36 @@ def profile():
         playlist = Playlist(user_id=current_user.id, name=playlist_form.name.data)
         db.session.add(playlist)
         db.session.commit()
+        profiles.invalidate_summary(current_user.id)
         flash("Playlist created.", "success")
         return redirect(url_for("user.profile"))
 
-    favorites_bands = [fav.band for fav in current_user.favorite_bands]
-    favorites_albums = [fav.album for fav in current_user.favorite_albums]
-    playlists = current_user.playlists
-    comments = Comment.query.filter_by(user_id=current_user.id).order_by(Comment.created_at.desc()).all()
+    summary = profiles.user_summary(current_user.id)
+    pages = {
+        section: request.args.get(f"{section}_page", 1, type=int)
+        for section in ("bands", "albums", "playlists", "comments")
+    }
+    playlists = profiles.playlists(current_user.id, pages["playlists"], summary["playlists"])
+    feed_items, feed_cursor = feed.page(
+        current_user.id, feed.decode_cursor(request.args.get("feed_cursor"))
+    )
 
     return render_template(
         "user/profile.html",
         playlist_form=playlist_form,
         profile_form=profile_form,
-        favorite_bands=favorites_bands,
-        favorite_albums=favorites_albums,
+        summary=summary,
+        favorite_bands=profiles.favorite_bands(
+            current_user.id, pages["bands"], summary["favorite_bands"]
+        ),
+        favorite_albums=profiles.favorite_albums(
+            current_user.id, pages["albums"], summary["favorite_albums"]
+        ),
         playlists=playlists,
-        comments=comments,
+        playlist_previews=profiles.playlist_previews([p.id for p in playlists.items]),
+        comments=profiles.comments(current_user.id, pages["comments"], summary["comments"]),
+        feed_items=feed_items,
+        feed_cursor=feed_cursor,
     )
 
 
@@ -54,8 +77,11 @@ def toggle_favorite_band(band_id):
         flash("Band removed from favorites.", "info")
     else:
         db.session.add(FavoriteBand(user_id=current_user.id, band_id=band_id))
+        trending.record(("band", band_id, "favorite"))
         db.session.commit()
         flash("Band added to favorites.", "success")
+    profiles.invalidate_summary(current_user.id)
+    feed.invalidate(current_user.id)
     return redirect(request.referrer or url_for("public.bands"))
 
 
@@ -69,8 +95,11 @@ def toggle_favorite_album(album_id):
         flash("Album removed from favorites.", "info")
     else:
         db.session.add(FavoriteAlbum(user_id=current_user.id, album_id=album_id))
+        trending.record(("album", album_id, "favorite"))
         db.session.commit()
         flash("Album added to favorites.", "success")
+    profiles.invalidate_summary(current_user.id)
+    feed.invalidate(current_user.id)
     return redirect(request.referrer or url_for("public.albums"))
 
 
@@ -80,6 +109,7 @@ def delete_playlist(playlist_id):
     playlist = Playlist.query.filter_by(id=playlist_id, user_id=current_user.id).first_or_404()
     db.session.delete(playlist)
     db.session.commit()
+    profiles.invalidate_summary(current_user.id)
     flash("Playlist deleted.", "info")
     return redirect(url_for("user.profile"))
 
@@ -99,9 +129,7 @@ def add_to_playlist(album_id):
     if not playlist:
         flash("Select a valid playlist.", "warning")
         return redirect(request.referrer or url_for("public.album_detail", album_id=album.id))
-    position = form.position.data or 1
-    item = PlaylistItem(playlist_id=playlist.id, album_id=album.id, position=position)
-    db.session.add(item)
+    add_item(playlist.id, album.id, form.position.data)
     db.session.commit()
     flash("Album added to playlist.", "success")
     return redirect(url_for("user.profile"))
@@ -116,5 +144,6 @@ def delete_comment(comment_id):
         return redirect(url_for("user.profile"))
     db.session.delete(comment)
     db.session.commit()
+    profiles.invalidate_summary(comment.user_id)
     flash("Comment deleted.", "info")
     return redirect(request.referrer or url_for("user.profile"))
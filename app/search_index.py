@@ -0,0 +1,173 @@
+import sys
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+from heapq import merge
+
+from sqlalchemy import literal, select
+
+from .extensions import db
+from .models import Album, Band, Country, Event, Genre
+from .pubsub import pubsub
+
+
+KINDS = ("band", "album", "genre", "country", "city")
+SOURCES = {
+    "band": (Band, Band.name, Country, Country.name, "country"),
+    "album": (Album, Album.title, Genre, Genre.name, "genre"),
+    "event": (Event, None, None, Event.city, "city"),
+}
+
+
+def normalize(value):
+    decomposed = unicodedata.normalize("NFKD", value.casefold())
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).split())
+
+
+class PrefixIndex:
+    # Each kind keeps its own sorted list of (key, kind, id, label) tuples; a
+    # prefix query is a bisect plus a scan of at most the matching keys, and
+    # a query without a kind merges the per-kind scans. Every word of a label
+    # gets its own key so "monk" finds "Arctic Monkeys".
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = {kind: [] for kind in KINDS}
+        self._bytes = Counter()
+        self._entities = {}
+        self._values = {kind: Counter() for kind in ("genre", "country", "city")}
+
+    def __len__(self):
+        return sum(len(keys) for keys in self._keys.values())
+
+    def search(self, prefix, kind=None, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        with self._lock:
+            runs = [_matching(self._keys[kind], prefix) for kind in ([kind] if kind else KINDS)]
+            for key, entry_kind, entry_id, label in merge(*runs):
+                if (entry_kind, entry_id, label) in seen:
+                    continue
+                seen.add((entry_kind, entry_id, label))
+                results.append({"kind": entry_kind, "id": entry_id, "label": label})
+                if len(results) >= limit:
+                    break
+        return results
+
+    def rebuild(self):
+        keys = {kind: [] for kind in KINDS}
+        sizes = Counter()
+        entities = {}
+        values = {kind: Counter() for kind in self._values}
+        with db.engine.connect() as connection:
+            for kind in SOURCES:
+                for entity_id, label, value, facet in connection.execute(_source_query(kind)):
+                    entities[(kind, entity_id)] = (label, {facet: value})
+        for (kind, entity_id), (label, facets) in entities.items():
+            if label is not None:
+                entries = _keys_for(kind, entity_id, label)
+                keys[kind].extend(entries)
+                sizes[kind] += _size(entries)
+            for facet, value in facets.items():
+                if value and not values[facet][value]:
+                    entries = _keys_for(facet, None, value)
+                    keys[facet].extend(entries)
+                    sizes[facet] += _size(entries)
+                values[facet][value] += 1
+        for entries in keys.values():
+            entries.sort()
+        with self._lock:
+            self._keys, self._bytes = keys, sizes
+            self._entities, self._values = entities, values
+
+    def refresh(self, kind, entity_id):
+        model = SOURCES[kind][0]
+        with db.engine.connect() as connection:
+            row = connection.execute(_source_query(kind).where(model.id == entity_id)).first()
+        with self._lock:
+            self._remove(kind, entity_id)
+            if row is not None:
+                self._add(kind, entity_id, row.label, {row.facet: row.value})
+
+    def stats(self):
+        # Sizes are kept up to date as keys come and go, so this never walks
+        # the index.
+        with self._lock:
+            lists = sum(sys.getsizeof(keys) for keys in self._keys.values())
+            return {"keys": len(self), "bytes": lists + sum(self._bytes.values())}
+
+    def _add(self, kind, entity_id, label, facets):
+        self._entities[(kind, entity_id)] = (label, facets)
+        if label is not None:
+            self._insert(kind, _keys_for(kind, entity_id, label))
+        for facet, value in facets.items():
+            if value and not self._values[facet][value]:
+                self._insert(facet, _keys_for(facet, None, value))
+            self._values[facet][value] += 1
+
+    def _remove(self, kind, entity_id):
+        label, facets = self._entities.pop((kind, entity_id), (None, {}))
+        if label is not None:
+            self._discard(kind, _keys_for(kind, entity_id, label))
+        for facet, value in facets.items():
+            self._values[facet][value] -= 1
+            if self._values[facet][value] <= 0:
+                del self._values[facet][value]
+                self._discard(facet, _keys_for(facet, None, value))
+
+    def _insert(self, kind, entries):
+        for entry in entries:
+            insort(self._keys[kind], entry)
+        self._bytes[kind] += _size(entries)
+
+    def _discard(self, kind, entries):
+        keys = self._keys[kind]
+        for entry in entries:
+            index = bisect_left(keys, entry)
+            if index < len(keys) and keys[index] == entry:
+                del keys[index]
+        self._bytes[kind] -= _size(entries)
+
+
+def _source_query(kind):
+    model, label, lookup, value, facet = SOURCES[kind]
+    query = select(
+        model.id,
+        (label if label is not None else literal(None)).label("label"),
+        value.label("value"),
+        literal(facet).label("facet"),
+    ).select_from(model)
+    return query if lookup is None else query.join(lookup)
+
+
+def _keys_for(kind, entity_id, label):
+    words = normalize(label).split()
+    return {(" ".join(words[i:]), kind, entity_id, label) for i in range(len(words))}
+
+
+def _matching(keys, prefix):
+    for position in range(bisect_left(keys, (prefix,)), len(keys)):
+        if not keys[position][0].startswith(prefix):
+            return
+        yield keys[position]
+
+
+def _size(entries):
+    # The label string is shared by all of an entity's keys.
+    size = sum(sys.getsizeof(entry) + sys.getsizeof(entry[0]) for entry in entries)
+    return size + (sys.getsizeof(next(iter(entries))[3]) if entries else 0)
+
+
+def _on_catalog_change(message):
+    index.refresh(message["kind"], message["id"])
+
+
+def init_search_index():
+    index.rebuild()
+    pubsub.listen("catalog", _on_catalog_change)
+
+
+index = PrefixIndex()
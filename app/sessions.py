@@ -0,0 +1,234 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask import session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+
+from .extensions import tasks
+
+
+class ServerSession(SessionMixin):
+    # Nothing is read from the store until the session is first used, so
+    # requests that never look at it cost one signature check at most.
+    def __init__(self, interface, sid=None):
+        self.interface = interface
+        self.sid = sid
+        self.expires = None
+        self.modified = False
+        self.accessed = False
+        self._data = None
+
+    @property
+    def new(self):
+        return self.sid is None
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def _load(self):
+        if self._data is None:
+            self.accessed = True
+            record = self.interface.load(self.sid) if self.sid else None
+            if record is None:
+                self.sid = None
+                self._data = {}
+            else:
+                self._data, self.expires = record
+        return self._data
+
+    def regenerate(self):
+        # A fresh id on every sign-in and sign-out, so an id someone planted
+        # in the visitor's browser beforehand is worthless afterwards.
+        self._load()
+        if self.sid is not None:
+            self.interface.store.delete(self.sid)
+            self.sid = None
+        self.modified = True
+
+    def __contains__(self, key):
+        # Flask-Login checks for "_remember" after every request, but only
+        # sets and pops it within one request; an untouched session has none.
+        if self._data is None and key == "_remember":
+            return False
+        return key in self._load()
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._load()[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+
+class MemoryStore:
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        record = self._records.get(sid)
+        if record is None or record[1] <= time.time():
+            return None
+        return record
+
+    def save(self, sid, payload, expires):
+        with self._lock:
+            self._records[sid] = (payload, expires)
+
+    def delete(self, sid):
+        with self._lock:
+            self._records.pop(sid, None)
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            for sid in [sid for sid, record in self._records.items() if record[1] <= now]:
+                del self._records[sid]
+
+
+class SQLiteStore:
+    # A file in the instance folder shared by every worker on the host; kept
+    # out of the main database so session writes never contend with catalog
+    # writes.
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS session"
+            " (id TEXT PRIMARY KEY, payload TEXT NOT NULL, expires REAL NOT NULL)"
+            " WITHOUT ROWID"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS ix_session_expires ON session (expires)")
+
+    def _connection(self):
+        if getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def load(self, sid):
+        return self._connection().execute(
+            "SELECT payload, expires FROM session WHERE id = ? AND expires > ?", (sid, time.time())
+        ).fetchone()
+
+    def save(self, sid, payload, expires):
+        self._connection().execute(
+            "INSERT INTO session (id, payload, expires) VALUES (?, ?, ?)"
+            " ON CONFLICT (id) DO UPDATE SET payload = excluded.payload, expires = excluded.expires",
+            (sid, payload, expires),
+        )
+
+    def delete(self, sid):
+        self._connection().execute("DELETE FROM session WHERE id = ?", (sid,))
+
+    def sweep(self):
+        self._connection().execute("DELETE FROM session WHERE expires <= ?", (time.time(),))
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+        self._signers = {}
+
+    def signer(self, app):
+        signer = self._signers.get(app.secret_key)
+        if signer is None:
+            signer = self._signers[app.secret_key] = Signer(app.secret_key, salt="server-session")
+        return signer
+
+    def load(self, sid):
+        record = self.store.load(sid)
+        if record is None:
+            return None
+        payload, expires = record
+        return self.serializer.loads(payload), expires
+
+    def open_session(self, app, request):
+        value = request.cookies.get(self.get_cookie_name(app))
+        if not value or not app.secret_key:
+            return ServerSession(self)
+        try:
+            return ServerSession(self, self.signer(app).unsign(value).decode())
+        except BadSignature:
+            return ServerSession(self)
+
+    def save_session(self, app, session, response):
+        if not session.loaded:
+            return
+        # Whatever read the session may have rendered differently for a
+        # logged-in visitor, so caches must key on the cookie.
+        response.vary.add("Cookie")
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        # Unchanged sessions are only written again once half their lifetime
+        # has passed, rather than on every request.
+        stale = session.expires is not None and session.expires - now < lifetime / 2
+        if session.sid is not None and not session.modified and not stale:
+            return
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(16)
+        self.store.save(session.sid, self.serializer.dumps(dict(session)), now + lifetime)
+        response.set_cookie(
+            name,
+            self.signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_sessions(app):
+    backend = app.config["SESSION_BACKEND"]
+    if backend == "cookie":
+        return
+    if backend == "memory":
+        store = MemoryStore()
+    elif backend == "sqlite":
+        store = SQLiteStore(
+            app.config["SESSION_SQLITE_PATH"] or os.path.join(app.instance_path, "sessions.db")
+        )
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    app.session_interface = ServerSessionInterface(store)
+    tasks.every(app.config["SESSION_SWEEP_INTERVAL"], store.sweep)
+
+
+def regenerate_session():
+    # Flask's own cookie sessions have no id to replace.
+    regenerate = getattr(session, "regenerate", None)
+    if regenerate is not None:
+        regenerate()
@@ -0,0 +1,413 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import event, select
+
+from . import facets
+from .extensions import db, tasks
+from .models import Album, Band, Country, Event, Genre
+from .pubsub import pubsub
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+MAGIC = b"RMHSNAP1"
+PREFIX = struct.Struct("<8sI")
+WATCHED = (Band, Album, Event, Country, Genre)
+
+# Column kinds: "int" is int64, "date" an int64 day ordinal and "str" an
+# (offset, length) pair of uint32 into the shared, deduplicated string table.
+SCHEMA = {
+    "band": (
+        ("id", "int"),
+        ("name", "str"),
+        ("country_name", "str"),
+        ("formed_year", "int"),
+        ("description", "str"),
+        ("image_url", "str"),
+        ("album_start", "int"),
+        ("album_count", "int"),
+    ),
+    "album": (
+        ("id", "int"),
+        ("band_id", "int"),
+        ("band_name", "str"),
+        ("title", "str"),
+        ("release_year", "int"),
+        ("genre_name", "str"),
+        ("cover_url", "str"),
+        ("description", "str"),
+    ),
+    "event": (
+        ("id", "int"),
+        ("title", "str"),
+        ("venue", "str"),
+        ("city", "str"),
+        ("event_date", "date"),
+        ("description", "str"),
+        ("link_url", "str"),
+    ),
+}
+CODES = {"int": "q", "date": "q", "str": "I"}
+
+_lock = threading.Lock()
+_state = {"path": None, "snapshot": None}
+
+
+class Table:
+    def __init__(self, spec, view, base, strings):
+        self.count = spec["count"]
+        self.strings = strings
+        self.columns = {}
+        # Every kind takes eight bytes a row: one int64 or two uint32.
+        for name, (kind, offset) in spec["columns"].items():
+            column = view[base + offset : base + offset + self.count * 8]
+            self.columns[name] = (kind, column.cast(CODES[kind]))
+        self.orders = {
+            name: view[base + offset : base + offset + self.count * 4].cast("I")
+            for name, offset in spec["orders"].items()
+        }
+
+    def find(self, entity_id):
+        ids = self.columns["id"][1]
+        position = bisect.bisect_left(ids, entity_id)
+        if position < self.count and ids[position] == entity_id:
+            return position
+        return None
+
+    def value(self, name, position):
+        kind, column = self.columns[name]
+        if kind == "str":
+            start, length = column[position * 2], column[position * 2 + 1]
+            return str(self.strings[start : start + length], "utf-8")
+        if kind == "date":
+            return date.fromordinal(column[position])
+        return column[position]
+
+    def row(self, position):
+        return SimpleNamespace(**{name: self.value(name, position) for name in self.columns})
+
+
+class Snapshot:
+    # Every worker maps the same file read-only, so the catalog is held once
+    # in the OS page cache however many processes serve it.
+    def __init__(self, path):
+        with open(path, "rb") as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, length = PREFIX.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        header = json.loads(bytes(view[PREFIX.size : PREFIX.size + length]))
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was built on a {header['byteorder']}-endian machine")
+        base = _align(PREFIX.size + length)
+        start, size = header["strings"]
+        strings = view[base + start : base + start + size]
+        self.version = header["version"]
+        self.built_at = datetime.fromisoformat(header["built_at"])
+        self.size = len(self._mmap)
+        self.facets = header["facets"]
+        self.tables = {
+            name: Table(spec, view, base, strings) for name, spec in header["tables"].items()
+        }
+
+    def bands(self, order="by_name", limit=None):
+        table = self.tables["band"]
+        return (self._band(position) for position in table.orders[order][:limit])
+
+    def albums(self, order="by_year", limit=None):
+        table = self.tables["album"]
+        return (self._album(position) for position in table.orders[order][:limit])
+
+    def upcoming_events(self, limit, today=None):
+        table = self.tables["event"]
+        order = table.orders["by_date"]
+        days = table.columns["event_date"][1]
+        start = bisect.bisect_left(
+            order, (today or date.today()).toordinal(), key=lambda position: days[position]
+        )
+        return [table.row(position) for position in order[start : start + limit]]
+
+    def band(self, band_id):
+        position = self.tables["band"].find(band_id)
+        return None if position is None else self._band(position, albums=True)
+
+    def album(self, album_id):
+        position = self.tables["album"].find(album_id)
+        return None if position is None else self._album(position)
+
+    def event(self, event_id):
+        table = self.tables["event"]
+        position = table.find(event_id)
+        return None if position is None else table.row(position)
+
+    def facet_counts(self, *names):
+        return {name: [tuple(entry) for entry in self.facets[name]] for name in names}
+
+    def _band(self, position, albums=False):
+        row = self.tables["band"].row(position)
+        row.country = SimpleNamespace(name=row.country_name)
+        if albums:
+            order = self.tables["album"].orders["by_band"]
+            row.albums = [
+                self._album(album)
+                for album in order[row.album_start : row.album_start + row.album_count]
+            ]
+        return row
+
+    def _album(self, position):
+        row = self.tables["album"].row(position)
+        row.band = SimpleNamespace(id=row.band_id, name=row.band_name)
+        row.genre = SimpleNamespace(name=row.genre_name)
+        return row
+
+
+def init_snapshot(app):
+    app.cli.add_command(build_command)
+    path = app.config["CATALOG_SNAPSHOT"]
+    if not path:
+        return
+    _state["path"] = path
+    for name, listener in (
+        ("after_flush", _mark_stale),
+        ("after_commit", _schedule_build),
+        ("after_rollback", _discard_stale),
+    ):
+        if not event.contains(db.session, name, listener):
+            event.listen(db.session, name, listener)
+    pubsub.listen("snapshot", _on_published)
+    if not os.path.exists(path):
+        build(path)
+    _swap(path)
+
+
+def current():
+    return _state["snapshot"]
+
+
+def build(path=None):
+    path = path or _state["path"] or current_app.config["CATALOG_SNAPSHOT"]
+    directory = os.path.dirname(os.path.abspath(path))
+    with open(os.path.join(directory, f".{os.path.basename(path)}.lock"), "w") as lock:
+        # Builds are serialised so a slow build that read the database first
+        # can never replace the file written by a later one.
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        with db.engine.connect() as connection:
+            version = time.time_ns()
+            data = _compile(connection, version)
+        handle, temporary = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+        try:
+            with os.fdopen(handle, "wb") as output:
+                output.write(data)
+                output.flush()
+                os.fsync(output.fileno())
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+    pubsub.publish("snapshot", version=version)
+    return version, len(data)
+
+
+def _compile(connection, version):
+    bands = connection.execute(
+        select(
+            Band.id,
+            Band.name,
+            Country.name,
+            Band.formed_year,
+            Band.description,
+            Band.image_url,
+            Band.created_at,
+        )
+        .join(Country, Country.id == Band.country_id)
+        .order_by(Band.id)
+    ).all()
+    albums = connection.execute(
+        select(
+            Album.id,
+            Album.band_id,
+            Band.name,
+            Album.title,
+            Album.release_year,
+            Genre.name,
+            Album.cover_url,
+            Album.description,
+        )
+        .join(Band, Band.id == Album.band_id)
+        .join(Genre, Genre.id == Album.genre_id)
+        .order_by(Album.id)
+    ).all()
+    events = connection.execute(
+        select(
+            Event.id,
+            Event.title,
+            Event.venue,
+            Event.city,
+            Event.event_date,
+            Event.description,
+            Event.link_url,
+        ).order_by(Event.id)
+    ).all()
+
+    by_band = sorted(range(len(albums)), key=lambda i: (albums[i].band_id, albums[i].id))
+    album_ranges = {}
+    for rank, position in enumerate(by_band):
+        start, count = album_ranges.get(albums[position].band_id, (rank, 0))
+        album_ranges[albums[position].band_id] = (start, count + 1)
+    band_rows = [(*row[:6], *album_ranges.get(row.id, (0, 0))) for row in bands]
+    tables = {
+        "band": (
+            band_rows,
+            {
+                "by_name": sorted(range(len(bands)), key=lambda i: (bands[i].name, bands[i].id)),
+                "newest": sorted(
+                    range(len(bands)),
+                    key=lambda i: (bands[i].created_at or datetime.min, bands[i].id),
+                    reverse=True,
+                ),
+            },
+        ),
+        "album": (
+            albums,
+            {
+                "by_band": by_band,
+                "by_year": sorted(
+                    range(len(albums)),
+                    key=lambda i: (albums[i].release_year, albums[i].id),
+                    reverse=True,
+                ),
+            },
+        ),
+        "event": (
+            events,
+            {
+                "by_date": sorted(
+                    range(len(events)), key=lambda i: (events[i].event_date, events[i].id)
+                )
+            },
+        ),
+    }
+
+    strings = {}
+    string_data = bytearray()
+    blob = bytearray()
+
+    def string(value):
+        value = value or ""
+        ref = strings.get(value)
+        if ref is None:
+            encoded = value.encode()
+            ref = strings[value] = (len(string_data), len(encoded))
+            string_data.extend(encoded)
+        return ref
+
+    def add(values):
+        blob.extend(b"\0" * (_align(len(blob)) - len(blob)))
+        offset = len(blob)
+        blob.extend(values.tobytes())
+        return offset
+
+    header = {"tables": {}}
+    for name, (rows, orders) in tables.items():
+        spec = {"count": len(rows), "columns": {}, "orders": {}}
+        for index, (column, kind) in enumerate(SCHEMA[name]):
+            values = array(CODES[kind])
+            for row in rows:
+                if kind == "str":
+                    values.extend(string(row[index]))
+                elif kind == "date":
+                    values.append(row[index].toordinal())
+                else:
+                    values.append(row[index])
+            spec["columns"][column] = (kind, add(values))
+        for order, positions in orders.items():
+            spec["orders"][order] = add(array("I", positions))
+        header["tables"][name] = spec
+    blob.extend(b"\0" * (_align(len(blob)) - len(blob)))
+    header["strings"] = (len(blob), len(string_data))
+    blob.extend(string_data)
+
+    def names(model):
+        return dict(connection.execute(select(model.id, model.name)).all())
+
+    rows = connection.execute(facets.count_query(*facets.FACETS))
+    header.update(
+        version=version,
+        built_at=datetime.utcnow().isoformat(),
+        byteorder=sys.byteorder,
+        facets=facets.label_counts(list(facets.FACETS), rows, names),
+    )
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    prefix = PREFIX.pack(MAGIC, len(encoded)) + encoded
+    return prefix + b"\0" * (_align(len(prefix)) - len(prefix)) + bytes(blob)
+
+
+def _align(size):
+    return (size + 7) & ~7
+
+
+def _swap(path):
+    try:
+        snapshot = Snapshot(path)
+    except (OSError, ValueError):
+        current_app.logger.exception("Could not load catalog snapshot %s", path)
+        return
+    with _lock:
+        # Requests already holding the old snapshot keep reading it; its
+        # mapping is released once the last of them lets go.
+        previous = _state["snapshot"]
+        if previous is None or snapshot.version > previous.version:
+            _state["snapshot"] = snapshot
+
+
+def _on_published(message):
+    snapshot = _state["snapshot"]
+    if _state["path"] and (snapshot is None or message["version"] > snapshot.version):
+        _swap(_state["path"])
+
+
+def _mark_stale(session, flush_context):
+    if any(
+        isinstance(obj, WATCHED) for obj in (*session.new, *session.dirty, *session.deleted)
+    ):
+        session.info["snapshot_stale"] = True
+
+
+def _schedule_build(session):
+    if session.info.pop("snapshot_stale", False) and _state["path"]:
+        tasks.submit(build, key="catalog-snapshot")
+
+
+def _discard_stale(session):
+    session.info.pop("snapshot_stale", None)
+
+
+@click.command("build-snapshot", help="Compile the public catalog into a memory-mapped snapshot.")
+@click.option("--path", help="Where to write the snapshot; defaults to CATALOG_SNAPSHOT.")
+@with_appcontext
+def build_command(path):
+    path = path or current_app.config["CATALOG_SNAPSHOT"]
+    if not path:
+        raise click.UsageError("Set CATALOG_SNAPSHOT or pass --path.")
+    version, size = build(path)
+    click.echo(f"Wrote snapshot {version} to {path} ({size} bytes).")
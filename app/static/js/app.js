@@ -0,0 +1,301 @@
+(function () {
+  "use strict";
+
+  var pending = [];
+  var timer = null;
+  var csrfToken = null;
+
+  function favoriteForms() {
+    return document.querySelectorAll("form[data-favorite-type]");
+  }
+
+  function render(state) {
+    favoriteForms().forEach(function (form) {
+      var ids = state["favorite_" + form.dataset.favoriteType + "s"] || [];
+      var active = ids.indexOf(Number(form.dataset.favoriteId)) !== -1;
+      form.querySelector("button").textContent = active ? "Remove from favorites" : "Add to favorites";
+    });
+  }
+
+  function flush() {
+    var batch = pending;
+    pending = [];
+    timer = null;
+    fetch("/api/me/batch", {
+      method: "POST",
+      credentials: "same-origin",
+      headers: { "Content-Type": "application/json", "X-CSRFToken": csrfToken },
+      body: JSON.stringify({ favorites: batch }),
+    })
+      .then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.statusText);
+        }
+        return response.json();
+      })
+      .then(render)
+      .catch(function () {
+        window.location.reload();
+      });
+  }
+
+  favoriteForms().forEach(function (form) {
+    form.addEventListener("submit", function (event) {
+      event.preventDefault();
+      csrfToken = form.querySelector("input[name=csrf_token]").value;
+      pending.push({ type: form.dataset.favoriteType, id: Number(form.dataset.favoriteId), action: "toggle" });
+      if (timer === null) {
+        timer = window.setTimeout(flush, 250);
+      }
+    });
+  });
+})();
+
+(function () {
+  "use strict";
+
+  // Live updates start once their element scrolls into view and pause
+  // while the tab is hidden. A stream is used when the server offers one
+  // and has room; otherwise the page polls a cheap JSON endpoint.
+  function live(element, handlers) {
+    var streamUrl = element.dataset.stream;
+    var source = null;
+    var timer = null;
+    var started = false;
+
+    function start() {
+      if (!started || document.hidden || source || timer) {
+        return;
+      }
+      if (streamUrl && window.EventSource) {
+        source = new EventSource(streamUrl);
+        handlers.stream(source);
+        source.addEventListener("error", function () {
+          if (source && source.readyState === EventSource.CLOSED) {
+            // Refused, usually because every stream slot is taken.
+            source = null;
+            streamUrl = null;
+            start();
+          }
+        });
+        return;
+      }
+      handlers.poll();
+      timer = setInterval(handlers.poll, Number(element.dataset.pollInterval) * 1000);
+    }
+
+    function stop() {
+      if (source) {
+        source.close();
+        source = null;
+      }
+      clearInterval(timer);
+      timer = null;
+    }
+
+    document.addEventListener("visibilitychange", function () {
+      if (document.hidden) {
+        stop();
+      } else {
+        start();
+      }
+    });
+    var observer = new IntersectionObserver(function (entries) {
+      if (entries.some(function (entry) { return entry.isIntersecting; })) {
+        observer.disconnect();
+        started = true;
+        start();
+      }
+    });
+    // Hidden notices have no box to intersect, so watch their parent.
+    observer.observe(element.offsetParent ? element : element.parentElement);
+    return stop;
+  }
+
+  function commentElement(comment) {
+    var wrapper = document.createElement("div");
+    wrapper.className = "border rounded p-3 mb-3";
+    wrapper.dataset.commentKey = comment.key;
+    wrapper.dataset.commentId = comment.id;
+    var header = document.createElement("div");
+    header.className = "d-flex justify-content-between align-items-center";
+    var author = document.createElement("strong");
+    author.textContent = comment.username;
+    var date = document.createElement("small");
+    date.className = "text-muted";
+    date.textContent = comment.created_at;
+    var body = document.createElement("p");
+    body.className = "mb-0";
+    body.textContent = comment.body;
+    header.appendChild(author);
+    header.appendChild(date);
+    wrapper.appendChild(header);
+    wrapper.appendChild(body);
+    return wrapper;
+  }
+
+  document.querySelectorAll("[data-comment-poll]").forEach(function (container) {
+    var after = 0;
+    container.querySelectorAll("[data-comment-id]").forEach(function (element) {
+      after = Math.max(after, Number(element.dataset.commentId) || 0);
+    });
+    container.dataset.stream = container.dataset.commentStream || "";
+
+    function add(comment) {
+      after = Math.max(after, comment.id);
+      if (container.querySelector('[data-comment-key="' + comment.key + '"]')) {
+        return;
+      }
+      var empty = container.querySelector("[data-comment-empty]");
+      if (empty) {
+        empty.remove();
+      }
+      container.insertBefore(commentElement(comment), container.firstChild);
+    }
+
+    live(container, {
+      stream: function (source) {
+        source.addEventListener("comments", function (event) {
+          add(JSON.parse(event.data));
+        });
+      },
+      poll: function () {
+        fetch(container.dataset.commentPoll + "?after=" + after)
+          .then(function (response) {
+            return response.ok ? response.json() : { comments: [] };
+          })
+          .then(function (data) {
+            data.comments.forEach(add);
+          })
+          .catch(function () {});
+      },
+    });
+  });
+
+  document.querySelectorAll("[data-catalog-poll]").forEach(function (notice) {
+    var seen = null;
+    var stop = null;
+    notice.dataset.stream = notice.dataset.catalogStream || "";
+
+    function changed() {
+      notice.classList.remove("d-none");
+      stop();
+    }
+
+    stop = live(notice, {
+      stream: function (source) {
+        source.addEventListener("catalog", changed);
+      },
+      poll: function () {
+        fetch(notice.dataset.catalogPoll)
+          .then(function (response) {
+            return response.ok ? response.json() : null;
+          })
+          .then(function (data) {
+            if (!data) {
+              return;
+            }
+            if (seen !== null && data.changed_at > seen) {
+              changed();
+            }
+            seen = seen === null ? data.changed_at : seen;
+          })
+          .catch(function () {});
+      },
+    });
+  });
+})();
+
+(function () {
+  "use strict";
+
+  document.querySelectorAll("input[data-autocomplete]").forEach(function (input, position) {
+    var list = document.createElement("datalist");
+    var timer = null;
+    var controller = null;
+    list.id = "autocomplete-" + position;
+    input.setAttribute("list", list.id);
+    input.after(list);
+
+    function suggest() {
+      var query = input.value.trim();
+      if (controller) {
+        controller.abort();
+      }
+      if (!query) {
+        list.replaceChildren();
+        return;
+      }
+      controller = new AbortController();
+      var params = new URLSearchParams({ q: query, kind: input.dataset.autocomplete, limit: 8 });
+      fetch("/api/autocomplete?" + params, { signal: controller.signal })
+        .then(function (response) {
+          return response.ok ? response.json() : { results: [] };
+        })
+        .then(function (data) {
+          list.replaceChildren.apply(list, data.results.map(function (result) {
+            var option = document.createElement("option");
+            option.value = result.label;
+            return option;
+          }));
+        })
+        .catch(function () {});
+    }
+
+    input.addEventListener("input", function () {
+      clearTimeout(timer);
+      timer = setTimeout(suggest, 120);
+    });
+  });
+})();
+
+(function () {
+  "use strict";
+
+  var labels = { username: "Username", email: "Email" };
+
+  document.querySelectorAll("input[data-availability]").forEach(function (input) {
+    var field = input.dataset.availability;
+    var feedback = document.createElement("div");
+    var timer = null;
+    var controller = null;
+    feedback.className = "form-text";
+    input.after(feedback);
+
+    function check() {
+      var value = input.value.trim();
+      if (controller) {
+        controller.abort();
+      }
+      // The field's own saved value (a profile's current username) is
+      // always fine to keep.
+      if (value.length < 3 || value.toLowerCase() === input.defaultValue.toLowerCase()) {
+        feedback.textContent = "";
+        return;
+      }
+      controller = new AbortController();
+      var params = new URLSearchParams();
+      params.set(field, value);
+      fetch("/api/availability?" + params, { signal: controller.signal })
+        .then(function (response) {
+          return response.ok ? response.json() : {};
+        })
+        .then(function (data) {
+          if (!(field in data)) {
+            feedback.textContent = "";
+            return;
+          }
+          feedback.textContent = data[field]
+            ? labels[field] + " is available."
+            : labels[field] + " is already taken.";
+          feedback.className = data[field] ? "form-text text-success" : "form-text text-danger";
+        })
+        .catch(function () {});
+    }
+
+    input.addEventListener("input", function () {
+      clearTimeout(timer);
+      timer = setTimeout(check, 250);
+    });
+  });
+})();
@@ -0,0 +1,296 @@
+import glob
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timezone
+from email.utils import format_datetime
+from xml.sax.saxutils import escape
+
+from flask import abort, current_app, send_file, url_for
+from sqlalchemy import func, select
+
+from .extensions import db
+from .models import Album, Band, Comment, Event, User
+from .pubsub import pubsub
+
+
+SITEMAP_KINDS = {
+    "band": (Band, "public.band_detail", "band_id"),
+    "album": (Album, "public.album_detail", "album_id"),
+    "event": (Event, "public.event_detail", "event_id"),
+}
+FEED_FORMATS = {"atom": "application/atom+xml", "rss": "application/rss+xml"}
+
+_lock = threading.Lock()
+_invalidated = {}
+
+
+def init_syndication():
+    pubsub.listen("catalog", _on_catalog_change)
+
+
+def sitemap_index():
+    return _serve("sitemap-index", "xml", "application/xml", None, _sitemap_index)
+
+
+def sitemap(kind, shard):
+    # Shards past the last id would only be empty files on disk; refusing
+    # them keeps made-up shard numbers from filling the cache directory.
+    last = db.session.scalar(select(func.max(SITEMAP_KINDS[kind][0].id)))
+    if last is None or shard > _shard(last):
+        abort(404)
+    return _serve(
+        f"sitemap-{kind}-{shard}", "xml", "application/xml", None, lambda: _sitemap(kind, shard)
+    )
+
+
+def albums_feed(fmt):
+    return _serve("albums", fmt, FEED_FORMATS[fmt], None, lambda: _feed(fmt, *_albums()))
+
+
+def events_feed(fmt):
+    # Yesterday's events drop out at midnight without any catalog change.
+    today = date.today()
+    return _serve(
+        "events", fmt, FEED_FORMATS[fmt], today.isoformat(), lambda: _feed(fmt, *_events(today))
+    )
+
+
+def band_comments_feed(band, fmt):
+    # Comments are hidden and archived without a catalog message, so the
+    # file is keyed on what is visible instead.
+    visible = (
+        select(func.count(Comment.id), func.max(Comment.id))
+        .where(Comment.target_type == "band", Comment.target_id == band.id)
+        .where(Comment.is_hidden.is_(False))
+    )
+    count, last = db.session.execute(visible).one()
+    return _serve(
+        f"band-{band.id}-comments",
+        fmt,
+        FEED_FORMATS[fmt],
+        f"{count}-{last or 0}",
+        lambda: _feed(fmt, *_band_comments(band)),
+    )
+
+
+def _directory():
+    directory = current_app.config["SYNDICATION_CACHE_DIR"] or os.path.join(
+        current_app.instance_path, "syndication"
+    )
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _files(directory, prefix):
+    # Prefixes never contain a dot, so "<prefix>.*" only ever matches
+    # "<prefix>.<extension>" and "<prefix>.<stamp>.<extension>", never the
+    # files of a longer prefix such as a sitemap shard.
+    return glob.glob(os.path.join(directory, f"{glob.escape(prefix)}.*"))
+
+
+def _serve(prefix, extension, mimetype, stamp, generate):
+    directory = _directory()
+    name = f"{prefix}.{stamp}.{extension}" if stamp else f"{prefix}.{extension}"
+    path = os.path.join(directory, name)
+    started = time.time()
+    if not os.path.exists(path):
+        handle, temporary = tempfile.mkstemp(dir=directory, prefix=".syndication-")
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as output:
+                for chunk in generate():
+                    output.write(chunk)
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        for old in _files(directory, prefix):
+            if old != path and old.endswith(f".{extension}"):
+                _remove(old)
+    response = send_file(path, mimetype=mimetype, conditional=True, max_age=300)
+    # A change committed while this file was written may not be in it; this
+    # request still gets it, but the next one builds it again.
+    if _invalidated.get(prefix, 0) >= started:
+        _remove(path)
+    return response
+
+
+def _invalidate(*prefixes):
+    now = time.time()
+    with _lock:
+        _invalidated.update(dict.fromkeys(prefixes, now))
+    directory = _directory()
+    for prefix in prefixes:
+        for path in _files(directory, prefix):
+            _remove(path)
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _on_catalog_change(message):
+    kind, entity_id = message["kind"], message["id"]
+    prefixes = [f"sitemap-{kind}-{_shard(entity_id)}"]
+    if message["action"] != "updated":
+        prefixes.append("sitemap-index")
+    if kind == "album":
+        prefixes.append("albums")
+    elif kind == "event":
+        prefixes.append("events")
+    else:
+        # Album entries and comment feed titles carry the band's name.
+        prefixes += ["albums", f"band-{entity_id}-comments"]
+    _invalidate(*prefixes)
+
+
+def _shard(entity_id):
+    return (entity_id - 1) // current_app.config["SITEMAP_SHARD_SIZE"]
+
+
+def _sitemap_index():
+    size = current_app.config["SITEMAP_SHARD_SIZE"]
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for kind, (model, _, _) in SITEMAP_KINDS.items():
+        shard = (model.id - 1) // size
+        rows = db.session.execute(
+            select(shard, func.max(model.created_at)).group_by(shard).order_by(shard)
+        )
+        for number, updated in rows:
+            loc = url_for("public.sitemap", kind=kind, shard=int(number), _external=True)
+            yield f"<sitemap><loc>{escape(loc)}</loc>{_lastmod(updated)}</sitemap>\n"
+    yield "</sitemapindex>\n"
+
+
+def _sitemap(kind, shard):
+    model, endpoint, argument = SITEMAP_KINDS[kind]
+    config = current_app.config
+    last = shard * config["SITEMAP_SHARD_SIZE"]
+    end = last + config["SITEMAP_SHARD_SIZE"]
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    # Keyset batches over the primary key keep memory flat however large
+    # the shard is.
+    while True:
+        rows = db.session.execute(
+            select(model.id, model.created_at)
+            .where(model.id > last, model.id <= end)
+            .order_by(model.id)
+            .limit(config["SITEMAP_BATCH_SIZE"])
+        ).all()
+        for entity_id, updated in rows:
+            loc = url_for(endpoint, **{argument: entity_id}, _external=True)
+            yield f"<url><loc>{escape(loc)}</loc>{_lastmod(updated)}</url>\n"
+        if len(rows) < config["SITEMAP_BATCH_SIZE"]:
+            break
+        last = rows[-1].id
+    yield "</urlset>\n"
+
+
+def _lastmod(updated):
+    return f"<lastmod>{updated.date().isoformat()}</lastmod>" if updated else ""
+
+
+def _albums():
+    rows = db.session.execute(
+        select(Album.id, Album.title, Album.description, Album.created_at, Band.name)
+        .join(Band, Band.id == Album.band_id)
+        .order_by(Album.created_at.desc(), Album.id.desc())
+        .limit(current_app.config["SYNDICATION_FEED_SIZE"])
+        .execution_options(yield_per=100)
+    )
+    entries = (
+        {
+            "link": url_for("public.album_detail", album_id=row.id, _external=True),
+            "title": f"{row.title} by {row.name}",
+            "summary": row.description,
+            "updated": row.created_at,
+        }
+        for row in rows
+    )
+    return "New albums", url_for("public.albums", _external=True), entries
+
+
+def _events(today):
+    rows = db.session.execute(
+        select(Event)
+        .where(Event.event_date >= today)
+        .order_by(Event.event_date.asc(), Event.id.asc())
+        .limit(current_app.config["SYNDICATION_FEED_SIZE"])
+        .execution_options(yield_per=100)
+    ).scalars()
+    entries = (
+        {
+            "link": url_for("public.event_detail", event_id=event.id, _external=True),
+            "title": f"{event.title}, {event.city}, {event.event_date:%b %d, %Y}",
+            "summary": event.description,
+            "updated": event.created_at,
+        }
+        for event in rows
+    )
+    return "Upcoming events", url_for("public.events", _external=True), entries
+
+
+def _band_comments(band):
+    link = url_for("public.band_detail", band_id=band.id, _external=True)
+    rows = db.session.execute(
+        select(Comment.id, Comment.body, Comment.created_at, User.username)
+        .join(User, User.id == Comment.user_id)
+        .where(Comment.target_type == "band", Comment.target_id == band.id)
+        .where(Comment.is_hidden.is_(False))
+        .order_by(Comment.id.desc())
+        .limit(current_app.config["SYNDICATION_FEED_SIZE"])
+        .execution_options(yield_per=100)
+    )
+    entries = (
+        {
+            "link": f"{link}#comment-{row.id}",
+            "title": f"{row.username} on {band.name}",
+            "summary": row.body,
+            "updated": row.created_at,
+            "author": row.username,
+        }
+        for row in rows
+    )
+    return f"Comments on {band.name}", link, entries
+
+
+def _feed(fmt, title, link, entries):
+    now = datetime.utcnow()
+    if fmt == "atom":
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+        yield f"<title>{escape(title)} | Rock Music Hub</title>\n"
+        yield f'<link href="{escape(link)}"/>\n<id>{escape(link)}</id>\n'
+        yield f"<updated>{now:%Y-%m-%dT%H:%M:%SZ}</updated>\n"
+        for entry in entries:
+            updated = entry["updated"] or now
+            author = escape(entry.get("author", "Rock Music Hub"))
+            yield (
+                f'<entry><title>{escape(entry["title"])}</title>'
+                f'<link href="{escape(entry["link"])}"/><id>{escape(entry["link"])}</id>'
+                f"<updated>{updated:%Y-%m-%dT%H:%M:%SZ}</updated>"
+                f"<author><name>{author}</name></author>"
+                f'<summary>{escape(entry["summary"])}</summary></entry>\n'
+            )
+        yield "</feed>\n"
+    else:
+        yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+        yield '<rss version="2.0"><channel>\n'
+        yield f"<title>{escape(title)} | Rock Music Hub</title>\n"
+        yield f"<link>{escape(link)}</link>\n<description>{escape(title)}</description>\n"
+        for entry in entries:
+            updated = (entry["updated"] or now).replace(tzinfo=timezone.utc)
+            yield (
+                f'<item><title>{escape(entry["title"])}</title>'
+                f'<link>{escape(entry["link"])}</link><guid>{escape(entry["link"])}</guid>'
+                f"<pubDate>{format_datetime(updated, usegmt=True)}</pubDate>"
+                f'<description>{escape(entry["summary"])}</description></item>\n'
+            )
+        yield "</channel></rss>\n"
@@ -0,0 +1,76 @@
+import os
+import queue
+import threading
+import time
+
+
+class TaskRunner:
+    def __init__(self):
+        self.app = None
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._periodic = []
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["tasks"] = self
+        app.before_request(self._ensure_started)
+
+    @property
+    def enabled(self):
+        return self.app is not None and self.app.config["TASKS_ENABLED"]
+
+    def submit(self, func, *args, key=None):
+        if not self.enabled:
+            func(*args)
+            return
+        with self._lock:
+            if key is not None:
+                if key in self._pending:
+                    return
+                self._pending.add(key)
+        self._ensure_started()
+        self._queue.put((func, args, key))
+
+    def every(self, seconds, func):
+        if any(job[1] == func for job in self._periodic):
+            return
+        self._periodic.append([seconds, func, time.monotonic() + seconds])
+
+    def _ensure_started(self):
+        # Workers forked after create_app() (gunicorn --preload) do not
+        # inherit the thread, so start one per process on first use.
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._loop, name="tasks", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            now = time.monotonic()
+            timeout = min((job[2] for job in self._periodic), default=now + 60) - now
+            try:
+                func, args, key = self._queue.get(timeout=max(timeout, 0))
+            except queue.Empty:
+                pass
+            else:
+                with self._lock:
+                    self._pending.discard(key)
+                self._run(func, args)
+            now = time.monotonic()
+            for job in self._periodic:
+                if job[2] <= now:
+                    job[2] = now + job[0]
+                    self._run(job[1], ())
+
+    def _run(self, func, args):
+        with self.app.app_context():
+            try:
+                func(*args)
+            except Exception:
+                self.app.logger.exception("Background task %s failed", func.__name__)
@@ -0,0 +1,100 @@
+import time
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import and_, delete, exists, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from .extensions import cache, db, tasks
+from .models import Album, Band, TrendingEpoch, TrendingScore
+
+
+KINDS = {Band: "band", Album: "album"}
+
+
+def init_trending(app):
+    tasks.every(app.config["TRENDING_RENORMALIZE_INTERVAL"], renormalize)
+    with app.app_context():
+        if db.session.get(TrendingEpoch, 1) is None:
+            db.session.add(TrendingEpoch(id=1, started_at=time.time()))
+            db.session.commit()
+
+
+def record(*interactions):
+    # Scores never decay in place. Each interaction adds its weight scaled
+    # up by how far the clock has moved past the epoch, which ranks the same
+    # as decaying every older score; renormalize() rescales to a new epoch.
+    if not interactions:
+        return
+    config = current_app.config
+    epoch = db.session.scalar(select(TrendingEpoch.started_at).where(TrendingEpoch.id == 1))
+    boost = 2 ** ((time.time() - epoch) / config["TRENDING_HALF_LIFE"])
+    totals = Counter()
+    for kind, entity_id, signal in interactions:
+        totals[(kind, entity_id)] += config["TRENDING_WEIGHTS"][signal] * boost
+    dialect = postgresql if db.engine.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(TrendingScore)
+    statement = statement.on_conflict_do_update(
+        index_elements=[TrendingScore.kind, TrendingScore.entity_id],
+        set_={"score": TrendingScore.score + statement.excluded.score},
+    )
+    db.session.execute(
+        statement,
+        [
+            {"kind": kind, "entity_id": entity_id, "score": score}
+            for (kind, entity_id), score in totals.items()
+        ],
+    )
+
+
+def top_query(model, limit):
+    return (
+        select(model)
+        .join(
+            TrendingScore,
+            and_(TrendingScore.kind == KINDS[model], TrendingScore.entity_id == model.id),
+        )
+        .order_by(TrendingScore.score.desc())
+        .limit(limit)
+    )
+
+
+def top(model, limit):
+    return db.session.scalars(top_query(model, limit)).all()
+
+
+def top_ids(kind, limit):
+    def load():
+        return db.session.scalars(
+            select(TrendingScore.entity_id)
+            .where(TrendingScore.kind == kind)
+            .order_by(TrendingScore.score.desc())
+            .limit(limit)
+        ).all()
+
+    ttl = current_app.config["TRENDING_CACHE_TTL"]
+    return cache.get_or_set(("trending", kind, limit), load, ttl)
+
+
+def renormalize():
+    config = current_app.config
+    now = time.time()
+    epoch = db.session.get(TrendingEpoch, 1)
+    factor = 2 ** (-(now - epoch.started_at) / config["TRENDING_HALF_LIFE"])
+    db.session.execute(update(TrendingScore).values(score=TrendingScore.score * factor))
+    db.session.execute(
+        delete(TrendingScore).where(
+            or_(
+                TrendingScore.score < config["TRENDING_MIN_SCORE"],
+                *(
+                    and_(
+                        TrendingScore.kind == kind,
+                        ~exists().where(model.id == TrendingScore.entity_id),
+                    )
+                    for model, kind in KINDS.items()
+                ),
+            )
+        )
+    )
+    epoch.started_at = now
+    db.session.commit()
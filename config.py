@@ -11,6 +11,76 @@ class Config:
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     REMEMBER_COOKIE_DURATION = timedelta(days=7)
+    SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "sqlite")
+    SESSION_SQLITE_PATH = os.environ.get("SESSION_SQLITE_PATH")
+    SESSION_SWEEP_INTERVAL = 3600
+    CATALOG_SNAPSHOT = os.environ.get("CATALOG_SNAPSHOT")
     ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL", "admin@example.com")
     ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "Admin123!")
     ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
+    COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 500))
+    COMPRESS_LEVEL = 6
+    COMPRESS_BR_QUALITY = 4
+    STREAM_BUFFER_SIZE = 4096
+    TASKS_ENABLED = os.environ.get("TASKS_ENABLED", "1") == "1"
+    ASGI_WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", 16))
+    USER_FILTER_CAPACITY = 100000
+    USER_FILTER_ERROR_RATE = 0.01
+    USER_FILTER_REBUILD_INTERVAL = 6 * 3600
+    AVAILABILITY_RATE = (30, 20)
+    AVAILABILITY_MAX_CLIENTS = 10000
+    SYNDICATION_CACHE_DIR = os.environ.get("SYNDICATION_CACHE_DIR")
+    SYNDICATION_FEED_SIZE = 50
+    SITEMAP_SHARD_SIZE = 10000
+    SITEMAP_BATCH_SIZE = 1000
+    OVERLOAD_ENABLED = os.environ.get("OVERLOAD_ENABLED", "1") == "1"
+    OVERLOAD_LIMITS = {"critical": 16, "standard": 24, "expensive": 4}
+    OVERLOAD_QUEUE_TIMEOUT = {"critical": 5.0, "standard": 1.0, "expensive": 0.25}
+    OVERLOAD_DB_LATENCY = float(os.environ.get("OVERLOAD_DB_LATENCY", 0.25))
+    OVERLOAD_LATENCY_WEIGHT = 0.2
+    OVERLOAD_HALF_LIFE = 10
+    OVERLOAD_RETRY_AFTER = 5
+    OVERLOAD_STALE_TTL = 3600
+    OVERLOAD_STALE_BYTES = 16 * 1024 * 1024
+    DB_FAULT_DELAY = float(os.environ.get("DB_FAULT_DELAY", 0))
+    PLAYLIST_RANK_MAX_LENGTH = 12
+    PLAYLIST_REBALANCE_INTERVAL = 3600
+    CACHE_DEFAULT_TTL = 300
+    CACHE_MAX_ENTRIES = 10000
+    PROFILE_PAGE_SIZE = 10
+    PROFILE_PLAYLIST_ITEMS = 10
+    FEED_PAGE_SIZE = 10
+    FEED_MAX_ITEMS = 100
+    FEED_STREAM_DEPTH = 20
+    FEED_CACHE_TTL = 60
+    TRENDING_HALF_LIFE = 3 * 86400
+    TRENDING_WEIGHTS = {"favorite": 3.0, "playlist": 2.0, "comment": 1.0}
+    TRENDING_MIN_SCORE = 0.05
+    TRENDING_RENORMALIZE_INTERVAL = 6 * 3600
+    TRENDING_CACHE_TTL = 60
+    # Comments are buffered per process, so a poster only sees their own
+    # unflushed comment when the redirect lands on the same worker.
+    COMMENT_FLUSH_INTERVAL = 0.3
+    COMMENT_FLUSH_MAX_ATTEMPTS = 20
+    COMMENT_USER_RATE = (5, 6)
+    COMMENT_TARGET_RATE = (3, 2)
+    COMMENT_DUPLICATE_WINDOW = 600
+    COMMENT_RETENTION_DAYS = int(os.environ.get("COMMENT_RETENTION_DAYS", 1825))
+    COMMENT_ARCHIVE_INTERVAL = 86400
+    COMMENT_ARCHIVE_BATCH_SIZE = 500
+    COMMENT_ARCHIVE_MAX_BATCHES = 20
+    PUBSUB_BACKEND = os.environ.get("PUBSUB_BACKEND", "local")
+    PUBSUB_POLL_INTERVAL = 1
+    PUBSUB_RETENTION = 3600
+    PUBSUB_QUEUE_SIZE = 100
+    # Threads (gthread) or connections (gevent) each worker serves; streams
+    # may take up to half of them. Sync workers leave streams off.
+    WORKER_THREADS = int(os.environ.get("WORKER_THREADS", 1))
+    SSE_MAX_CONNECTIONS = int(os.environ.get("SSE_MAX_CONNECTIONS", WORKER_THREADS // 2))
+    SSE_MAX_CONNECTIONS_PER_CLIENT = 2
+    SSE_HEARTBEAT_INTERVAL = 10
+    SSE_MAX_DURATION = 20
+    LIVE_POLL_INTERVAL = 20
+    CATALOG_POLL_INTERVAL = 60
+    EVENTS_PAGE_SIZE = 30
+    EVENTS_DEFAULT_RADIUS_KM = 250
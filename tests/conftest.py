@@ -0,0 +1,26 @@
+import pytest
+
+from app import create_app
+from app.extensions import cache
+from config import Config
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        SESSION_BACKEND = "memory"
+        SYNDICATION_CACHE_DIR = str(tmp_path / "syndication")
+        TASKS_ENABLED = False
+        WTF_CSRF_ENABLED = False
+
+    # Extensions are module-level, so nothing cached may outlive a test.
+    cache.clear()
+    return create_app(TestConfig)
+
+
+@pytest.fixture
+def admin_client(app):
+    client = app.test_client()
+    client.post("/auth/login", data={"email": "admin@example.com", "password": "Admin123!"})
+    return client
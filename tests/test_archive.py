@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from app import archive
+from app.extensions import db
+from app.models import Comment, CommentArchive
+
+
+def add_comment(body, **values):
+    comment = Comment(user_id=1, target_type="band", target_id=1, body=body, **values)
+    db.session.add(comment)
+    db.session.commit()
+    return comment
+
+
+def restore_all():
+    for batch in CommentArchive.query.all():
+        archive.restore(batch)
+
+
+def test_restored_comments_are_only_exempt_from_the_reason_they_were_archived_for(app):
+    old = datetime.utcnow() - timedelta(days=app.config["COMMENT_RETENTION_DAYS"] + 1)
+    with app.app_context():
+        add_comment("Old news", created_at=old)
+        assert archive.archive_comments()["reasons"] == {"expired": 1}
+        restore_all()
+
+        assert archive.archive_comments()["comments"] == 0
+        Comment.query.one().is_hidden = True
+        db.session.commit()
+        assert archive.archive_comments()["reasons"] == {"hidden": 1}
+
+
+def test_comments_without_a_creation_date_are_archived_and_restored(app):
+    with app.app_context():
+        add_comment("Undated", is_hidden=True)
+        db.session.execute(db.update(Comment).values(created_at=None))
+        db.session.commit()
+
+        assert archive.archive_comments()["comments"] == 1
+        batch = CommentArchive.query.one()
+        assert batch.first_created_at is None
+        assert archive.restore(batch) == (1, 0)
+        assert Comment.query.one().created_at is None
+
+
+def test_archive_pages_render_undated_batches(app, admin_client):
+    with app.app_context():
+        add_comment("Undated", is_hidden=True)
+        db.session.execute(db.update(Comment).values(created_at=None))
+        db.session.commit()
+        archive.archive_comments()
+        batch_id = CommentArchive.query.one().id
+
+    assert admin_client.get("/admin/archive").status_code == 200
+    assert admin_client.get(f"/admin/archive/{batch_id}").status_code == 200
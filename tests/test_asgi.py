@@ -0,0 +1,73 @@
+import asyncio
+from urllib.parse import urlsplit
+
+import pytest
+
+from app.asgi import AsyncApp
+
+
+PAGES = [
+    "/",
+    "/bands",
+    "/bands?genre=1&submit=Filter",
+    "/albums",
+    "/albums?decade=1970",
+    "/events",
+    "/bands/1",
+    "/albums/1",
+    "/events/1",
+]
+
+
+@pytest.fixture
+def asgi(app):
+    asgi = AsyncApp(app)
+    yield asgi
+    asgi.executor.shutdown()
+
+
+def call(asgi, path):
+    url = urlsplit(path)
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": url.path,
+        "query_string": url.query.encode(),
+        "headers": [(b"host", b"localhost")],
+        "server": ("localhost", 80),
+        "client": ("127.0.0.1", 50000),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    async def run():
+        await asgi(scope, receive, send)
+        if asgi.engine is not None:
+            await asgi.engine.dispose()
+
+    asyncio.run(run())
+    return messages[0]["status"], b"".join(message.get("body", b"") for message in messages[1:])
+
+
+@pytest.mark.parametrize("path", PAGES)
+def test_async_pages_match_the_wsgi_app(app, asgi, monkeypatch, path):
+    expected = app.test_client().get(path, buffered=True)
+    fallbacks = []
+    monkeypatch.setattr(asgi, "_run_wsgi", lambda *args: fallbacks.append(args))
+
+    status, body = call(asgi, path)
+
+    assert fallbacks == []
+    assert (status, body) == (expected.status_code, expected.data)
+
+
+@pytest.mark.parametrize("path", ["/auth/login", "/bands/999"])
+def test_other_requests_run_the_wsgi_app(app, asgi, path):
+    expected = app.test_client().get(path)
+
+    assert call(asgi, path) == (expected.status_code, expected.data)
@@ -0,0 +1,29 @@
+def favorite_bands(client):
+    return client.post("/api/me/batch", json={}).get_json()["favorite_bands"]
+
+
+def toggles(*band_ids):
+    return {"favorites": [{"type": "band", "id": band_id} for band_id in band_ids]}
+
+
+def test_toggles_apply_in_request_order(admin_client):
+    assert admin_client.post("/api/me/batch", json=toggles(1, 1)).status_code == 200
+    assert favorite_bands(admin_client) == []
+
+    admin_client.post("/api/me/batch", json=toggles(1, 2, 1, 1))
+    assert favorite_bands(admin_client) == [1, 2]
+
+
+def test_conflicting_favorite_actions_are_rejected(admin_client):
+    response = admin_client.post(
+        "/api/me/batch",
+        json={
+            "favorites": [
+                {"type": "band", "id": 1, "action": "add"},
+                {"type": "band", "id": 1, "action": "remove"},
+            ]
+        },
+    )
+
+    assert response.status_code == 400
+    assert favorite_bands(admin_client) == []
@@ -0,0 +1,15 @@
+from app.comments import atexit, ingestor
+from app.extensions import tasks
+
+
+def test_repeated_init_registers_exit_flush_and_job_once(app, monkeypatch):
+    registered = []
+    monkeypatch.setattr(atexit, "register", registered.append)
+    monkeypatch.setattr(ingestor, "app", None)
+    monkeypatch.setattr(tasks, "_periodic", [])
+
+    ingestor.init_app(app)
+    ingestor.init_app(app)
+
+    assert registered == [ingestor._flush_on_exit]
+    assert len(tasks._periodic) == 1
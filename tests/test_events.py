@@ -0,0 +1,53 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from app import event_queries
+from app.extensions import db
+from app.models import Event
+
+
+@pytest.mark.parametrize("query", ["week=0001-01-01", "month=9999-12", "month=0001-01"])
+def test_calendar_rejects_dates_at_the_edge_of_the_range(app, query):
+    response = app.test_client().get(f"/events/calendar?{query}")
+
+    assert response.status_code == 302
+
+
+def test_nearest_matches_a_full_scan_without_reading_every_event(app, monkeypatch):
+    shuffled = random.Random(7)
+    tomorrow = date.today() + timedelta(days=1)
+    with app.app_context():
+        db.session.add_all(
+            Event(
+                title=f"Show {index}",
+                venue="Hall",
+                city="Somewhere",
+                event_date=tomorrow,
+                description="A show.",
+                latitude=51.5 + shuffled.uniform(-5, 5),
+                longitude=-0.1 + shuffled.uniform(-5, 5),
+            )
+            for index in range(2000)
+        )
+        db.session.commit()
+        everything = [
+            (event_queries.distance_km(51.5, -0.1, row.latitude, row.longitude), row.id)
+            for row in Event.query.filter(Event.event_date >= date.today())
+        ]
+        expected = [event_id for _, event_id in sorted(everything)[:10]]
+
+        read = []
+        candidates = event_queries._candidates
+
+        def counted(*args):
+            read.append(len(db.session.execute(candidates(*args)).all()))
+            return candidates(*args)
+
+        monkeypatch.setattr(event_queries, "_candidates", counted)
+        results = event_queries.nearest(51.5, -0.1, radius_km=1000, limit=10)
+
+    assert [found.id for _, found in results] == expected
+    # The full radius covers all 2,000 events.
+    assert sum(read) < 500
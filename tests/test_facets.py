@@ -0,0 +1,56 @@
+from collections import Counter
+
+from sqlalchemy import select
+
+from app import facets
+from app.extensions import db
+from app.models import Album, Band, FacetCount, Genre
+
+
+def stored():
+    return {(row.facet, row.value): row.count for row in db.session.scalars(select(FacetCount))}
+
+
+def recounted():
+    totals = Counter()
+    for facet, (model, attribute, _, _) in facets.FACETS.items():
+        for value in db.session.scalars(select(getattr(model, attribute))):
+            totals[(facet, facets.bucket(facet, value))] += 1
+    return dict(totals)
+
+
+def test_counts_follow_creates_edits_and_cascading_deletes(app):
+    with app.app_context():
+        assert stored() == recounted()
+        band = db.session.get(Band, 1)
+        before = stored()
+
+        genre = Genre(name="Shoegaze")
+        db.session.add(
+            Album(band=band, title="Loveless", release_year=1991, genre=genre, description="-")
+        )
+        db.session.commit()
+        assert stored()[("genre", str(genre.id))] == 1
+        assert stored()[("decade", "1990")] == before.get(("decade", "1990"), 0) + 1
+        assert stored() == recounted()
+
+        band.formed_year = 2021
+        db.session.commit()
+        assert stored()[("formed", "2020")] == 1
+        assert stored() == recounted()
+
+        db.session.delete(band)
+        db.session.commit()
+        assert ("genre", str(genre.id)) not in stored()
+        assert ("formed", "2020") not in stored()
+        assert stored() == recounted()
+
+
+def test_rolled_back_changes_leave_counts_alone(app):
+    with app.app_context():
+        before = stored()
+        db.session.delete(db.session.get(Band, 1))
+        db.session.flush()
+        db.session.rollback()
+
+        assert stored() == before == recounted()
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from app import feed
+from app.extensions import db
+from app.models import Album, Comment, FavoriteAlbum, FavoriteBand
+
+
+def follow(band_id, album_id):
+    db.session.add_all(
+        [FavoriteBand(user_id=1, band_id=band_id), FavoriteAlbum(user_id=1, album_id=album_id)]
+    )
+    db.session.commit()
+
+
+def test_feed_merges_every_stream_newest_first(app):
+    with app.app_context():
+        follow(1, 5)
+        start = datetime(2030, 1, 1)
+        for album in Album.query.filter_by(band_id=1):
+            album.created_at = start + timedelta(hours=album.id)
+        db.session.add_all(
+            Comment(
+                user_id=1,
+                target_type="album",
+                target_id=5,
+                body=f"Comment {number}",
+                created_at=start + timedelta(hours=number, minutes=30),
+            )
+            for number in range(3)
+        )
+        db.session.commit()
+
+        items = feed.build(1)
+
+    keys = [feed.sort_key(item) for item in items]
+    assert keys == sorted(keys, reverse=True)
+    assert {item.kind for item in items} >= {"album", "comment"}
+    assert items[0].at >= start
+
+
+def test_undated_rows_are_left_out_of_the_feed(app, admin_client):
+    with app.app_context():
+        follow(1, 5)
+        db.session.execute(db.update(Album).values(created_at=None))
+        db.session.commit()
+        items = feed.build(1)
+
+    assert all(item.at is not None for item in items)
+    assert admin_client.get("/me").status_code == 200
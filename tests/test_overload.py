@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from app.overload import StalePages, _state, stale_pages
+
+
+@pytest.fixture(autouse=True)
+def overload(app):
+    app.config["OVERLOAD_DB_LATENCY"] = 0.05
+    app.config["OVERLOAD_LATENCY_WEIGHT"] = 1
+    _state["latency"].clear()
+    stale_pages.clear()
+    yield
+    _state["latency"].clear()
+    stale_pages.clear()
+
+
+def get(app, path):
+    # Pages stream, and only one read to the end is kept.
+    return app.test_client().get(path, buffered=True)
+
+
+def test_expensive_pages_are_shed_when_the_database_slows(app, admin_client):
+    assert admin_client.get("/me").status_code == 200
+
+    app.config["DB_FAULT_DELAY"] = 0.1
+    assert admin_client.get("/me").status_code == 200
+    response = admin_client.get("/me")
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(app.config["OVERLOAD_RETRY_AFTER"])
+
+
+def test_public_pages_are_served_stale_while_one_request_revalidates(app):
+    fresh = get(app, "/bands/1")
+    assert fresh.status_code == 200
+
+    app.config["DB_FAULT_DELAY"] = 0.1
+    assert get(app, "/bands/1").status_code == 200
+    revalidating = threading.Thread(target=get, args=(app, "/bands/1"))
+    revalidating.start()
+    time.sleep(0.05)
+    response = get(app, "/bands/1")
+    revalidating.join()
+
+    assert response.status_code == 200
+    assert "Age" in response.headers
+    assert response.data == fresh.data
+
+
+def test_pages_with_unknown_arguments_are_not_kept(app):
+    get(app, "/bands/1?utm_source=feed")
+    get(app, "/bands?query=zeppelin&submit=Filter")
+
+    assert len(stale_pages._pages) == 1
+
+
+def test_stale_pages_stay_within_their_byte_budget():
+    pages = StalePages()
+    pages.max_bytes = 10
+    pages.set("a", b"12345", "text/html")
+    pages.set("b", b"12345", "text/html")
+    pages.get("a")
+    pages.set("c", b"123", "text/html")
+
+    assert pages.get("a") is not None
+    assert pages.get("b") is None
+    assert pages.size == 8
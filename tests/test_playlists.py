@@ -0,0 +1,56 @@
+from sqlalchemy import select
+
+from app.extensions import db
+from app.models import Playlist, PlaylistItem
+from app.playlists import add_item, move_item, ordered_items
+
+
+def make_playlist(*ranks):
+    playlist = Playlist(user_id=1, name="Road trip")
+    db.session.add(playlist)
+    db.session.flush()
+    items = [
+        PlaylistItem(playlist_id=playlist.id, album_id=album_id, rank=rank)
+        for album_id, rank in enumerate(ranks, start=1)
+    ]
+    db.session.add_all(items)
+    db.session.commit()
+    return playlist, items
+
+
+def album_order(playlist):
+    return [item.album_id for item, _, _ in ordered_items(playlist.id)]
+
+
+def test_moving_after_an_item_that_shares_its_rank_rebalances(app):
+    with app.app_context():
+        # Two concurrent appends can leave neighbours with the same rank.
+        playlist, (first, second, third) = make_playlist("i", "i", "r")
+        assert move_item(third, first.id)
+        db.session.commit()
+
+        assert album_order(playlist) == [1, 3, 2]
+        ranks = db.session.scalars(
+            select(PlaylistItem.rank).where(PlaylistItem.playlist_id == playlist.id)
+        ).all()
+        assert len(set(ranks)) == 3
+
+
+def test_long_ranks_are_only_rebalanced_after_the_callers_commit(app):
+    app.config["PLAYLIST_RANK_MAX_LENGTH"] = 1
+    with app.app_context():
+        playlist, (first, second) = make_playlist("i", "j")
+        add_item(playlist.id, 3, position=2)
+        add_item(playlist.id, 4, position=2)
+        db.session.rollback()
+
+        assert album_order(playlist) == [1, 2]
+        assert db.session.scalars(select(PlaylistItem.rank)).all() == ["i", "j"]
+
+        add_item(playlist.id, 3, position=2)
+        add_item(playlist.id, 4, position=2)
+        db.session.commit()
+
+        assert album_order(playlist) == [1, 4, 3, 2]
+        ranks = db.session.scalars(select(PlaylistItem.rank)).all()
+        assert max(len(rank) for rank in ranks) == 1
@@ -0,0 +1,39 @@
+from app.extensions import db
+from app.models import Band
+from app.search_index import index
+
+
+def labels(client, query):
+    response = client.get("/api/autocomplete", query_string={"q": query})
+    assert response.status_code == 200
+    return [(result["kind"], result["label"]) for result in response.get_json()["results"]]
+
+
+def test_any_word_of_a_label_is_a_prefix(app):
+    client = app.test_client()
+
+    assert labels(client, "led") == [("band", "Led Zeppelin"), ("album", "Led Zeppelin IV")]
+    assert labels(client, "monk") == [("band", "Arctic Monkeys")]
+    assert labels(client, "  ZÉP ") == labels(client, "zep")
+    assert labels(client, "onkeys") == []
+
+
+def test_kind_and_limit_narrow_the_results(app):
+    client = app.test_client()
+
+    response = client.get("/api/autocomplete?q=led&kind=album")
+    assert [result["label"] for result in response.get_json()["results"]] == ["Led Zeppelin IV"]
+    response = client.get("/api/autocomplete?q=rock&limit=2")
+    assert len(response.get_json()["results"]) == 2
+    assert client.get("/api/autocomplete?q=led&kind=label").status_code == 400
+
+
+def test_refresh_replaces_an_edited_label(app):
+    client = app.test_client()
+    with app.app_context():
+        db.session.get(Band, 7).name = "Monkey Business"
+        db.session.commit()
+        index.refresh("band", 7)
+
+    assert labels(client, "arctic") == []
+    assert labels(client, "monk") == [("band", "Monkey Business")]
@@ -0,0 +1,43 @@
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/bands/1", "/albums/1", "/events/1"])
+def test_anonymous_detail_pages_create_no_session(app, path):
+    app.config["WTF_CSRF_ENABLED"] = True
+    client = app.test_client()
+
+    response = client.get(path, buffered=True)
+
+    assert response.status_code == 200
+    assert "Set-Cookie" not in response.headers
+    assert not app.session_interface.store._records
+
+
+def test_session_is_read_only_when_the_request_uses_it(app, admin_client, monkeypatch):
+    store = app.session_interface.store
+    loads = []
+    load = store.load
+    monkeypatch.setattr(store, "load", lambda sid: loads.append(sid) or load(sid))
+
+    assert admin_client.get("/api/autocomplete?q=zep").status_code == 200
+    assert loads == []
+
+    assert admin_client.get("/me").status_code == 200
+    assert len(loads) == 1
+
+
+def test_sign_in_and_sign_out_replace_the_session_id(app):
+    store = app.session_interface.store
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["planted"] = True
+    (planted,) = store._records
+
+    client.post("/auth/login", data={"email": "admin@example.com", "password": "Admin123!"})
+    (signed_in,) = store._records
+    assert signed_in != planted
+    assert client.get("/me").status_code == 200
+
+    client.get("/auth/logout")
+    assert signed_in not in store._records
+    assert client.get("/me").status_code == 302
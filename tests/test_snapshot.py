@@ -0,0 +1,46 @@
+import pytest
+
+from app import facets, snapshot
+from app.extensions import db
+from app.models import Band
+
+
+@pytest.fixture
+def catalog(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "_state", {"path": None, "snapshot": None})
+    app.config["CATALOG_SNAPSHOT"] = str(tmp_path / "catalog.snap")
+    with app.app_context():
+        snapshot.init_snapshot(app)
+    return snapshot.current()
+
+
+def pages(app, *paths):
+    client = app.test_client()
+    return [client.get(path, buffered=True).data for path in paths]
+
+
+PATHS = ("/", "/bands", "/albums", "/bands/1", "/albums/1", "/events/1")
+
+
+def test_snapshot_pages_match_the_database(app, catalog, monkeypatch):
+    assert catalog is not None
+    from_snapshot = pages(app, *PATHS)
+    monkeypatch.setitem(snapshot._state, "snapshot", None)
+
+    assert from_snapshot == pages(app, *PATHS)
+
+
+def test_commits_build_and_swap_in_a_new_snapshot(app, catalog):
+    with app.app_context():
+        assert catalog.facet_counts(*facets.FACETS) == {
+            name: [tuple(entry) for entry in entries]
+            for name, entries in facets.counts(*facets.FACETS).items()
+        }
+        db.session.get(Band, 1).name = "The Stones"
+        db.session.commit()
+
+    current = snapshot.current()
+    assert current.version > catalog.version
+    assert current.band(1).name == "The Stones"
+    assert catalog.band(1).name != "The Stones"
+    assert b"The Stones" in pages(app, "/bands/1")[0]
@@ -0,0 +1,21 @@
+import os
+
+
+def test_sitemap_shards_past_the_last_id_are_not_built(app):
+    client = app.test_client()
+
+    assert client.get("/sitemaps/band-0.xml").status_code == 200
+    for shard in range(1000, 1005):
+        assert client.get(f"/sitemaps/band-{shard}.xml").status_code == 404
+    assert sorted(os.listdir(app.config["SYNDICATION_CACHE_DIR"])) == ["sitemap-band-0.xml"]
+
+
+def test_rebuilding_the_index_keeps_the_shards(app):
+    client = app.test_client()
+    client.get("/sitemaps/band-0.xml")
+    client.get("/sitemap.xml")
+
+    assert sorted(os.listdir(app.config["SYNDICATION_CACHE_DIR"])) == [
+        "sitemap-band-0.xml",
+        "sitemap-index.xml",
+    ]
@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from app import trending
+from app.extensions import db
+from app.models import Band, TrendingEpoch, TrendingScore
+
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    with app.app_context():
+        clock = SimpleNamespace(now=db.session.get(TrendingEpoch, 1).started_at)
+    clock.time = lambda: clock.now
+    monkeypatch.setattr(trending, "time", clock)
+    return clock
+
+
+def scores():
+    rows = db.session.execute(select(TrendingScore.entity_id, TrendingScore.score))
+    return dict(rows.all())
+
+
+def test_recent_interactions_outrank_older_heavier_ones(app, clock):
+    half_life = app.config["TRENDING_HALF_LIFE"]
+    with app.app_context():
+        trending.record(*[("band", 1, "favorite")] * 3, ("band", 4, "comment"))
+        clock.now += 2 * half_life
+        trending.record(("band", 2, "favorite"), *[("band", 3, "comment")] * 2)
+        db.session.commit()
+        assert trending.top_ids("band", 10) == [2, 1, 3, 4]
+
+        clock.now += 3 * half_life
+        trending.renormalize()
+        assert scores() == pytest.approx({1: 9 / 32, 2: 12 / 32, 3: 8 / 32})
+
+        trending.record(("band", 3, "comment"))
+        db.session.commit()
+        assert [band.id for band in trending.top(Band, 10)] == [3, 2, 1]